@@ -14,6 +14,7 @@
 
 #include <windows.h>
 #include <winsock2.h>
+#include <afunix.h>
 
 #include <stdio.h>
 #include <stdlib.h>
@@ -74,9 +75,49 @@ enum Commands : unsigned char {
 	DISABLE_REFLECTION_KEY = 22,
 	ENABLE_REFLECTION_KEY = 23,
 	QUERY_REFLECTION_KEY = 24,
-	GET_FILE_INFO = 25
+	GET_FILE_INFO = 25,
+	DUMP_TREE = 26,
+	ENUM_KEYS = 27,
+	ENUM_VALUES = 28,
+	GET_FILE_INFO_ALL = 29
 };
 
+// Record types sent by DUMP_TREE, must match wslapi.py
+
+enum DumpRecords : unsigned char {
+	DUMP_END = 0,
+	DUMP_KEY = 1,
+	DUMP_VALUE = 2
+};
+
+// Flags for ENUM_KEYS, must match wslapi.py
+#define ENUM_KEYS_WITH_TIMES 1
+
+// Size in WCHARs of the path buffer used by DUMP_TREE
+#define DUMP_PATH_SIZE 32768
+
+// Size of the largest reply frame, longer replies are split into
+// several frames. Must match wslapi.py
+#define REPLY_FRAME_SIZE 65536
+
+// Set in the frame length if more frames of the same reply follow
+#define REPLY_MORE_FRAMES 0x80000000U
+
+// Maximum number of connections, each one is served by its own thread
+#define MAX_CONNECTIONS 64
+
+// Standard input and output, used instead of the socket by the thread that
+// serves them when started with -s
+static thread_local HANDLE g_hPipeInput = nullptr;
+static thread_local HANDLE g_hPipeOutput = nullptr;
+
+// Number of connections still being served, main() holds one while it
+// starts the first ones
+static volatile LONG g_lConnections = 0;
+
+// Event set once the last connection is closed
+static HANDLE g_hConnectionsDone = nullptr;
+
 /***************************************
 
 	Initialize WinSock 2.2
@@ -201,6 +242,47 @@ static int ConnectLocalSocket(int iPort, SOCKET* pOutSocket)
 	return iResult;
 }
 
+/***************************************
+
+	Connect to an AF_UNIX socket created by wslwinreg
+
+***************************************/
+
+static int ConnectUnixSocket(const char* pPath, SOCKET* pOutSocket)
+{
+	// Assume failure
+	*pOutSocket = INVALID_SOCKET;
+
+	// The pathname has to fit in sun_path with its terminator
+	sockaddr_un addr;
+	memset(&addr, 0, sizeof(addr));
+	addr.sun_family = AF_UNIX;
+	if (strlen(pPath) >= sizeof(addr.sun_path)) {
+		return ERROR_INVALID_PARAMETER;
+	}
+	strcpy_s(addr.sun_path, sizeof(addr.sun_path), pPath);
+
+	// Create the socket
+	SOCKET sock =
+		WSASocketW(AF_UNIX, SOCK_STREAM, 0, nullptr, 0, WSA_FLAG_OVERLAPPED);
+
+	int iResult;
+	if (sock == INVALID_SOCKET) {
+		iResult = WSAGetLastError();
+	} else {
+		iResult = connect(
+			sock, reinterpret_cast<sockaddr*>(&addr), sizeof(addr));
+		if (iResult) {
+			iResult = WSAGetLastError();
+			// Clean up due to error
+			closesocket(sock);
+		} else {
+			*pOutSocket = sock;
+		}
+	}
+	return iResult;
+}
+
 /***************************************
 
 	Convert UTF-16 to UTF-8 "C" string.
@@ -328,6 +410,21 @@ static LRESULT Fetch(SOCKET sendsocket, char* buffer, int iCount)
 
 	// Is there any data remaining?
 	while (iCount) {
+		// Read from the standard input if serving it
+		if (g_hPipeInput) {
+			DWORD uRead = 0;
+			if (!ReadFile(g_hPipeInput, buffer, static_cast<DWORD>(iCount),
+					&uRead, nullptr)) {
+				return static_cast<LRESULT>(GetLastError());
+			}
+			if (!uRead) {
+				return ERROR_BROKEN_PIPE;
+			}
+			iCount -= static_cast<int>(uRead);
+			buffer += uRead;
+			continue;
+		}
+
 		// Get data, blocking until all has arrived
 		int iReceived = recv(sendsocket, buffer, iCount, 0);
 		if (iReceived == SOCKET_ERROR) {
@@ -350,7 +447,7 @@ static LRESULT Fetch(SOCKET sendsocket, char* buffer, int iCount)
 
 ***************************************/
 
-static LRESULT Send(SOCKET sendsocket, const char* buffer, int iCount)
+static LRESULT Transmit(SOCKET sendsocket, const char* buffer, int iCount)
 {
 	// Standard sanity checks
 	if (iCount < 0) {
@@ -359,6 +456,18 @@ static LRESULT Send(SOCKET sendsocket, const char* buffer, int iCount)
 
 	// Is there any data remaining?
 	while (iCount) {
+		// Write to the standard output if serving it
+		if (g_hPipeOutput) {
+			DWORD uWritten = 0;
+			if (!WriteFile(g_hPipeOutput, buffer, static_cast<DWORD>(iCount),
+					&uWritten, nullptr)) {
+				return static_cast<LRESULT>(GetLastError());
+			}
+			iCount -= static_cast<int>(uWritten);
+			buffer += uWritten;
+			continue;
+		}
+
 		// Get data, blocking until all has arrived
 		// Note: Ethernet MTU size is 1500 bytes, so limit
 		// chunks to this maximum size.
@@ -377,6 +486,80 @@ static LRESULT Send(SOCKET sendsocket, const char* buffer, int iCount)
 
 	return ERROR_SUCCESS;
 }
+
+/***************************************
+
+	Reply being built for the command being processed.
+
+	Every reply is sent as one or more frames, each starting with
+	the ID of the request and the length of the data. Callers can
+	have several requests in flight and match the replies by ID.
+
+	Each connection thread has its own reply.
+
+***************************************/
+
+struct ReplyFrame {
+	DWORD m_uRequestID;              // ID of the request being answered
+	DWORD m_uLength;                 // Data length and REPLY_MORE_FRAMES
+	char m_Buffer[REPLY_FRAME_SIZE]; // Reply data
+	DWORD m_uSize;                   // Number of bytes in m_Buffer
+};
+
+static thread_local ReplyFrame g_Reply;
+
+/***************************************
+
+	Send the data in the reply as a frame
+
+***************************************/
+
+static LRESULT SendFrame(SOCKET sendsocket, DWORD uFlags)
+{
+	g_Reply.m_uLength = g_Reply.m_uSize | uFlags;
+	LRESULT iResult = Transmit(sendsocket,
+		reinterpret_cast<const char*>(&g_Reply),
+		static_cast<int>(4 + 4 + g_Reply.m_uSize));
+	g_Reply.m_uSize = 0;
+	return iResult;
+}
+
+/***************************************
+
+	Append an amount of data to the reply.
+
+	Full frames are sent as they fill up.
+
+***************************************/
+
+static LRESULT Send(SOCKET sendsocket, const char* buffer, int iCount)
+{
+	// Standard sanity checks
+	if (iCount < 0) {
+		return ERROR_INVALID_PARAMETER;
+	}
+
+	while (iCount) {
+		// Send the frame if it's full and there is more to add
+		DWORD uChunkSize = REPLY_FRAME_SIZE - g_Reply.m_uSize;
+		if (!uChunkSize) {
+			LRESULT iResult = SendFrame(sendsocket, REPLY_MORE_FRAMES);
+			if (iResult != ERROR_SUCCESS) {
+				return iResult;
+			}
+			continue;
+		}
+		if (uChunkSize > static_cast<DWORD>(iCount)) {
+			uChunkSize = static_cast<DWORD>(iCount);
+		}
+		memcpy(g_Reply.m_Buffer + g_Reply.m_uSize, buffer, uChunkSize);
+		g_Reply.m_uSize += uChunkSize;
+		iCount -= static_cast<int>(uChunkSize);
+		buffer += uChunkSize;
+	}
+	return ERROR_SUCCESS;
+}
+
 /***************************************
 
 	Convert a UTF-16 string into a UTF-8 string
@@ -467,6 +650,32 @@ static LRESULT FetchWideString(SOCKET sendsocket, WCHAR** ppWideString)
 	return iResult;
 }
 
+/***************************************
+
+	Open another connection to the python script, served by
+	a new thread.
+	Input: DWORD port
+	Output: DWORD Error + message if any
+
+***************************************/
+
+static LRESULT StartConnection(SOCKET newsocket);
+
+static void Connect(SOCKET sendsocket)
+{
+	DWORD uPort = 0;
+	LRESULT iResult = Fetch(sendsocket, reinterpret_cast<char*>(&uPort), 4);
+	if (iResult == ERROR_SUCCESS) {
+		SOCKET newsocket = INVALID_SOCKET;
+		iResult = ConnectLocalSocket(static_cast<int>(uPort), &newsocket);
+		if (iResult == ERROR_SUCCESS) {
+			// main() waits for the thread before exiting
+			iResult = StartConnection(newsocket);
+		}
+	}
+	ReturnResult(sendsocket, iResult);
+}
+
 /***************************************
 
 	Call RegCloseKey()
@@ -1467,6 +1676,365 @@ static void get_file_info(SOCKET sendsocket)
 	ReturnResult(sendsocket, iResult);
 }
 
+/***************************************
+
+	Send a DUMP_VALUE record for every value of a key
+
+	uMaxValueName and uMaxData are the sizes returned by
+	RegQueryInfoKeyW(), buffers are grown if the key changes
+	while being walked.
+
+	Returns ERROR_SUCCESS once all of the values were sent.
+
+***************************************/
+
+static LRESULT SendValues(
+	SOCKET sendsocket, HKEY hKey, DWORD uMaxValueName, DWORD uMaxData)
+{
+	// Include the terminating zeros
+	++uMaxValueName;
+	uMaxData += 2;
+	WCHAR* pValueName =
+		static_cast<WCHAR*>(malloc(uMaxValueName * sizeof(WCHAR)));
+	BYTE* pData = static_cast<BYTE*>(malloc(uMaxData));
+	LRESULT iResult = ERROR_OUTOFMEMORY;
+	if (pValueName && pData) {
+		DWORD uIndex = 0;
+		for (;;) {
+			DWORD uNameSize = uMaxValueName;
+			DWORD uDataSize = uMaxData;
+			DWORD uType = 0;
+			iResult = RegEnumValueW(hKey, uIndex, pValueName, &uNameSize,
+				nullptr, &uType, pData, &uDataSize);
+
+			// The value grew while being walked? Make room and retry.
+			if (iResult == ERROR_MORE_DATA) {
+				// Value names are never larger than 16383 characters
+				if (uMaxValueName < 16384) {
+					WCHAR* pNewName = static_cast<WCHAR*>(
+						realloc(pValueName, 16384 * sizeof(WCHAR)));
+					if (!pNewName) {
+						iResult = ERROR_OUTOFMEMORY;
+						break;
+					}
+					pValueName = pNewName;
+					uMaxValueName = 16384;
+				}
+				if (uDataSize < uMaxData) {
+					uDataSize = uMaxData * 2;
+				}
+				BYTE* pNewData = static_cast<BYTE*>(realloc(pData, uDataSize));
+				if (!pNewData) {
+					iResult = ERROR_OUTOFMEMORY;
+					break;
+				}
+				pData = pNewData;
+				uMaxData = uDataSize;
+				continue;
+			}
+			if (iResult != ERROR_SUCCESS) {
+				// Running out of values is not an error
+				if (iResult == ERROR_NO_MORE_ITEMS) {
+					iResult = ERROR_SUCCESS;
+				}
+				break;
+			}
+			unsigned char uRecord = DUMP_VALUE;
+			Send(sendsocket, reinterpret_cast<char*>(&uRecord), 1);
+			SendUTF8String(sendsocket, pValueName, uNameSize);
+			Send(sendsocket, reinterpret_cast<char*>(&uType), 4);
+			Send(sendsocket, reinterpret_cast<char*>(&uDataSize), 4);
+			if (uDataSize) {
+				Send(sendsocket, reinterpret_cast<char*>(pData),
+					static_cast<int>(uDataSize));
+			}
+			++uIndex;
+		}
+	}
+	if (pData) {
+		free(pData);
+	}
+	if (pValueName) {
+		free(pValueName);
+	}
+	return iResult;
+}
+
+/***************************************
+
+	Send a key record, all of its values and then recurse into
+	the sub keys.
+
+	pPath has the path of the key relative to the root of the dump,
+	and is DUMP_PATH_SIZE WCHARs in size.
+
+***************************************/
+
+static void DumpKey(SOCKET sendsocket, HKEY hKey, WCHAR* pPath,
+	DWORD uPathLength, DWORD uDepth, DWORD uMaxDepth, DWORD uAccess)
+{
+	// Get the number of entries and the sizes of the largest ones
+	DWORD uSubKeys = 0;
+	DWORD uValues = 0;
+	DWORD uMaxValueName = 0;
+	DWORD uMaxData = 0;
+	FILETIME sFileTime;
+	sFileTime.dwHighDateTime = 0;
+	sFileTime.dwLowDateTime = 0;
+	RegQueryInfoKeyW(hKey, nullptr, nullptr, nullptr, &uSubKeys, nullptr,
+		nullptr, &uValues, &uMaxValueName, &uMaxData, nullptr, &sFileTime);
+
+	// Send the key record
+	unsigned char uRecord = DUMP_KEY;
+	Send(sendsocket, reinterpret_cast<char*>(&uRecord), 1);
+	SendUTF8String(sendsocket, pPath, uPathLength);
+	Send(sendsocket, reinterpret_cast<char*>(&sFileTime), 8);
+
+	// Send all the values
+	if (uValues) {
+		SendValues(sendsocket, hKey, uMaxValueName, uMaxData);
+	}
+
+	// Recurse into the sub keys if not too deep
+	if (uSubKeys && (uDepth < uMaxDepth)) {
+		WCHAR SubKeyName[256 + 1];
+		DWORD uIndex = 0;
+		for (;;) {
+			DWORD uNameSize = 256 + 1;
+			if (RegEnumKeyExW(hKey, uIndex, SubKeyName, &uNameSize, nullptr,
+					nullptr, nullptr, nullptr) != ERROR_SUCCESS) {
+				break;
+			}
+			++uIndex;
+
+			// Skip keys whose path can't fit
+			if ((uPathLength + 1 + uNameSize + 1) > DUMP_PATH_SIZE) {
+				continue;
+			}
+
+			// Append the name to the path
+			DWORD uNewLength = uPathLength;
+			if (uNewLength) {
+				pPath[uNewLength++] = L'\\';
+			}
+			memcpy(pPath + uNewLength, SubKeyName, uNameSize * sizeof(WCHAR));
+			uNewLength += uNameSize;
+			pPath[uNewLength] = 0;
+
+			// Keys that can't be opened (Access denied) are skipped
+			HKEY hSubKey = nullptr;
+			if (RegOpenKeyExW(hKey, SubKeyName, 0, uAccess, &hSubKey) ==
+				ERROR_SUCCESS) {
+				DumpKey(sendsocket, hSubKey, pPath, uNewLength, uDepth + 1,
+					uMaxDepth, uAccess);
+				RegCloseKey(hSubKey);
+			}
+
+			// Restore the path
+			pPath[uPathLength] = 0;
+		}
+	}
+}
+
+/***************************************
+
+	Dump an entire registry tree
+	Input: QWORD HKEY, DWORD access, DWORD max depth, DWORD string length,
+		UTF-8 sub key
+	Output: Records, each starting with a BYTE record type
+		DUMP_KEY: DWORD length, UTF-8 path, QWORD last write time
+		DUMP_VALUE: DWORD length, UTF-8 name, DWORD type, DWORD data length,
+			data
+		DUMP_END: End of the records
+		DWORD Error + message if any
+
+***************************************/
+
+static void DumpTree(SOCKET sendsocket)
+{
+	struct {
+		__int64 m_hKey;   // Registry main key
+		DWORD m_Access;   // Requested access
+		DWORD m_MaxDepth; // Maximum depth to traverse
+	} buffer;
+
+	LRESULT iResult =
+		Fetch(sendsocket, reinterpret_cast<char*>(&buffer), 8 + 4 + 4);
+	if (iResult == ERROR_SUCCESS) {
+		WCHAR* pSubKey = nullptr;
+		iResult = FetchWideString(sendsocket, &pSubKey);
+		if (iResult == ERROR_SUCCESS) {
+			HKEY hKey = reinterpret_cast<HKEY>(buffer.m_hKey);
+			HKEY hRoot = nullptr;
+			if (pSubKey && pSubKey[0]) {
+				iResult =
+					RegOpenKeyExW(hKey, pSubKey, 0, buffer.m_Access, &hRoot);
+				hKey = hRoot;
+			}
+			if (iResult == ERROR_SUCCESS) {
+				WCHAR* pPath = static_cast<WCHAR*>(
+					malloc(DUMP_PATH_SIZE * sizeof(WCHAR)));
+				if (!pPath) {
+					iResult = ERROR_OUTOFMEMORY;
+				} else {
+					pPath[0] = 0;
+					DumpKey(sendsocket, hKey, pPath, 0, 0, buffer.m_MaxDepth,
+						buffer.m_Access);
+					free(pPath);
+				}
+			}
+			if (hRoot) {
+				RegCloseKey(hRoot);
+			}
+		}
+		if (pSubKey) {
+			free(pSubKey);
+		}
+	}
+
+	// Mark the end of the records
+	char uRecord = DUMP_END;
+	Send(sendsocket, &uRecord, 1);
+	ReturnResult(sendsocket, iResult);
+}
+
+/***************************************
+
+	Call RegEnumKeyExW() for a range of sub keys
+	Input: QWORD HKEY, DWORD start index, DWORD count, DWORD flags
+	Output: For each sub key, BYTE 1, DWORD string length, name string,
+		QWORD last write time if ENUM_KEYS_WITH_TIMES is set.
+		BYTE 0, DWORD Error + message if any
+
+***************************************/
+
+static void EnumKeys(SOCKET sendsocket)
+{
+	struct {
+		__int64 m_hKey; // Registry main key
+		DWORD m_Start;  // First index
+		DWORD m_Count;  // Maximum number of names
+		DWORD m_Flags;  // ENUM_KEYS_WITH_TIMES
+	} buffer;
+
+	LRESULT iResult =
+		Fetch(sendsocket, reinterpret_cast<char*>(&buffer), 8 + 4 + 4 + 4);
+
+	if (iResult == ERROR_SUCCESS) {
+		WCHAR SubKeyName[256 + 1];
+		DWORD uIndex = buffer.m_Start;
+		DWORD uCount = buffer.m_Count;
+		while (uCount) {
+			DWORD uNameSize = 256 + 1;
+			FILETIME sFileTime;
+			iResult = RegEnumKeyExW(reinterpret_cast<HKEY>(buffer.m_hKey),
+				uIndex, SubKeyName, &uNameSize, nullptr, nullptr, nullptr,
+				&sFileTime);
+			if (iResult != ERROR_SUCCESS) {
+				// Running out of keys is not an error
+				if (iResult == ERROR_NO_MORE_ITEMS) {
+					iResult = ERROR_SUCCESS;
+				}
+				break;
+			}
+			char uRecord = 1;
+			Send(sendsocket, &uRecord, 1);
+			SendUTF8String(sendsocket, SubKeyName, uNameSize);
+			if (buffer.m_Flags & ENUM_KEYS_WITH_TIMES) {
+				Send(sendsocket, reinterpret_cast<char*>(&sFileTime), 8);
+			}
+			++uIndex;
+			--uCount;
+		}
+	}
+
+	// Mark the end of the names
+	char uRecord = 0;
+	Send(sendsocket, &uRecord, 1);
+	ReturnResult(sendsocket, iResult);
+}
+
+/***************************************
+
+	Call RegEnumValueW() for every value of a key
+	Input: QWORD HKEY
+	Output: DUMP_VALUE records as sent by DUMP_TREE followed by DUMP_END,
+		DWORD Error + message if any
+
+***************************************/
+
+static void EnumValues(SOCKET sendsocket)
+{
+	__int64 hKey; // Registry main key
+	LRESULT iResult = Fetch(sendsocket, reinterpret_cast<char*>(&hKey), 8);
+
+	if (iResult == ERROR_SUCCESS) {
+		// Get the sizes of the largest entries
+		DWORD uValues = 0;
+		DWORD uMaxValueName = 0;
+		DWORD uMaxData = 0;
+		iResult = RegQueryInfoKeyW(reinterpret_cast<HKEY>(hKey), nullptr,
+			nullptr, nullptr, nullptr, nullptr, nullptr, &uValues,
+			&uMaxValueName, &uMaxData, nullptr, nullptr);
+
+		if ((iResult == ERROR_SUCCESS) && uValues) {
+			iResult = SendValues(sendsocket, reinterpret_cast<HKEY>(hKey),
+				uMaxValueName, uMaxData);
+		}
+	}
+
+	// Mark the end of the values
+	char uRecord = DUMP_END;
+	Send(sendsocket, &uRecord, 1);
+	ReturnResult(sendsocket, iResult);
+}
+
+/***************************************
+
+	Perform get_file_info_all()
+	Input: DWORD path length, UTF-8 path
+	Output: DWORD data length, data from GetFileVersionInfoW(),
+		DWORD Error + message if any
+
+***************************************/
+
+static void get_file_info_all(SOCKET sendsocket)
+{
+	DWORD uBufferSize = 0;
+	void* pBuffer = nullptr;
+
+	// Get the path_name string
+	WCHAR* pPathName = nullptr;
+	LRESULT iResult = FetchWideString(sendsocket, &pPathName);
+	if (iResult == ERROR_SUCCESS) {
+		// Is there any data in the file?
+		uBufferSize = GetFileVersionInfoSizeW(pPathName, nullptr);
+		if (uBufferSize) {
+			// Create a buffer for the data
+			pBuffer = calloc(1, uBufferSize);
+			if (!pBuffer) {
+				iResult = ERROR_OUTOFMEMORY;
+				uBufferSize = 0;
+			} else if (!GetFileVersionInfoW(pPathName, 0, uBufferSize, pBuffer)) {
+				uBufferSize = 0;
+			}
+		}
+	}
+	if (pPathName) {
+		free(pPathName);
+	}
+
+	// Send the whole resource, it's parsed by the caller
+	Send(sendsocket, reinterpret_cast<char*>(&uBufferSize), 4);
+	if (uBufferSize) {
+		Send(sendsocket, static_cast<char*>(pBuffer), uBufferSize);
+	}
+	if (pBuffer) {
+		free(pBuffer);
+	}
+	ReturnResult(sendsocket, iResult);
+}
+
 /***************************************
 
 	Process the socket information
@@ -1476,17 +2044,25 @@ static void get_file_info(SOCKET sendsocket)
 static void ProcessCommands(SOCKET sendsocket)
 {
 	// Send the version number. Must match in wslapi.py
-	Send(sendsocket, "Bridge started 1.0", 18);
+	Transmit(sendsocket, "Bridge started 2.0", 18);
 
 	for (;;) {
 		char buffer[32];
-		// Wait for a command
-		LRESULT iResult = Fetch(sendsocket, buffer, 1);
+		// Wait for a request ID and a command
+		LRESULT iResult = Fetch(sendsocket, buffer, 4 + 1);
 		if (iResult != ERROR_SUCCESS) {
 			break;
 		}
+
+		// Start the reply to this request
+		memcpy(&g_Reply.m_uRequestID, buffer, 4);
+		g_Reply.m_uSize = 0;
+
 		// Process the command
-		switch (buffer[0]) {
+		switch (buffer[4]) {
+		case CONNECT:
+			Connect(sendsocket);
+			break;
 		case CLOSE_KEY:
 			CloseKey(sendsocket);
 			break;
@@ -1557,12 +2133,82 @@ static void ProcessCommands(SOCKET sendsocket)
 		case GET_FILE_INFO:
 			get_file_info(sendsocket);
 			break;
+		case DUMP_TREE:
+			DumpTree(sendsocket);
+			break;
+		case ENUM_KEYS:
+			EnumKeys(sendsocket);
+			break;
+		case ENUM_VALUES:
+			EnumValues(sendsocket);
+			break;
+		case GET_FILE_INFO_ALL:
+			get_file_info_all(sendsocket);
+			break;
 		default:
 			break;
 		}
+
+		// Send the last (or only) frame of the reply
+		if (SendFrame(sendsocket, 0) != ERROR_SUCCESS) {
+			break;
+		}
 	}
 }
 
+/***************************************
+
+	Count a connection as closed
+
+***************************************/
+
+static void ReleaseConnection(void)
+{
+	// Wake up main() when the last connection is gone
+	if (!InterlockedDecrement(&g_lConnections)) {
+		SetEvent(g_hConnectionsDone);
+	}
+}
+
+/***************************************
+
+	Thread to process the commands from one connection
+
+***************************************/
+
+static DWORD WINAPI ConnectionThread(LPVOID pSocket)
+{
+	SOCKET sendsocket = reinterpret_cast<SOCKET>(pSocket);
+	ProcessCommands(sendsocket);
+	closesocket(sendsocket);
+	ReleaseConnection();
+	return 0;
+}
+
+/***************************************
+
+	Start a thread to serve a connection, counted so main()
+	runs until every connection is closed, including the ones
+	opened later with CONNECT.
+
+***************************************/
+
+static LRESULT StartConnection(SOCKET newsocket)
+{
+	InterlockedIncrement(&g_lConnections);
+	HANDLE hThread = CreateThread(nullptr, 0, ConnectionThread,
+		reinterpret_cast<LPVOID>(newsocket), 0, nullptr);
+	if (!hThread) {
+		LRESULT iResult = static_cast<LRESULT>(GetLastError());
+		closesocket(newsocket);
+		ReleaseConnection();
+		return iResult;
+	}
+	// The thread runs until the connection is closed
+	CloseHandle(hThread);
+	return ERROR_SUCCESS;
+}
+
 /***************************************
 
 	Main entry point.
@@ -1570,6 +2216,12 @@ static void ProcessCommands(SOCKET sendsocket)
 	Command is -p 2056 with 2056 being the port to connect
 	with from the python script wslwinreg.
 
+	-u path connects to the AF_UNIX socket at path instead, and
+	-s serves a single connection over the standard input and output.
+
+	Optional -c 4 opens 4 connections to the port, each served by
+	its own thread. Registry handles are shared by all connections.
+
 ***************************************/
 
 int __cdecl main(int argc, char* argv[])
@@ -1583,6 +2235,9 @@ int __cdecl main(int argc, char* argv[])
 	// Get the port to connect to by scanning for -p in the command list
 	int iPort = 0;
 	bool bPortFound = false;
+	const char* pUnixPath = nullptr;
+	bool bStdio = false;
+	int iConnections = 1;
 	int i;
 	for (i = 1; i < argc; ++i) {
 		if (!_stricmp(argv[i], "-p")) {
@@ -1592,12 +2247,35 @@ int __cdecl main(int argc, char* argv[])
 				continue;
 			}
 		}
+		if (!_stricmp(argv[i], "-u")) {
+			if ((i + 1) != argc) {
+				pUnixPath = argv[++i];
+				continue;
+			}
+		}
+		if (!_stricmp(argv[i], "-s")) {
+			bStdio = true;
+			continue;
+		}
+		if (!_stricmp(argv[i], "-c")) {
+			if ((i + 1) != argc) {
+				iConnections = atoi(argv[++i]);
+				continue;
+			}
+		}
+	}
+
+	// Clamp the number of connections
+	if (iConnections < 1) {
+		iConnections = 1;
+	} else if (iConnections > MAX_CONNECTIONS) {
+		iConnections = MAX_CONNECTIONS;
 	}
 
 	// Error?
-	if (!bPortFound) {
+	if (!bPortFound && !pUnixPath && !bStdio) {
 		printf(
-			"\nUsage: %s -p port\n"
+			"\nUsage: %s -p port | -u path | -s [-c connections]\n"
 			"\nbackend for wslwinreg\n"
 			"This program should not be executed directly\n\n",
 			argv[0]);
@@ -1607,13 +2285,45 @@ int __cdecl main(int argc, char* argv[])
 	// Init WinSock
 	int iResult = StartWinSock();
 	if (iResult == ERROR_SUCCESS) {
-		// Connect to the python script
-		SOCKET sendsocket = INVALID_SOCKET;
-		iResult = ConnectLocalSocket(iPort, &sendsocket);
-		if (iResult == ERROR_SUCCESS) {
-			ProcessCommands(sendsocket);
-			closesocket(sendsocket);
+		g_hConnectionsDone = CreateEventW(nullptr, TRUE, FALSE, nullptr);
+		if (!g_hConnectionsDone) {
+			iResult = static_cast<int>(GetLastError());
+			StopWinSock();
+			return iResult;
 		}
+
+		// Hold a connection so the count can't reach zero while the first
+		// connections are started
+		g_lConnections = 1;
+		if (bStdio) {
+			// Serve the standard input and output on this thread, other
+			// connections can still be opened with CONNECT
+			g_hPipeInput = GetStdHandle(STD_INPUT_HANDLE);
+			g_hPipeOutput = GetStdHandle(STD_OUTPUT_HANDLE);
+			ProcessCommands(INVALID_SOCKET);
+		} else {
+			// Connect to the python script
+			for (i = 0; i < iConnections; ++i) {
+				SOCKET sendsocket = INVALID_SOCKET;
+				if (pUnixPath) {
+					iResult = ConnectUnixSocket(pUnixPath, &sendsocket);
+				} else {
+					iResult = ConnectLocalSocket(iPort, &sendsocket);
+				}
+				if (iResult == ERROR_SUCCESS) {
+					iResult = static_cast<int>(StartConnection(sendsocket));
+				}
+				if (iResult != ERROR_SUCCESS) {
+					break;
+				}
+			}
+		}
+		ReleaseConnection();
+
+		// Run until all the connections are closed, including the ones
+		// opened with CONNECT, since exiting would kill their threads
+		WaitForSingleObject(g_hConnectionsDone, INFINITE);
+		CloseHandle(g_hConnectionsDone);
 		StopWinSock();
 	}
 	return iResult;
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the asyncio wrappers
+"""
+
+import os
+import sys
+import unittest
+
+# Use abspath() because msys2 only returns the module filename
+# instead of the full path
+
+# Insert the location of wslwinreg at the begining so it's the first
+# to be processed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from wslwinreg import HKEY_CURRENT_USER, KEY_ALL_ACCESS, REG_SZ
+
+# aio is Python 3 only, it's a SyntaxError on Python 2
+if sys.version_info >= (3, 5):
+    import asyncio
+    from wslwinreg import aio
+else:
+    aio = None
+
+TEST_KEY = "Software\\Python Registry Test Aio"
+
+########################################
+
+
+@unittest.skipIf(aio is None, "asyncio requires Python 3.5 or higher")
+class TestAio(unittest.TestCase):
+    """
+    Test the awaitable registry functions.
+    """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        # gather() is called outside the loop, so it must be the current one
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_set_and_query(self):
+        """
+        Write values concurrently and read them back.
+        """
+
+        run = self.loop.run_until_complete
+        key = run(aio.CreateKeyEx(HKEY_CURRENT_USER, TEST_KEY, 0,
+                                  KEY_ALL_ACCESS))
+        try:
+            names = ["Value {}".format(i) for i in range(16)]
+            run(asyncio.gather(*[aio.SetValueEx(key, name, 0, REG_SZ, name)
+                                 for name in names]))
+
+            results = run(asyncio.gather(
+                *[aio.QueryValueEx(key, name) for name in names]))
+            self.assertEqual(results, [(name, REG_SZ) for name in names])
+
+            values = run(aio.EnumValues(key))
+            self.assertEqual(sorted(values),
+                             sorted((name, name, REG_SZ) for name in names))
+        finally:
+            run(aio.CloseKey(key))
+            run(aio.DeleteKey(HKEY_CURRENT_USER, TEST_KEY))
+
+        with self.assertRaises(OSError):
+            run(aio.OpenKey(HKEY_CURRENT_USER, TEST_KEY))
+
+########################################
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,572 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the bridge protocol against the Python bridge server
+"""
+
+import gc
+import os
+import sys
+import time
+import socket
+import struct
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Use abspath() because msys2 only returns the module filename
+# instead of the full path
+
+# Insert the location of wslwinreg at the begining so it's the first
+# to be processed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from wslwinreg.common import ERROR_NO_MORE_ITEMS, HKEY_CURRENT_USER, \
+    HKEY_USERS, KEY_ALL_ACCESS, REG_SZ, REG_DWORD, REG_BINARY, REG_MULTI_SZ, \
+    REG_QWORD
+from wslwinreg.bridgeserver import BridgeServer
+from wslwinreg.bridgebench import benchmark_transport
+
+# wslapi replaces WindowsError, so leave it alone on Windows
+if sys.platform != "win32":
+    from wslwinreg import wslapi
+else:
+    wslapi = None
+
+TEST_KEY = u"Software\\Python Registry Test Bridge"
+
+########################################
+
+
+@unittest.skipIf(wslapi is None, "wslapi isn't used on Windows")
+class TestBridgeServer(unittest.TestCase):
+    """
+    Test wslapi talking to the Python bridge server.
+    """
+
+    ## Transport to the server
+    transport = "tcp"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.environ = dict(os.environ)
+        os.environ["WSLWINREG_BRIDGE"] = "python"
+        os.environ["WSLWINREG_CONNECTIONS"] = "2"
+        os.environ["WSLWINREG_TRANSPORT"] = cls.transport
+        os.environ.pop("WSLWINREG_BRIDGE_LATENCY", None)
+
+        # Start a bridge of our own, even if one is running
+        cls.previous = (wslapi._BRIDGES, wslapi._POOL_STATE)
+        wslapi._BRIDGES = wslapi._start_bridges()
+        wslapi._POOL_STATE = threading.local()
+
+    @classmethod
+    def tearDownClass(cls):
+        for bridge in wslapi._BRIDGES:
+            bridge.close()
+        wslapi._BRIDGES, wslapi._POOL_STATE = cls.previous
+        os.environ.clear()
+        os.environ.update(cls.environ)
+
+    def setUp(self):
+        self.key = wslapi.CreateKeyEx(HKEY_CURRENT_USER, TEST_KEY, 0,
+                                      KEY_ALL_ACCESS)
+
+    def tearDown(self):
+        tree = wslapi.DumpTree(self.key)
+        self.key.Close()
+        for path, _, _ in reversed(tree):
+            wslapi.DeleteKey(HKEY_CURRENT_USER,
+                             TEST_KEY + u"\\" + path if path else TEST_KEY)
+
+    def test_values(self):
+        """
+        Test values of every type, including ones sent in many frames.
+        """
+
+        big = bytes(bytearray(range(256))) * 8192
+        values = [
+            (u"String", u"Héllo ☃", REG_SZ),
+            (u"Dword", 42, REG_DWORD),
+            (u"Qword", 1 << 40, REG_QWORD),
+            (u"Multi", [u"a", u"b"], REG_MULTI_SZ),
+            (u"Big", big, REG_BINARY)]
+        for name, value, typ in values:
+            wslapi.SetValueEx(self.key, name, 0, typ, value)
+        for name, value, typ in values:
+            self.assertEqual(wslapi.QueryValueEx(self.key, name), (value, typ))
+        self.assertEqual(wslapi.EnumValues(self.key), values)
+        self.assertEqual(wslapi.EnumValue(self.key, 0), values[0])
+        self.assertEqual(wslapi.QueryInfoKey(self.key)[:2], (0, 5))
+
+        wslapi.SetValue(self.key, u"Sub", REG_SZ, u"Default")
+        self.assertEqual(wslapi.QueryValue(self.key, u"Sub"), u"Default")
+        self.assertEqual(wslapi.EnumKey(self.key, 0), u"Sub")
+        self.assertEqual(
+            [item[0] for item in wslapi.EnumKeys(self.key, with_times=True)],
+            [u"Sub"])
+        tree = wslapi.DumpTree(self.key)
+        self.assertEqual([item[0] for item in tree], [u"", u"Sub"])
+        self.assertEqual(tree[0][2], values)
+
+    def test_errors(self):
+        """
+        Test errors and integer handles.
+        """
+
+        with self.assertRaises(FileNotFoundError):
+            wslapi.OpenKey(self.key, u"Missing")
+        with self.assertRaises(FileNotFoundError):
+            wslapi.QueryValueEx(self.key, u"Missing")
+        with self.assertRaises(OSError) as context:
+            wslapi.EnumKey(self.key, 0)
+        self.assertEqual(context.exception.winerror, ERROR_NO_MORE_ITEMS)
+
+        # Integer handles belong to the caller and stay open
+        hkey = wslapi.OpenKey(HKEY_CURRENT_USER, TEST_KEY).Detach()
+        wslapi.QueryInfoKey(hkey)
+        self.assertEqual(wslapi.QueryInfoKey(hkey)[:2], (0, 0))
+        wslapi.CloseKey(hkey)
+        with self.assertRaises(OSError):
+            wslapi.QueryInfoKey(hkey)
+
+    def test_concurrency(self):
+        """
+        Test many threads and a batch sharing the connections.
+        """
+
+        names = [u"Value %d" % index for index in range(64)]
+        with wslapi.Batch() as batch:
+            for name in names:
+                batch.call(wslapi.SetValueEx, self.key, name, 0, REG_SZ, name)
+
+        errors = []
+
+        def worker(offset):
+            """
+            Read every value in a different order.
+            """
+            try:
+                for index in range(len(names)):
+                    name = names[(index + offset) % len(names)]
+                    if wslapi.QueryValueEx(self.key, name) != (name, REG_SZ):
+                        errors.append(name)
+            except Exception as error:   # pylint: disable=broad-except
+                errors.append(error)
+
+        threads = [threading.Thread(target=worker, args=(offset,))
+                   for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_save_and_load(self):
+        """
+        Test the hive files written and read by the server.
+        """
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "test.hiv")
+            wslapi.SetValueEx(self.key, u"Count", 0, REG_DWORD, 7)
+            wslapi.SaveKey(self.key, path)
+            with self.assertRaises(OSError):
+                wslapi.SaveKey(self.key, path)
+            wslapi.LoadKey(HKEY_USERS, u"Bridge Test", path)
+            with wslapi.OpenKey(HKEY_USERS, u"Bridge Test") as key:
+                self.assertEqual(wslapi.QueryValueEx(key, u"Count"),
+                                 (7, REG_DWORD))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_deferred_close(self):
+        """
+        Test closes wait unless asked to be sent with the next command.
+        """
+
+        bridge = wslapi._bridge()
+        key = wslapi.OpenKey(HKEY_CURRENT_USER, TEST_KEY)
+        key.Close()
+        self.assertFalse(key)
+        self.assertEqual(len(bridge._posted), 0)
+
+        key = wslapi.OpenKey(HKEY_CURRENT_USER, TEST_KEY)
+        hkey = int(key)
+        key.Close(wait=False)
+        self.assertFalse(key)
+        self.assertEqual(len(bridge._posted), 1)
+
+        # The close is sent first, so the handle is already gone
+        with self.assertRaises(OSError):
+            wslapi.QueryInfoKey(hkey)
+        self.assertEqual(len(bridge._posted), 0)
+
+        os.environ["WSLWINREG_DEFERRED_CLOSE"] = "1"
+        try:
+            wslapi.CloseKey(wslapi.OpenKey(HKEY_CURRENT_USER, TEST_KEY))
+            self.assertEqual(len(bridge._posted), 1)
+            wslapi.flush_closes()
+            self.assertEqual(len(bridge._posted), 0)
+        finally:
+            del os.environ["WSLWINREG_DEFERRED_CLOSE"]
+
+        # Long runs of closes don't pile up
+        keys = [wslapi.OpenKey(HKEY_CURRENT_USER, TEST_KEY)
+                for _ in range(wslapi._MAX_POSTED + 10)]
+        for key in keys:
+            key.Close(wait=False)
+        self.assertLess(len(bridge._posted), wslapi._MAX_POSTED)
+        wslapi.flush_closes()
+        self.assertEqual(len(bridge._posted), 0)
+
+        # Finalizers only queue the close, the next command sends them
+        keys = [wslapi.OpenKey(HKEY_CURRENT_USER, TEST_KEY)
+                for _ in range(wslapi._MAX_POSTED + 10)]
+        del keys
+        gc.collect()
+        self.assertEqual(len(bridge._posted), wslapi._MAX_POSTED + 10)
+        wslapi.QueryInfoKey(HKEY_CURRENT_USER)
+        self.assertEqual(len(bridge._posted), 0)
+
+        # Wrappers around the caller's integer handles never close them
+        key = wslapi.OpenKey(HKEY_CURRENT_USER, TEST_KEY)
+        hkey = int(key)
+        wslapi.QueryInfoKey(hkey)
+        gc.collect()
+        self.assertEqual(len(bridge._posted), 0)
+        wslapi.QueryInfoKey(key)
+        key.Close()
+
+    def test_transport(self):
+        """
+        Test the connections use the transport.
+        """
+
+        self.assertEqual(wslapi.get_transport(), self.transport)
+        self.assertEqual(len(wslapi._BRIDGES),
+                         1 if self.transport == "stdio" else 2)
+
+########################################
+
+
+@unittest.skipIf(wslapi is None or not hasattr(socket, "AF_UNIX"),
+                 "AF_UNIX isn't available")
+class TestBridgeServerUnix(TestBridgeServer):
+    """
+    Test wslapi talking to the Python bridge server over AF_UNIX.
+    """
+
+    ## Transport to the server
+    transport = "unix"
+
+########################################
+
+
+@unittest.skipIf(wslapi is None, "wslapi isn't used on Windows")
+class TestBridgeServerStdio(TestBridgeServer):
+    """
+    Test wslapi talking to the Python bridge server over its stdio.
+    """
+
+    ## Transport to the server
+    transport = "stdio"
+
+########################################
+
+
+@unittest.skipIf(wslapi is None or not hasattr(socket, "AF_UNIX"),
+                 "AF_UNIX isn't available")
+class TestBroker(unittest.TestCase):
+    """
+    Test processes sharing a bridge through the broker.
+    """
+
+    def setUp(self):
+        self.environ = dict(os.environ)
+        self.previous = (wslapi._BRIDGES, wslapi._POOL_STATE)
+        self.tmpdir = tempfile.mkdtemp()
+        os.environ.update(WSLWINREG_BRIDGE="python", WSLWINREG_BROKER="1",
+                          WSLWINREG_BROKER_IDLE="0.5",
+                          XDG_CACHE_HOME=self.tmpdir)
+        self.bridges = []
+
+    def tearDown(self):
+        self.detach()
+        wslapi._BRIDGES, wslapi._POOL_STATE = self.previous
+        wslapi._LIVE_KEYS = None
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+
+    def use_bridges(self):
+        """
+        Attach to the broker, like a new process would.
+        """
+        bridges = wslapi._start_bridges()
+        self.bridges.extend(bridges)
+        wslapi._BRIDGES = bridges
+        wslapi._POOL_STATE = threading.local()
+
+    def detach(self):
+        """
+        Close the bridges and the sockets to the broker, like at exit.
+        """
+        for bridge in self.bridges:
+            bridge.close()
+        self.bridges = []
+        while wslapi._BROKER_CONNECTIONS:
+            wslapi._BROKER_CONNECTIONS.pop().close()
+
+    def test_shared_bridge(self):
+        """
+        Clients see the same registry and the broker exits when idle.
+        """
+
+        self.use_bridges()
+        path_name = wslapi.get_broker_path()
+        self.assertTrue(os.path.exists(path_name))
+        with wslapi.CreateKey(HKEY_CURRENT_USER, TEST_KEY) as key:
+            wslapi.SetValueEx(key, u"Shared", 0, REG_SZ, u"Yes")
+        self.assertIsNotNone(wslapi._LIVE_KEYS)
+
+        # The broker stays up past the idle time while clients are attached
+        time.sleep(2.0)
+        self.assertTrue(os.path.exists(path_name))
+
+        self.use_bridges()
+        with wslapi.OpenKey(HKEY_CURRENT_USER, TEST_KEY) as key:
+            self.assertEqual(wslapi.QueryValueEx(key, u"Shared"),
+                             (u"Yes", REG_SZ))
+        wslapi.DeleteKey(HKEY_CURRENT_USER, TEST_KEY)
+
+        self.detach()
+        deadline = time.time() + 10.0
+        while os.path.exists(path_name) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(os.path.exists(path_name))
+
+########################################
+
+
+@unittest.skipIf(wslapi is None, "wslapi isn't used on Windows")
+class TestBridgeLatency(unittest.TestCase):
+    """
+    Test the latency injected by the server.
+    """
+
+    def test_latency(self):
+        """
+        Pipelined commands wait for the latency once, not once each.
+        """
+
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.bind(("127.0.0.1", 0))
+        listen_socket.listen(1)
+        BridgeServer(50.0).connect(listen_socket.getsockname()[1])
+        connection, _ = listen_socket.accept()
+        listen_socket.close()
+        self.assertEqual(connection.recv(64), wslapi._HANDSHAKE)
+
+        bridge = wslapi._Bridge(connection)
+        try:
+            buffer = wslapi._encode_call(
+                wslapi.QueryInfoKey, HKEY_CURRENT_USER)[0][0]
+            start = time.time()
+            bridge.send([buffer])[0].wait()
+            self.assertGreaterEqual(time.time() - start, 0.05)
+
+            start = time.time()
+            for reply in bridge.send([buffer] * 10):
+                reply.wait()
+            self.assertLess(time.time() - start, 0.25)
+        finally:
+            bridge.close()
+
+    def test_queued_timeout(self):
+        """
+        The timeout of a reply only starts once the commands before it
+        are done.
+        """
+
+        client, server = socket.socketpair()
+        bridge = wslapi._Bridge(client)
+        try:
+            replies = bridge.send([b"slow", b"fast", b"lost", b"last"])
+
+            def serve():
+                # Commands are run in order, the third one never replies
+                time.sleep(0.5)
+                for request_id in (1, 2, 4):
+                    server.sendall(wslapi._FRAME_HEADER.pack(request_id, 1) +
+                                   b"X")
+                    time.sleep(0.2)
+
+            thread = threading.Thread(target=serve)
+            thread.start()
+            self.assertEqual(replies[1].wait(0.3), [bytearray(b"X")])
+            self.assertEqual(replies[0].wait(0.3), [bytearray(b"X")])
+            self.assertRaises(socket.timeout, replies[2].wait, 0.1)
+            self.assertEqual(replies[3].wait(0.3), [bytearray(b"X")])
+            thread.join()
+        finally:
+            bridge.close()
+            server.close()
+
+    def test_benchmark(self):
+        """
+        Every transport can be benchmarked.
+        """
+
+        environ = dict(os.environ)
+        os.environ["WSLWINREG_BRIDGE"] = "python"
+        try:
+            for transport in sorted(wslapi._TRANSPORTS):
+                result = benchmark_transport(transport, 10, 1024)
+                self.assertGreater(result["round_trip"], 0.0)
+                self.assertGreater(result["throughput"], 0.0)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+########################################
+
+
+class _TrickleSocket(object):
+    """
+    Socket stand in that returns a few bytes from every recv_into().
+    """
+
+    def __init__(self, data, chunk):
+        self.data = data
+        self.chunk = chunk
+
+    def recv_into(self, view):
+        """
+        Receive at most chunk bytes.
+        """
+        count = min(len(view), self.chunk, len(self.data))
+        view[:count] = self.data[:count]
+        self.data = self.data[count:]
+        return count
+
+########################################
+
+
+@unittest.skipIf(wslapi is None, "wslapi isn't used on Windows")
+class TestFrameReader(unittest.TestCase):
+    """
+    Test reading and decoding reply frames.
+    """
+
+    def test_partial_reads(self):
+        """
+        Frames split across any number of reads are put back together.
+        """
+
+        frames = [b"A" * 100, b"", b"B" * 70000, b"C"]
+        stream = b"".join(
+            wslapi._FRAME_HEADER.pack(index, len(frame)) + frame
+            for index, frame in enumerate(frames))
+        for chunk in (1, 3, 4096, len(stream)):
+            reader = wslapi._FrameReader(_TrickleSocket(stream, chunk), 16)
+            for index, frame in enumerate(frames):
+                self.assertEqual(reader.unpack(wslapi._FRAME_HEADER),
+                                 (index, len(frame)))
+                data = bytearray(len(frame))
+                reader.read_into(memoryview(data))
+                self.assertEqual(bytes(data), frame)
+            with self.assertRaises(socket.timeout):
+                reader.unpack(wslapi._FRAME_HEADER)
+
+    def test_decode_across_frames(self):
+        """
+        Fields that span frames are read whole.
+        """
+
+        frames = [bytearray(b"\x05\x00"), bytearray(b"\x00\x00he"),
+                  bytearray(), bytearray(b"llo!")]
+
+        def reader():
+            """
+            Read a string and the byte after it.
+            """
+            return (wslapi.recv_string(), wslapi.recv_exact(1))
+
+        self.assertEqual(wslapi._decode(frames, reader), (u"hello", b"!"))
+        with self.assertRaises(socket.timeout):
+            wslapi._decode(frames, lambda: wslapi.recv_exact(12))
+
+########################################
+
+
+@unittest.skipIf(wslapi is None, "wslapi isn't used on Windows")
+class TestFrameBuilder(unittest.TestCase):
+    """
+    Test building and sending commands in segments.
+    """
+
+    def test_encoding(self):
+        """
+        The segments hold the same bytes as the concatenated command.
+        """
+
+        big = b"\xAB" * (wslapi._INLINE_MAX * 2)
+        for payload in (b"", b"small", big, u"Ünïcode"):
+            is_binary = not isinstance(payload, type(u""))
+            builder = wslapi._FrameBuilder("<BQ", 21, 0x80000001)
+            segments = builder.string(u"Name").string(
+                payload, is_binary).build()
+            expected = struct.pack("<BQ", 21, 0x80000001) + \
+                wslapi.create_string_buffer(u"Name") + \
+                wslapi.create_string_buffer(payload, is_binary)
+            self.assertEqual(b"".join(segments), expected)
+
+            # Large payloads are not copied
+            self.assertEqual(any(segment is payload for segment in segments),
+                             payload is big)
+
+        # Running out of the preallocated buffer
+        builder = wslapi._FrameBuilder("<B", 1)
+        for _ in range(wslapi._BUILDER_SIZE):
+            builder.pack("<I", 0x01020304)
+        segments = builder.build()
+        self.assertEqual(b"".join(segments),
+                         b"\x01" + b"\x04\x03\x02\x01" * wslapi._BUILDER_SIZE)
+
+    def test_send_segments(self):
+        """
+        Segments are sent in order, even when the socket sends a few bytes
+        at a time.
+        """
+
+        sender, receiver = socket.socketpair()
+        try:
+            sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+            segments = [bytes(bytearray([index % 256])) * (index * 37)
+                        for index in range(2000)]
+            expected = b"".join(segments)
+            received = bytearray()
+
+            def reader():
+                """
+                Read everything that was sent.
+                """
+                while len(received) < len(expected):
+                    received.extend(receiver.recv(1000))
+
+            thread = threading.Thread(target=reader)
+            thread.start()
+            wslapi._send_segments(sender, segments)
+            thread.join()
+            self.assertEqual(bytes(received), expected)
+        finally:
+            sender.close()
+            receiver.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
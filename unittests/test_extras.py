@@ -17,7 +17,8 @@ import unittest
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # pylint: disable=wrong-import-position
 from wslwinreg import convert_from_windows_path, convert_to_windows_path, \
-    get_file_info, IS_CYGWIN, IS_MSYS, IS_WSL
+    convert_from_windows_paths, convert_to_windows_paths, get_file_info, \
+    get_file_info_all, IS_CYGWIN, IS_MSYS, IS_WSL
 
 ########################################
 
@@ -42,6 +43,19 @@ class TestExtras(unittest.TestCase):
         result2 = convert_to_windows_path(result)
         self.assertEqual(result2, "C:\\Windows\\Notepad.exe")
 
+    def test_convert_to_windows_paths(self):
+        """
+        Test convert_to_windows_paths and convert_from_windows_paths
+        """
+
+        names = ["C:\\Windows\\Notepad.exe", "C:\\Windows"]
+        result = convert_from_windows_paths(names)
+        self.assertEqual(result, [convert_from_windows_path(name)
+                                  for name in names])
+
+        # Check if it converted back
+        self.assertEqual(convert_to_windows_paths(iter(result)), names)
+
     def test_get_file_info(self):
         """
         Test get_file_info()
@@ -59,6 +73,21 @@ class TestExtras(unittest.TestCase):
         result = get_file_info(linux_name, "ProductVersion")
         self.assertIsNotNone(result)
 
+    def test_get_file_info_all(self):
+        """
+        Test get_file_info_all()
+        """
+        result = get_file_info_all("C:\\Windows\\Notepad.exe")
+        self.assertIsNotNone(result)
+        self.assertEqual(len(result["file_version"]), 4)
+
+        # The default translation matches get_file_info()
+        table = result["strings"]["{0:04x}{1:04x}".format(
+            *result["translations"][0])]
+        self.assertEqual(
+            table.get("FileVersion"),
+            get_file_info("C:\\Windows\\Notepad.exe", "FileVersion"))
+
 ########################################
 
 
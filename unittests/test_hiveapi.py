@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test reading generated registry hive files
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from struct import pack
+
+# FileNotFoundError introduced in Python 3
+if sys.version_info[0] == 2:
+    FileNotFoundError = OSError
+
+# Use abspath() because msys2 only returns the module filename
+# instead of the full path
+
+# Insert the location of wslwinreg at the begining so it's the first
+# to be processed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from wslwinreg.common import ERROR_NO_MORE_ITEMS, REG_SZ, REG_DWORD, \
+    REG_BINARY, REG_MULTI_SZ, REG_QWORD
+from wslwinreg.hiveapi import OpenHive, OpenKey, OpenKeyEx, CloseKey, \
+    EnumKey, EnumKeys, EnumValue, EnumValues, QueryInfoKey, QueryValue, \
+    QueryValueEx, DumpTree, ERROR_INVALID_HANDLE, ERROR_BADDB
+
+########################################
+
+
+class HiveBuilder(object):
+    """
+    Build a minimal hive file, one cell after another in a single bin.
+    """
+
+    def __init__(self):
+        self.cells = bytearray()
+
+    def alloc(self, payload):
+        """
+        Append an allocated cell and return its offset.
+        """
+
+        offset = 0x20 + len(self.cells)
+        size = (len(payload) + 4 + 7) & ~7
+        self.cells += pack("<i", -size) + payload + \
+            b"\0" * (size - 4 - len(payload))
+        return offset
+
+    def value(self, name, typ, raw, big=False):
+        """
+        Add a vk record, storing the data in place, in a cell or in a db.
+        """
+
+        if len(raw) <= 4:
+            size = len(raw) | 0x80000000
+            data_offset = pack("<4s", raw)
+        elif big:
+            segments = [self.alloc(raw[index:index + 16344])
+                        for index in range(0, len(raw), 16344)]
+            segment_list = self.alloc(pack("<%dI" % len(segments),
+                                           *segments))
+            size = len(raw)
+            data_offset = pack("<I", self.alloc(
+                b"db" + pack("<HI", len(segments), segment_list)))
+        else:
+            size = len(raw)
+            data_offset = pack("<I", self.alloc(raw))
+        try:
+            encoded = name.encode("ascii")
+            flags = 1
+        except UnicodeEncodeError:
+            encoded = name.encode("utf-16-le")
+            flags = 0
+        return self.alloc(b"vk" + pack("<HI", len(encoded), size) +
+                          data_offset + pack("<IHH", typ, flags, 0) + encoded)
+
+    def key(self, name, values=(), subkeys=(), kind=b"lh",
+            last_write_time=0x01D0000000000000):
+        """
+        Add an nk record with its value and sub key lists.
+        """
+
+        value_list = 0xFFFFFFFF
+        if values:
+            value_list = self.alloc(pack("<%dI" % len(values), *values))
+
+        subkey_list = 0xFFFFFFFF
+        if subkeys:
+            if kind == b"li":
+                subkey_list = self.alloc(
+                    b"li" + pack("<H%dI" % len(subkeys), len(subkeys),
+                                 *subkeys))
+            elif kind == b"ri":
+                half = len(subkeys) // 2
+                parts = [self.alloc(b"li" + pack("<H%dI" % len(part),
+                                                 len(part), *part))
+                         for part in (subkeys[:half], subkeys[half:])]
+                subkey_list = self.alloc(
+                    b"ri" + pack("<H2I", 2, *parts))
+            else:
+                items = []
+                for offset in subkeys:
+                    items.extend((offset, 0))
+                subkey_list = self.alloc(
+                    kind + pack("<H%dI" % len(items), len(subkeys), *items))
+
+        try:
+            encoded = name.encode("ascii")
+            flags = 0x20
+        except UnicodeEncodeError:
+            encoded = name.encode("utf-16-le")
+            flags = 0
+        return self.alloc(
+            b"nk" + pack("<HQII", flags, last_write_time, 0, 0) +
+            pack("<IIIIIIII", len(subkeys), 0, subkey_list, 0xFFFFFFFF,
+                 len(values), value_list, 0xFFFFFFFF, 0xFFFFFFFF) +
+            pack("<5I", 0, 0, 0, 0, 0) + pack("<HH", len(encoded), 0) +
+            encoded)
+
+    def save(self, path_name, root):
+        """
+        Write the base block and the bin.
+        """
+
+        bin_size = (len(self.cells) + 0x20 + 8 + 0xFFF) & ~0xFFF
+        free = bin_size - 0x20 - len(self.cells)
+        cells = bytes(self.cells) + pack("<i", free) + b"\0" * (free - 4)
+        base = b"regf" + pack("<IIQIIIII", 1, 1, 0, 1, 5, 0, 1, root) + \
+            pack("<II", bin_size, 1)
+        base += b"\0" * (0x1000 - len(base))
+        hbin = b"hbin" + pack("<II", 0, bin_size) + b"\0" * 20
+        with open(path_name, "wb") as fileref:
+            fileref.write(base + hbin + cells)
+
+########################################
+
+
+class TestHiveApi(unittest.TestCase):
+    """
+    Test the read only hive backend.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "SOFTWARE")
+
+        builder = HiveBuilder()
+        big = bytes(bytearray(range(256))) * 100
+        values = [
+            builder.value(u"", REG_SZ, u"Default\0".encode("utf-16-le")),
+            builder.value(u"Version", REG_SZ,
+                          u"1.2.3\0".encode("utf-16-le")),
+            builder.value(u"Count", REG_DWORD, pack("<I", 42)),
+            builder.value(u"Large", REG_QWORD, pack("<Q", 1 << 40)),
+            builder.value(u"Paths", REG_MULTI_SZ,
+                          u"a\0b\0".encode("utf-16-le")),
+            builder.value(u"Blob", REG_BINARY, big, True),
+            builder.value(u"Café☃", REG_BINARY, b"\1\2")]
+        leaves = [builder.key(u"Leaf%d" % index, kind=b"li")
+                  for index in range(4)]
+        child = builder.key(u"Child", values, leaves, b"ri",
+                            0x01D1000000000000)
+        other = builder.key(u"Été", subkeys=[], kind=b"lf")
+        self.root = builder.key(u"ROOT", [], [child, other], b"lh")
+        self.big = big
+        builder.save(self.path, self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read(self):
+        """
+        Test reading keys and values.
+        """
+
+        with OpenHive(self.path) as root:
+            self.assertEqual(QueryInfoKey(root)[:2], (2, 0))
+            self.assertEqual(EnumKeys(root), [u"Child", u"Été"])
+
+            with OpenKeyEx(root, u"child") as key:
+                self.assertEqual(
+                    QueryInfoKey(key), (4, 7, 0x01D1000000000000))
+                self.assertEqual(QueryValueEx(key, u"version"),
+                                 (u"1.2.3", REG_SZ))
+                self.assertEqual(QueryValueEx(key, u"Count"),
+                                 (42, REG_DWORD))
+                self.assertEqual(QueryValueEx(key, u"Large"),
+                                 (1 << 40, REG_QWORD))
+                self.assertEqual(QueryValueEx(key, u"Paths"),
+                                 ([u"a", u"b"], REG_MULTI_SZ))
+                self.assertEqual(QueryValueEx(key, u"Blob"),
+                                 (self.big, REG_BINARY))
+                self.assertEqual(QueryValueEx(key, None),
+                                 (u"Default", REG_SZ))
+                self.assertEqual(EnumValue(key, 6),
+                                 (u"Café☃", b"\1\2", REG_BINARY))
+                self.assertEqual(len(EnumValues(key)), 7)
+
+                # Enumeration across an ri list
+                self.assertEqual([EnumKey(key, index) for index in range(4)],
+                                 [u"Leaf%d" % index for index in range(4)])
+                with self.assertRaises(OSError) as context:
+                    EnumKey(key, 4)
+                self.assertEqual(context.exception.winerror,
+                                 ERROR_NO_MORE_ITEMS)
+                with self.assertRaises(OSError):
+                    EnumValue(key, 7)
+                with self.assertRaises(FileNotFoundError):
+                    QueryValueEx(key, u"Missing")
+
+            self.assertEqual(QueryValue(root, u"Child"), u"Default")
+            self.assertEqual(QueryValue(root, u"Child\\Leaf0"), u"")
+            with OpenKey(root, u"CHILD\\leaf3") as key:
+                self.assertEqual(QueryInfoKey(key)[:2], (0, 0))
+            with self.assertRaises(FileNotFoundError):
+                OpenKey(root, u"Child\\Leaf9")
+
+            tree = DumpTree(root)
+            self.assertEqual([item[0] for item in tree], [
+                u"", u"Child", u"Child\\Leaf0", u"Child\\Leaf1",
+                u"Child\\Leaf2", u"Child\\Leaf3", u"Été"])
+            self.assertEqual(len(tree[1][2]), 7)
+            self.assertEqual(len(DumpTree(root, u"Child", 0)), 1)
+
+    def test_handles(self):
+        """
+        Test closing handles and invalid files.
+        """
+
+        root = OpenHive(self.path)
+        key = OpenKey(root, u"Child")
+        hive = root.hive
+        CloseKey(root)
+        self.assertFalse(root)
+        self.assertTrue(key)
+        # The hive stays mapped while a key is open
+        self.assertEqual(EnumKeys(key)[0], u"Leaf0")
+        key.Close()
+        self.assertIsNone(hive.data)
+
+        with self.assertRaises(OSError) as context:
+            EnumKeys(key)
+        self.assertEqual(context.exception.winerror, ERROR_INVALID_HANDLE)
+
+        bad_path = os.path.join(self.tmpdir, "bad")
+        with open(bad_path, "wb") as fileref:
+            fileref.write(b"\0" * 0x2000)
+        with self.assertRaises(OSError) as context:
+            OpenHive(bad_path)
+        self.assertEqual(context.exception.winerror, ERROR_BADDB)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test writing registry hive files
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from struct import unpack_from
+
+# Use abspath() because msys2 only returns the module filename
+# instead of the full path
+
+# Insert the location of wslwinreg at the begining so it's the first
+# to be processed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from wslwinreg.common import REG_SZ, REG_EXPAND_SZ, REG_DWORD, REG_BINARY, \
+    REG_MULTI_SZ, REG_QWORD
+from wslwinreg.hiveapi import OpenHive, OpenKey, EnumKeys, EnumValues, \
+    QueryInfoKey, QueryValueEx, DumpTree
+from wslwinreg.hivewriter import write_hive, parse_reg_file, \
+    write_hive_from_reg
+
+## Contents of a .reg file as written by regedit
+REG_FILE = u"""\ufeffWindows Registry Editor Version 5.00
+
+[HKEY_LOCAL_MACHINE\\SOFTWARE\\Example]
+@="Default"
+"Path"="C:\\\\Program Files\\\\\\"Example\\""
+"Count"=dword:0000002a
+"Data"=hex:01,02,03,\\
+  04,05
+"Expand"=hex(2):25,00,50,00,41,00,54,00,48,00,25,00,00,00
+"List"=hex(7):61,00,00,00,62,00,00,00
+"Big"=hex(b):00,00,00,00,00,01,00,00
+"Gone"=-
+
+; Comment
+[HKEY_LOCAL_MACHINE\\SOFTWARE\\Example\\Sub Key]
+"Name"="Value"
+
+[-HKEY_LOCAL_MACHINE\\SOFTWARE\\Example\\Deleted]
+"Skipped"="Yes"
+
+[HKEY_LOCAL_MACHINE\\SOFTWARE\\Other]
+"Outside"="Yes"
+"""
+
+########################################
+
+
+class TestHiveWriter(unittest.TestCase):
+    """
+    Test building hives and reading them back.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "test.hiv")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        """
+        Test writing a tree and reading it back.
+        """
+
+        big = b"x" * 40000
+        values = [
+            (u"Int Value", 45, REG_DWORD),
+            (u"String Val", u"A string value", REG_SZ),
+            (u"StringExpand", u"The path is %path%", REG_EXPAND_SZ),
+            (u"Multi-string", [u"Lots", u"of", u"values"], REG_MULTI_SZ),
+            (u"Raw Data", b"binary\x00data", REG_BINARY),
+            (u"Big Binary", big, REG_BINARY),
+            (u"Qword Value", 0x1122334455667788, REG_QWORD),
+            (u"Japanese 日本", u"日本語", REG_SZ)]
+        tree = [
+            (u"", 0x01D0000000000000, [(u"", u"Root", REG_SZ)]),
+            (u"Keys\\Values", 0x01D1000000000000, values)]
+        # Enough sub keys to need more than one lh list
+        tree.extend((u"Keys\\Many\\Key%04d" % index, None, [])
+                    for index in range(1500, -1, -1))
+        write_hive(self.path, tree)
+
+        with open(self.path, "rb") as fileref:
+            data = fileref.read()
+        checksum = 0
+        for index in range(0, 0x1FC, 4):
+            checksum ^= unpack_from("<I", data, index)[0]
+        self.assertEqual(checksum, unpack_from("<I", data, 0x1FC)[0])
+        self.assertEqual(unpack_from("<I", data, 0x28)[0], len(data) - 0x1000)
+
+        # Every bin is filled with cells
+        offset = 0x1000
+        while offset < len(data):
+            self.assertEqual(data[offset:offset + 4], b"hbin")
+            size = unpack_from("<I", data, offset + 8)[0]
+            cell = offset + 0x20
+            while cell < offset + size:
+                cell += abs(unpack_from("<i", data, cell)[0])
+            self.assertEqual(cell, offset + size)
+            offset += size
+
+        with OpenHive(self.path) as root:
+            self.assertEqual(QueryValueEx(root, None), (u"Root", REG_SZ))
+            self.assertEqual(QueryInfoKey(root), (1, 1, 0x01D0000000000000))
+            with OpenKey(root, u"keys\\VALUES") as key:
+                self.assertEqual(EnumValues(key), values)
+                self.assertEqual(QueryInfoKey(key)[2], 0x01D1000000000000)
+            with OpenKey(root, u"Keys\\Many") as key:
+                names = EnumKeys(key)
+                self.assertEqual(names, sorted(names))
+                self.assertEqual(len(names), 1501)
+            with OpenKey(root, u"Keys\\Many\\KEY0999"):
+                pass
+
+            # A tree read back writes the same hive
+            tree = DumpTree(root)
+        copy = os.path.join(self.tmpdir, "copy.hiv")
+        write_hive(copy, tree)
+        with OpenHive(copy) as root:
+            self.assertEqual(DumpTree(root), tree)
+
+    def test_reg_file(self):
+        """
+        Test converting a .reg file.
+        """
+
+        entries = parse_reg_file(REG_FILE)
+        self.assertEqual([item[0] for item in entries], [
+            u"HKEY_LOCAL_MACHINE\\SOFTWARE\\Example",
+            u"HKEY_LOCAL_MACHINE\\SOFTWARE\\Example\\Sub Key",
+            u"HKEY_LOCAL_MACHINE\\SOFTWARE\\Other"])
+        self.assertEqual(entries[0][2], [
+            (u"", u"Default", REG_SZ),
+            (u"Path", u"C:\\Program Files\\\"Example\"", REG_SZ),
+            (u"Count", 42, REG_DWORD),
+            (u"Data", b"\1\2\3\4\5", REG_BINARY),
+            (u"Expand", u"%PATH%", REG_EXPAND_SZ),
+            (u"List", [u"a", u"b"], REG_MULTI_SZ),
+            (u"Big", 1 << 40, REG_QWORD)])
+
+        reg_path = os.path.join(self.tmpdir, "test.reg")
+        with open(reg_path, "wb") as fileref:
+            fileref.write(REG_FILE.encode("utf-16"))
+        write_hive_from_reg(self.path, reg_path,
+                            u"HKEY_LOCAL_MACHINE\\Software\\Example")
+        with OpenHive(self.path) as root:
+            self.assertEqual(EnumKeys(root), [u"Sub Key"])
+            self.assertEqual(QueryValueEx(root, u"Count"), (42, REG_DWORD))
+            with OpenKey(root, u"Sub Key") as key:
+                self.assertEqual(QueryValueEx(key, u"Name"),
+                                 (u"Value", REG_SZ))
+
+        with self.assertRaises(ValueError):
+            parse_reg_file(u"Not a registry file")
+
+
+if __name__ == "__main__":
+    unittest.main()
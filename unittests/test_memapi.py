@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the in-memory registry backend
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# FileNotFoundError introduced in Python 3
+if sys.version_info[0] == 2:
+    FileNotFoundError = OSError
+
+# Use abspath() because msys2 only returns the module filename
+# instead of the full path
+
+# Insert the location of wslwinreg at the begining so it's the first
+# to be processed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from wslwinreg.common import ERROR_NO_MORE_ITEMS, HKEY_CLASSES_ROOT, \
+    HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, HKEY_USERS, REG_SZ, REG_DWORD, \
+    REG_BINARY, REG_MULTI_SZ
+from wslwinreg.memapi import CreateKey, OpenKey, CloseKey, DeleteKey, \
+    DeleteValue, EnumKey, EnumKeys, EnumValue, EnumValues, QueryInfoKey, \
+    QueryValue, QueryValueEx, SetValue, SetValueEx, SaveKey, LoadKey, \
+    DumpTree, ExpandEnvironmentStrings, reset_registry, \
+    ERROR_ACCESS_DENIED, ERROR_INVALID_HANDLE, ERROR_KEY_DELETED, \
+    ERROR_ALREADY_EXISTS
+
+########################################
+
+
+class TestMemApi(unittest.TestCase):
+    """
+    Test the in-memory registry.
+    """
+
+    def setUp(self):
+        reset_registry()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        reset_registry()
+        shutil.rmtree(self.tmpdir)
+
+    def test_native_names(self):
+        """
+        Test names given as byte strings on Python 2.
+        """
+
+        with CreateKey(HKEY_CURRENT_USER, "Software\\日本") as key:
+            SetValueEx(key, "名前", 0, REG_SZ, u"Yes")
+        with OpenKey(HKEY_CURRENT_USER, u"Software\\日本") as key:
+            self.assertEqual(QueryValueEx(key, u"名前"), (u"Yes", REG_SZ))
+            self.assertEqual(EnumValue(key, 0)[0], u"名前")
+            DeleteValue(key, "名前")
+            self.assertEqual(QueryInfoKey(key)[1], 0)
+
+    def test_keys(self):
+        """
+        Test creating, enumerating and deleting keys.
+        """
+
+        with CreateKey(HKEY_CURRENT_USER, u"Software\\Test\\b") as key:
+            self.assertEqual(QueryInfoKey(key)[:2], (0, 0))
+        CreateKey(HKEY_CURRENT_USER, u"SOFTWARE\\TEST\\A").Close()
+        CreateKey(HKEY_CURRENT_USER, u"Software\\Test\\Été").Close()
+
+        with OpenKey(HKEY_CURRENT_USER, u"software\\test") as key:
+            self.assertEqual(EnumKeys(key), [u"A", u"b", u"Été"])
+            self.assertEqual(EnumKey(key, 1), u"b")
+            with self.assertRaises(OSError) as context:
+                EnumKey(key, 3)
+            self.assertEqual(context.exception.winerror, ERROR_NO_MORE_ITEMS)
+            names = [item[0] for item in EnumKeys(key, 1, 1, True)]
+            self.assertEqual(names, [u"b"])
+
+        # Keys with sub keys can't be deleted
+        with self.assertRaises(OSError) as context:
+            DeleteKey(HKEY_CURRENT_USER, u"Software\\Test")
+        self.assertEqual(context.exception.winerror, ERROR_ACCESS_DENIED)
+
+        # Open handles to a deleted key fail
+        key = OpenKey(HKEY_CURRENT_USER, u"Software\\Test\\A")
+        DeleteKey(HKEY_CURRENT_USER, u"Software\\Test\\A")
+        with self.assertRaises(OSError) as context:
+            QueryInfoKey(key)
+        self.assertEqual(context.exception.winerror, ERROR_KEY_DELETED)
+        with self.assertRaises(FileNotFoundError):
+            DeleteKey(HKEY_CURRENT_USER, u"Software\\Test\\A")
+
+        # Closed handles fail
+        hkey = int(key)
+        CloseKey(key)
+        self.assertFalse(key)
+        with self.assertRaises(OSError) as context:
+            QueryInfoKey(hkey)
+        self.assertEqual(context.exception.winerror, ERROR_INVALID_HANDLE)
+
+        # HKEY_CLASSES_ROOT is a view of HKLM\SOFTWARE\Classes
+        CreateKey(HKEY_CLASSES_ROOT, u".test").Close()
+        OpenKey(HKEY_LOCAL_MACHINE, u"Software\\Classes\\.TEST").Close()
+
+        reset_registry()
+        with self.assertRaises(FileNotFoundError):
+            OpenKey(HKEY_CURRENT_USER, u"Software\\Test")
+
+    def test_values(self):
+        """
+        Test setting, enumerating and deleting values.
+        """
+
+        with CreateKey(HKEY_CURRENT_USER, u"Software\\Test") as key:
+            SetValueEx(key, u"Zebra", 0, REG_DWORD, 42)
+            SetValueEx(key, u"Apple", 0, REG_MULTI_SZ, [u"a", u"b"])
+            SetValueEx(key, u"zebra", 0, REG_BINARY, b"\1\2")
+            self.assertEqual(EnumValues(key), [
+                (u"zebra", b"\1\2", REG_BINARY),
+                (u"Apple", [u"a", u"b"], REG_MULTI_SZ)])
+            self.assertEqual(EnumValue(key, 1)[0], u"Apple")
+            self.assertEqual(QueryValueEx(key, u"APPLE"),
+                             ([u"a", u"b"], REG_MULTI_SZ))
+
+            self.assertEqual(QueryValue(key, None), u"")
+            SetValue(key, u"Sub", REG_SZ, u"Default")
+            self.assertEqual(QueryValue(key, u"sub"), u"Default")
+            with self.assertRaises(TypeError):
+                SetValue(key, u"Sub", REG_DWORD, 1)
+
+            DeleteValue(key, u"ZEBRA")
+            with self.assertRaises(FileNotFoundError):
+                DeleteValue(key, u"Zebra")
+            with self.assertRaises(FileNotFoundError):
+                QueryValueEx(key, u"Zebra")
+            self.assertEqual(QueryInfoKey(key)[:2], (1, 1))
+
+        os.environ["WSLWINREG_TEST"] = "value"
+        try:
+            self.assertEqual(
+                ExpandEnvironmentStrings(u"%wslwinreg_test%\\%UNKNOWN_VAR%"),
+                u"value\\%UNKNOWN_VAR%")
+        finally:
+            del os.environ["WSLWINREG_TEST"]
+
+    def test_save_and_load(self):
+        """
+        Test saving a key to a hive file and loading it back.
+        """
+
+        with CreateKey(HKEY_CURRENT_USER, u"Software\\Test") as key:
+            SetValueEx(key, None, 0, REG_SZ, u"Root")
+            with CreateKey(key, u"Sub\\Key") as sub_key:
+                SetValueEx(sub_key, u"Count", 0, REG_DWORD, 7)
+            path = os.path.join(self.tmpdir, "test.hiv")
+            SaveKey(key, path)
+            with self.assertRaises(OSError) as context:
+                SaveKey(key, path)
+            self.assertEqual(context.exception.winerror, ERROR_ALREADY_EXISTS)
+            tree = DumpTree(key)
+
+        with self.assertRaises(OSError):
+            LoadKey(HKEY_CURRENT_USER, u"Loaded", path)
+        LoadKey(HKEY_USERS, u"Loaded", path)
+        with OpenKey(HKEY_USERS, u"Loaded") as key:
+            self.assertEqual(DumpTree(key), tree)
+            self.assertEqual(QueryValue(key, None), u"Root")
+
+
+if __name__ == "__main__":
+    unittest.main()
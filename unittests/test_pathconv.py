@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the pathname translators with sample mount tables
+"""
+
+import os
+import sys
+import unittest
+
+# Use abspath() because msys2 only returns the module filename
+# instead of the full path
+
+# Insert the location of wslwinreg at the begining so it's the first
+# to be processed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from wslwinreg.pathconv import LRUCache, WslPathTranslator, \
+    CygwinPathTranslator, parse_proc_mounts, parse_wsl_conf_root, \
+    parse_fstab, parse_mount_output, find_cygdrive_prefix
+
+## /proc/self/mounts from WSL 1
+WSL1_MOUNTS = """\
+rootfs / lxfs rw,noatime 0 0
+none /dev tmpfs rw,noatime,mode=755 0 0
+C:\\134 /mnt/c drvfs rw,noatime,uid=1000,gid=1000,case=off 0 0
+D:\\134 /mnt/d drvfs rw,noatime,uid=1000,gid=1000,case=off 0 0
+drvfs /mnt/x drvfs rw,noatime,uid=1000,gid=1000 0 0
+"""
+
+## /proc/self/mounts from WSL 2
+WSL2_MOUNTS = """\
+/dev/sdc / ext4 rw,relatime,discard,errors=remount-ro,data=ordered 0 0
+C:\\134 /win/c 9p rw,dirsync,noatime,aname=drvfs;path=C:\\134;uid=1000;\
+symlinkroot=/win/,mmap,access=client,msize=262144,trans=virtio 0 0
+drvfs /win/e 9p rw,noatime,dirsync,aname=drvfs;path=E:\\134;uid=1000;\
+gid=1000;symlinkroot=/win/,mmap,access=client,msize=65536,trans=fd 0 0
+\\134\\134server\\134share /mnt/my\\040share 9p rw,aname=drvfs;\
+path=\\\\server\\share 0 0
+"""
+
+## /etc/wsl.conf with a custom automount root
+WSL_CONF = """\
+[automount]
+enabled = true
+root = /win
+options = "metadata"
+"""
+
+## Output of mount on Cygwin
+CYGWIN_MOUNT = """\
+C:/cygwin64/bin on /usr/bin type ntfs (binary,auto)
+C:/cygwin64/lib on /usr/lib type ntfs (binary,auto)
+C:/cygwin64 on / type ntfs (binary,auto)
+C:/Program Files on /opt/programs type ntfs (binary,user)
+C: on /cygdrive/c type ntfs (binary,posix=0,user,noumount,auto)
+D: on /cygdrive/d type udf (binary,posix=0,user,noumount,auto)
+"""
+
+## /etc/fstab of Cygwin
+CYGWIN_FSTAB = """\
+# /etc/fstab
+#
+C:/Program\\040Files /opt/programs ntfs binary 0 0
+none /cygdrive cygdrive binary,posix=0,user 0 0
+"""
+
+## Output of mount on MSYS2
+MSYS2_MOUNT = """\
+C:/msys64 on / type ntfs (binary,noacl,auto)
+C:/msys64/usr/bin on /bin type ntfs (binary,noacl,auto)
+C: on /c type ntfs (binary,noacl,posix=0,user,noumount,auto)
+"""
+
+########################################
+
+
+class TestPathConv(unittest.TestCase):
+    """
+    Test the pathname translators.
+    """
+
+    def test_lru_cache(self):
+        """
+        Test that the least recently used entry is discarded.
+        """
+
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_parse_proc_mounts(self):
+        """
+        Test parsing drvfs and 9p mounts.
+        """
+
+        self.assertEqual(parse_proc_mounts(WSL1_MOUNTS),
+                         [("/mnt/c", "C:\\"), ("/mnt/d", "D:\\")])
+        self.assertEqual(parse_proc_mounts(WSL2_MOUNTS),
+                         [("/win/c", "C:\\"), ("/win/e", "E:\\"),
+                          ("/mnt/my share", "\\\\server\\share\\")])
+
+    def test_parse_wsl_conf_root(self):
+        """
+        Test reading the automount root.
+        """
+
+        self.assertEqual(parse_wsl_conf_root(WSL_CONF), "/win/")
+        self.assertEqual(parse_wsl_conf_root(""), "/mnt/")
+        self.assertEqual(parse_wsl_conf_root("[network]\nhostname = x\n"),
+                         "/mnt/")
+
+    def test_wsl_translator(self):
+        """
+        Test converting to and from Windows pathnames.
+        """
+
+        calls = []
+
+        def fallback(flag, path_name):
+            calls.append((flag, path_name))
+            return "\\\\wsl$\\Ubuntu" + path_name.replace("/", "\\")
+
+        translator = WslPathTranslator(
+            parse_proc_mounts(WSL2_MOUNTS),
+            parse_wsl_conf_root(WSL_CONF), fallback)
+
+        self.assertEqual(translator.to_windows("/win/c"), "C:\\")
+        self.assertEqual(translator.to_windows("/win/c/Windows/Notepad.exe"),
+                         "C:\\Windows\\Notepad.exe")
+        self.assertEqual(translator.to_windows("/mnt/my share/a b"),
+                         "\\\\server\\share\\a b")
+        self.assertEqual(translator.to_windows("C:\\Windows"), "C:\\Windows")
+
+        self.assertEqual(translator.from_windows("C:\\Windows\\Notepad.exe"),
+                         "/win/c/Windows/Notepad.exe")
+        self.assertEqual(translator.from_windows("c:/Windows"),
+                         "/win/c/Windows")
+        self.assertEqual(translator.from_windows("C:\\"), "/win/c/")
+        self.assertEqual(translator.from_windows("E:\\data"), "/win/e/data")
+        self.assertEqual(translator.from_windows("\\\\SERVER\\share\\x"),
+                         "/mnt/my share/x")
+        self.assertEqual(translator.from_windows("/home"), "/home")
+        self.assertEqual(calls, [])
+
+        # Linux files are converted by the fallback, once
+        for _ in range(2):
+            self.assertEqual(translator.to_windows("/home/user"),
+                             "\\\\wsl$\\Ubuntu\\home\\user")
+        self.assertEqual(calls, [("-w", "/home/user")])
+
+    def test_parse_cygwin_tables(self):
+        """
+        Test parsing the Cygwin mount table.
+        """
+
+        self.assertEqual(parse_fstab(CYGWIN_FSTAB),
+                         ([("/opt/programs", "C:\\Program Files")],
+                          "/cygdrive"))
+        mounts = parse_mount_output(CYGWIN_MOUNT)
+        self.assertEqual(mounts[2], ("/", "C:\\cygwin64"))
+        self.assertEqual(mounts[4], ("/cygdrive/c", "C:\\"))
+        self.assertEqual(find_cygdrive_prefix(mounts), "/cygdrive/")
+        self.assertEqual(
+            find_cygdrive_prefix(parse_mount_output(MSYS2_MOUNT)), "/")
+
+    def test_cygwin_translator(self):
+        """
+        Test converting Cygwin pathnames.
+        """
+
+        translator = CygwinPathTranslator(
+            parse_mount_output(CYGWIN_MOUNT), "/cygdrive")
+
+        self.assertEqual(translator.to_windows("/"), "C:\\cygwin64")
+        self.assertEqual(translator.to_windows("/home/user/a.txt"),
+                         "C:\\cygwin64\\home\\user\\a.txt")
+        self.assertEqual(translator.to_windows("/usr/bin/ls"),
+                         "C:\\cygwin64\\bin\\ls")
+        self.assertEqual(translator.to_windows("/opt/programs/x y"),
+                         "C:\\Program Files\\x y")
+        self.assertEqual(translator.to_windows("/cygdrive/c"), "C:\\")
+        self.assertEqual(translator.to_windows("/cygdrive/e/data"),
+                         "E:\\data")
+
+        self.assertEqual(translator.from_windows("C:\\cygwin64"), "/")
+        self.assertEqual(translator.from_windows("c:\\Cygwin64\\tmp"),
+                         "/tmp")
+        self.assertEqual(translator.from_windows("C:\\cygwin64\\bin\\ls"),
+                         "/usr/bin/ls")
+        self.assertEqual(translator.from_windows("C:\\Windows"),
+                         "/cygdrive/c/Windows")
+        self.assertEqual(translator.from_windows("C:/Windows/"),
+                         "/cygdrive/c/Windows/")
+        self.assertEqual(translator.from_windows("E:\\"), "/cygdrive/e/")
+        self.assertIsNone(translator.from_windows("\\\\server\\share"))
+
+    def test_msys2_translator(self):
+        """
+        Test converting MSYS2 pathnames, which use / as the cygdrive prefix.
+        """
+
+        mounts = parse_mount_output(MSYS2_MOUNT)
+        translator = CygwinPathTranslator(mounts, find_cygdrive_prefix(mounts))
+
+        self.assertEqual(translator.to_windows("/c/Users"), "C:\\Users")
+        self.assertEqual(translator.to_windows("/usr/include"),
+                         "C:\\msys64\\usr\\include")
+        self.assertEqual(translator.to_windows("/bin/sh"),
+                         "C:\\msys64\\usr\\bin\\sh")
+        self.assertEqual(translator.from_windows("C:\\Users"), "/c/Users")
+        self.assertEqual(translator.from_windows("C:\\msys64\\home"), "/home")
+
+    def test_translate_many(self):
+        """
+        Test converting lists with one call to the batch fallback.
+        """
+
+        calls = []
+
+        def batch_fallback(flag, path_names):
+            calls.append((flag, path_names))
+            return [None if "bad" in path_name else "\\\\srv" + path_name
+                    for path_name in path_names]
+
+        translator = WslPathTranslator(
+            parse_proc_mounts(WSL1_MOUNTS), batch_fallback=batch_fallback)
+
+        self.assertEqual(
+            translator.to_windows_many(
+                iter(["/mnt/c/a", "/home/x", "/bad", "/home/x", "D:\\b"])),
+            ["C:\\a", "\\\\srv/home/x", None, "\\\\srv/home/x", "D:\\b"])
+        self.assertEqual(calls, [("-w", ["/home/x", "/bad"])])
+
+        # Converted names are cached, failures are retried
+        self.assertEqual(translator.to_windows_many(["/home/x", "/bad"]),
+                         ["\\\\srv/home/x", None])
+        self.assertEqual(calls[1], ("-w", ["/bad"]))
+
+        self.assertEqual(
+            translator.from_windows_many(["C:\\a", "/tmp", "E:\\"]),
+            ["/mnt/c/a", "/tmp", "/mnt/e/"])
+        self.assertEqual(len(calls), 2)
+
+########################################
+
+
+if __name__ == "__main__":
+    unittest.main()
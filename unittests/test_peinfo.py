@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test reading version resources from generated PE files
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from struct import pack
+
+# Use abspath() because msys2 only returns the module filename
+# instead of the full path
+
+# Insert the location of wslwinreg at the begining so it's the first
+# to be processed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+import wslwinreg
+from wslwinreg.common import read_json_file
+from wslwinreg.filescan import scan_file_info, get_scan_cache_path
+from wslwinreg.peinfo import VS_FFI_SIGNATURE, get_file_info, \
+    get_file_info_all, parse_version_info, read_version_info, \
+    read_version_resource
+
+########################################
+
+
+def make_node(key, value=b"", text=False, children=()):
+    """
+    Build a node of a VS_VERSIONINFO tree.
+    """
+
+    data = pack("<HHH", 0, len(value) // 2 if text else len(value),
+                1 if text else 0) + (key + u"\0").encode("utf-16-le")
+    data += b"\0" * (-len(data) & 3) + value
+    for child in children:
+        data += b"\0" * (-len(data) & 3) + child
+    return pack("<H", len(data)) + data[2:]
+
+
+def make_version_info(strings, translations, file_version=(1, 2, 3, 4)):
+    """
+    Build a VS_VERSIONINFO resource.
+
+    Args:
+        strings: dict of string table name to dict of strings.
+        translations: list of (language, codepage) tuples.
+        file_version: Four part file version.
+    """
+
+    fixed = pack("<13I", VS_FFI_SIGNATURE, 0x10000,
+                 (file_version[0] << 16) | file_version[1],
+                 (file_version[2] << 16) | file_version[3],
+                 0x50000, 0, 0x3f, 0, 0x40004, 1, 0, 0, 0)
+    tables = [make_node(name, children=[
+        make_node(key, (value + u"\0").encode("utf-16-le"), True)
+        for key, value in sorted(items.items())])
+        for name, items in sorted(strings.items())]
+    var = make_node(u"Translation", b"".join(
+        pack("<HH", *item) for item in translations))
+    return make_node(u"VS_VERSION_INFO", fixed, children=[
+        make_node(u"StringFileInfo", children=tables),
+        make_node(u"VarFileInfo", children=[var])])
+
+
+def make_pe(version_info, pe32_plus=True):
+    """
+    Build a PE file with a single .rsrc section holding a version resource.
+    """
+
+    # Resource directories for type, name and language, then the data
+    rsrc = pack("<12xHH", 0, 1) + pack("<II", 16, 0x80000018)
+    rsrc += pack("<12xHH", 0, 1) + pack("<II", 1, 0x80000030)
+    rsrc += pack("<12xHH", 0, 1) + pack("<II", 0x409, 0x48)
+    rsrc += pack("<IIII", 0x1000 + 0x58, len(version_info), 0, 0)
+    rsrc += version_info
+
+    optional_size = 240 if pe32_plus else 224
+    directories = 112 if pe32_plus else 96
+    optional = bytearray(optional_size)
+    optional[0:2] = pack("<H", 0x20b if pe32_plus else 0x10b)
+    optional[directories - 4:directories] = pack("<I", 16)
+    optional[directories + 16:directories + 24] = pack(
+        "<II", 0x1000, len(rsrc))
+
+    data = bytearray(0x40)
+    data[0:2] = b"MZ"
+    data[0x3C:0x40] = pack("<I", 0x40)
+    data += b"PE\0\0" + pack("<HHIIIHH", 0x8664, 1, 0, 0, 0,
+                             optional_size, 0x22)
+    data += optional
+    data += pack("<8sIIIIIIHHI", b".rsrc", len(rsrc), 0x1000, len(rsrc),
+                 0x200, 0, 0, 0, 0, 0x40000040)
+    data += bytearray(0x200 - len(data))
+    data += rsrc
+    return bytes(data)
+
+########################################
+
+
+class TestPEInfo(unittest.TestCase):
+    """
+    Test the PE version resource reader.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_file(self, name, data):
+        """
+        Write a file in the temporary folder and return its pathname.
+        """
+
+        path_name = os.path.join(self.temp_dir, name)
+        with open(path_name, "wb") as fileref:
+            fileref.write(data)
+        return path_name
+
+    def test_parse_version_info(self):
+        """
+        Test parsing a VS_VERSIONINFO resource.
+        """
+
+        info = parse_version_info(make_version_info(
+            {u"040904B0": {u"FileVersion": u"1.2.3.4",
+                           u"CompanyName": u"Café"},
+             u"040704b0": {u"FileVersion": u"eins"}},
+            [(0x409, 1200), (0x407, 1200)]))
+        self.assertEqual(info.translations, [(0x409, 1200), (0x407, 1200)])
+        self.assertEqual(info.fixed["FileVersionMS"], 0x10002)
+        self.assertEqual(info.fixed["FileVersionLS"], 0x30004)
+        self.assertEqual(info.string_tables["040704b0"],
+                         {u"FileVersion": u"eins"})
+        self.assertEqual(info.query(u"FileVersion"), u"1.2.3.4")
+        self.assertEqual(info.query(u"CompanyName"), u"Café")
+        self.assertEqual(info.query(u"fileversion"), u"1.2.3.4")
+        self.assertEqual(info.query(u"COMPANYNAME"), u"Café")
+        self.assertIsNone(info.query(u"ProductName"))
+
+        with self.assertRaises(ValueError):
+            parse_version_info(make_node(u"Something"))
+
+    def test_get_file_info(self):
+        """
+        Test reading PE32 and PE32+ files.
+        """
+
+        version_info = make_version_info(
+            {u"040904b0": {u"ProductVersion": u"10.0"}}, [(0x409, 1200)])
+        for pe32_plus in (True, False):
+            path_name = self.write_file(
+                "test.exe", make_pe(version_info, pe32_plus))
+            self.assertEqual(get_file_info(path_name, u"ProductVersion"),
+                             u"10.0")
+            self.assertIsNone(get_file_info(path_name, u"FileVersion"))
+            self.assertEqual(read_version_resource(path_name), version_info)
+
+        # Not a PE file, missing or empty
+        self.assertIsNone(read_version_info(
+            self.write_file("text.exe", b"MZ" + b"\0" * 100)))
+        self.assertIsNone(read_version_info(self.write_file("empty.dll", b"")))
+        self.assertIsNone(read_version_info(
+            os.path.join(self.temp_dir, "missing.dll")))
+        self.assertIsNone(read_version_resource(
+            self.write_file("empty.dll", b"")))
+
+    def test_get_file_info_all(self):
+        """
+        Test reading every string and the numeric versions at once.
+        """
+
+        strings = {u"040904b0": {u"FileVersion": u"1.2.3.4",
+                                 u"ProductName": u"Test"},
+                   u"040704b0": {u"ProductName": u"Prüfung"}}
+        path_name = self.write_file("test.dll", make_pe(make_version_info(
+            strings, [(0x409, 1200), (0x407, 1200)], (10, 0, 19041, 1))))
+
+        info = get_file_info_all(path_name)
+        self.assertEqual(info["strings"], strings)
+        self.assertEqual(info["translations"], [(0x409, 1200), (0x407, 1200)])
+        self.assertEqual(info["file_version"], (10, 0, 19041, 1))
+        self.assertEqual(info["product_version"], (5, 0, 0, 0))
+        self.assertEqual(info["fixed"]["FileOS"], 0x40004)
+
+        self.assertIsNone(get_file_info_all(self.write_file("empty.dll", b"")))
+
+    def test_scan_file_info(self):
+        """
+        Test scanning a folder with the cache.
+        """
+
+        cache_home = os.environ.get("XDG_CACHE_HOME")
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.temp_dir, "cache")
+        folder = os.path.join(self.temp_dir, "bin")
+        os.makedirs(os.path.join(folder, "sub"))
+        for index in range(6):
+            self.write_file(
+                os.path.join("bin", "sub" if index & 1 else "",
+                             "file{}.dll".format(index)),
+                make_pe(make_version_info(
+                    {u"040904b0": {u"FileVersion": u"1.{}".format(index)}},
+                    [(0x409, 1200)])))
+        self.write_file(os.path.join("bin", "readme.txt"), b"text")
+        self.write_file(os.path.join("bin", "plain.exe"), b"MZ")
+
+        read = []
+        get_file_info_all = wslwinreg.get_file_info_all
+
+        def counting(path_name):
+            read.append(path_name)
+            return get_file_info_all(path_name)
+
+        wslwinreg.get_file_info_all = counting
+        try:
+            result = scan_file_info(folder, ["FileVersion"], workers=3)
+            self.assertEqual(len(result), 7)
+            self.assertEqual(
+                result[os.path.join(folder, "sub", "file3.dll")],
+                {"FileVersion": u"1.3"})
+            self.assertIsNone(result[os.path.join(folder, "plain.exe")])
+            self.assertEqual(len(read), 7)
+
+            # Only the changed file is read again
+            changed = self.write_file(
+                os.path.join("bin", "file0.dll"), make_pe(make_version_info(
+                    {u"040904b0": {u"FileVersion": u"2.0"}},
+                    [(0x409, 1200)], (2, 0, 0, 0))))
+            os.utime(changed, (1, 1))
+            result = scan_file_info(folder)
+            self.assertEqual(read[7:], [changed])
+            self.assertEqual(result[changed]["file_version"], (2, 0, 0, 0))
+            self.assertEqual(
+                result[os.path.join(folder, "file2.dll")]["translations"],
+                [(0x409, 1200)])
+
+            # Names are matched like get_file_info() does
+            result = scan_file_info(folder, ["fileversion"])
+            self.assertEqual(result[changed], {"fileversion": u"2.0"})
+            self.assertEqual(len(read), 8)
+
+            # Deleted files are dropped from the cache
+            deleted = os.path.join(folder, "sub", "file1.dll")
+            os.remove(deleted)
+            self.assertIn(deleted, read_json_file(
+                get_scan_cache_path())["files"])
+            result = scan_file_info(folder)
+            self.assertNotIn(deleted, result)
+            entries = read_json_file(get_scan_cache_path())["files"]
+            self.assertNotIn(deleted, entries)
+            self.assertEqual(len(entries), 6)
+            self.assertEqual(len(read), 8)
+        finally:
+            wslwinreg.get_file_info_all = get_file_info_all
+            if cache_home is None:
+                del os.environ["XDG_CACHE_HOME"]
+            else:
+                os.environ["XDG_CACHE_HOME"] = cache_home
+
+########################################
+
+
+if __name__ == "__main__":
+    unittest.main()
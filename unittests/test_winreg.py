@@ -196,6 +196,9 @@ class BaseWinregTests(unittest.TestCase):
                 index = index + 1
             self.assertEqual(index, len(test_data),
                              "Didn't read the correct number of items")
+            # Check I can enumerate over the values in a single call.
+            self.assertEqual(sorted(EnumValues(sub_key)), sorted(test_data),
+                             "Didn't read back the correct test data")
             # Check I can directly access each item
             for value_name, value_data, value_type in test_data:
                 read_val, read_typ = QueryValueEx(sub_key, value_name)
@@ -212,6 +215,16 @@ class BaseWinregTests(unittest.TestCase):
             self.fail("Was able to get a second key when I only have one!")
         except OSError:
             pass
+        # Enumerate our main key in a single call.
+        self.assertEqual(EnumKeys(key), [subkeystr],
+                         "Read subkey list wrong")
+        self.assertEqual(EnumKeys(key, 1), [],
+                         "Was able to get a second key when I only have one!")
+        read_val, last_write_time = EnumKeys(key, 0, 1, True)[0]
+        self.assertEqual(read_val, subkeystr, "Read subkey value wrong")
+        with OpenKey(key, subkeystr) as sub_key:
+            self.assertEqual(last_write_time, QueryInfoKey(sub_key)[2],
+                             "Read subkey last write time wrong")
 
         key.Close()
 
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test the parts of wslapi that don't need Windows
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import threading
+import unittest
+
+# FileNotFoundError introduced in Python 3
+if sys.version_info[0] == 2:
+    FileNotFoundError = OSError
+
+# Use abspath() because msys2 only returns the module filename
+# instead of the full path
+
+# Insert the location of wslwinreg at the begining so it's the first
+# to be processed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from wslwinreg.common import HKEY_CURRENT_USER, REG_SZ, read_json_file
+
+# wslapi replaces WindowsError, so leave it alone on Windows
+if sys.platform != "win32":
+    from wslwinreg import wslapi
+else:
+    wslapi = None
+
+TEST_KEY = u"Software\\Python Registry Test Batch"
+
+########################################
+
+
+@unittest.skipIf(wslapi is None, "wslapi isn't used on Windows")
+class TestExeCache(unittest.TestCase):
+    """
+    Test caching the location of the installed bridge exe.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.tmpdir, "cache")
+        self.previous = (wslapi._WIN_DIR, wslapi.find_windows_boot_drive,
+                         wslapi.get_windows_user, shutil.copy)
+
+        # Packaged exe, and a boot drive to install it on
+        wslapi._WIN_DIR = os.path.join(self.tmpdir, "bin")
+        os.mkdir(wslapi._WIN_DIR)
+        self.origin_path = os.path.join(
+            wslapi._WIN_DIR, "backend-" + wslapi._EXESUFFIX + ".exe")
+        self.write_origin(b"MZ first")
+        boot = os.path.join(self.tmpdir, "c")
+        os.makedirs(os.path.join(boot, "Users", "user"))
+        self.bridge_path = os.path.join(
+            boot, "Users", "user", ".wslwinreg",
+            os.path.basename(self.origin_path))
+
+        # Count the slow lookups of the Windows user
+        self.lookups = 0
+
+        def get_windows_user():
+            self.lookups += 1
+            return "user"
+
+        wslapi.find_windows_boot_drive = lambda: boot
+        wslapi.get_windows_user = get_windows_user
+
+    def tearDown(self):
+        wslapi._WIN_DIR, wslapi.find_windows_boot_drive, \
+            wslapi.get_windows_user, shutil.copy = self.previous
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+
+    def write_origin(self, data, age=0):
+        """
+        Replace the packaged exe.
+        """
+        with open(self.origin_path, "wb") as fileref:
+            fileref.write(data)
+        mtime = time.time() - age
+        os.utime(self.origin_path, (mtime, mtime))
+
+    def read_bridge(self):
+        """
+        Return the contents of the installed exe.
+        """
+        with open(self.bridge_path, "rb") as fileref:
+            return fileref.read()
+
+    def test_cache(self):
+        """
+        The record is used until the packaged exe changes.
+        """
+
+        # Miss, the exe is installed and the record written
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+        self.assertEqual(self.read_bridge(), b"MZ first")
+        self.assertEqual(self.lookups, 1)
+        record = read_json_file(wslapi.get_cache_path())
+        self.assertEqual(record["bridge_path"], self.bridge_path)
+
+        # Hit, no lookup
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+        self.assertEqual(self.lookups, 1)
+
+        # Stale, a new exe is installed and the record rewritten
+        self.write_origin(b"MZ second one", 100)
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+        self.assertEqual(self.read_bridge(), b"MZ second one")
+        self.assertEqual(self.lookups, 2)
+        self.assertNotEqual(
+            read_json_file(wslapi.get_cache_path())["bridge_size"],
+            record["bridge_size"])
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+        self.assertEqual(self.lookups, 2)
+
+        # A changed copy of the same size is checked and replaced
+        with open(self.bridge_path, "wb") as fileref:
+            fileref.write(b"MZ second two")
+        mtime = time.time() - 200
+        os.utime(self.bridge_path, (mtime, mtime))
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+        self.assertEqual(self.read_bridge(), b"MZ second one")
+        self.assertEqual(self.lookups, 3)
+
+        # A deleted copy is installed again
+        os.remove(self.bridge_path)
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+        self.assertEqual(self.read_bridge(), b"MZ second one")
+        self.assertEqual(self.lookups, 4)
+
+    def test_copy_failure(self):
+        """
+        An old copy that can't be replaced is used but not cached.
+        """
+
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+
+        def copy(source, destination):
+            raise IOError("Text file busy")
+
+        # Same size, so a cached record would vouch for the old copy
+        shutil.copy = copy
+        self.write_origin(b"MZ other", 100)
+        for lookups in (2, 3):
+            self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+            self.assertEqual(self.read_bridge(), b"MZ first")
+            self.assertEqual(self.lookups, lookups)
+
+        # Once it can be replaced, it is
+        shutil.copy = self.previous[3]
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+        self.assertEqual(self.read_bridge(), b"MZ other")
+        self.assertEqual(wslapi.get_exe_path(), self.bridge_path)
+        self.assertEqual(self.lookups, 4)
+
+        # Without an installed copy, the failure is raised
+        os.remove(self.bridge_path)
+        self.write_origin(b"MZ third", 200)
+        shutil.copy = copy
+        self.assertRaises(IOError, wslapi.get_exe_path)
+
+########################################
+
+
+@unittest.skipIf(wslapi is None, "wslapi isn't used on Windows")
+class TestBatch(unittest.TestCase):
+    """
+    Test batches of calls against the Python bridge server.
+    """
+
+    def setUp(self):
+        self.environ = dict(os.environ)
+        os.environ["WSLWINREG_BRIDGE"] = "python"
+        os.environ.pop("WSLWINREG_BROKER", None)
+        self.previous = (wslapi._BRIDGES, wslapi._POOL_STATE)
+        wslapi._BRIDGES = wslapi._start_bridges()
+        wslapi._POOL_STATE = threading.local()
+
+        # Record the number of commands in every write
+        self.sends = []
+        bridge = wslapi._bridge()
+        send = bridge.send
+
+        def counting_send(buffers):
+            self.sends.append(len(buffers))
+            return send(buffers)
+
+        bridge.send = counting_send
+
+        self.key = wslapi.CreateKey(HKEY_CURRENT_USER, TEST_KEY)
+        for name in (u"A", u"B", u"C"):
+            wslapi.SetValueEx(self.key, name, 0, REG_SZ, name.lower())
+        del self.sends[:]
+
+    def tearDown(self):
+        self.key.Close(wait=True)
+        wslapi.DeleteKey(HKEY_CURRENT_USER, TEST_KEY)
+        for bridge in wslapi._BRIDGES:
+            bridge.close()
+        wslapi._BRIDGES, wslapi._POOL_STATE = self.previous
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def test_limits(self):
+        """
+        The queue is sent once a limit is reached, and the rest on exit.
+        """
+
+        with wslapi.Batch(max_commands=2) as batch:
+            futures = [batch.call(wslapi.QueryValueEx, self.key, name)
+                       for name in (u"A", u"B", u"C")]
+            self.assertEqual(self.sends, [2])
+            self.assertTrue(futures[1].done())
+            self.assertFalse(futures[2].done())
+        self.assertEqual(self.sends, [2, 1])
+        self.assertEqual([future.result() for future in futures],
+                         [(u"a", REG_SZ), (u"b", REG_SZ), (u"c", REG_SZ)])
+
+        del self.sends[:]
+        with wslapi.Batch(max_bytes=1) as batch:
+            for name in (u"A", u"B", u"C"):
+                batch.call(wslapi.QueryValueEx, self.key, name)
+            self.assertEqual(self.sends, [1, 1])
+        self.assertEqual(self.sends, [1, 1, 1])
+        self.assertEqual(batch.results(),
+                         [(u"a", REG_SZ), (u"b", REG_SZ), (u"c", REG_SZ)])
+
+    def test_result_flushes(self):
+        """
+        Asking a pending future for its result sends the batch.
+        """
+
+        with wslapi.Batch() as batch:
+            first = batch.call(wslapi.QueryValueEx, self.key, u"A")
+            second = batch.call(wslapi.QueryValueEx, self.key, u"B")
+            self.assertEqual(self.sends, [])
+            self.assertEqual(first.result(), (u"a", REG_SZ))
+            self.assertTrue(second.done())
+            self.assertEqual(self.sends, [2])
+            third = batch.call(wslapi.QueryValueEx, self.key, u"C")
+            self.assertFalse(third.done())
+        self.assertEqual(self.sends, [2, 1])
+        self.assertEqual(third.result(), (u"c", REG_SZ))
+
+    def test_exceptions(self):
+        """
+        A failing call only fails its own future.
+        """
+
+        with wslapi.Batch() as batch:
+            missing = batch.call(wslapi.QueryValueEx, self.key, u"Missing")
+            found = batch.call(wslapi.QueryValueEx, self.key, u"A")
+            no_key = batch.call(wslapi.OpenKey, HKEY_CURRENT_USER,
+                                TEST_KEY + u"\\Missing")
+        self.assertEqual(self.sends, [3])
+        self.assertIsInstance(missing.exception(), FileNotFoundError)
+        self.assertRaises(FileNotFoundError, missing.result)
+        self.assertEqual(found.result(), (u"a", REG_SZ))
+        self.assertIsNone(found.exception())
+        self.assertRaises(FileNotFoundError, no_key.result)
+        self.assertRaises(FileNotFoundError, batch.results)
+
+########################################
+
+
+@unittest.skipIf(wslapi is None, "wslapi isn't used on Windows")
+class TestLazyStart(unittest.TestCase):
+    """
+    Test the bridge is started on first use.
+    """
+
+    def setUp(self):
+        self.previous = (wslapi._BRIDGES, wslapi._BRIDGES_ERROR,
+                         wslapi._POOL_STATE, wslapi._start_bridges)
+        wslapi._BRIDGES = None
+        wslapi._BRIDGES_ERROR = None
+        wslapi._POOL_STATE = threading.local()
+
+    def tearDown(self):
+        wslapi._BRIDGES, wslapi._BRIDGES_ERROR, wslapi._POOL_STATE, \
+            wslapi._start_bridges = self.previous
+
+    def test_import(self):
+        """
+        Importing doesn't launch the bridge.
+        """
+
+        environ = dict(os.environ, WSLWINREG_BRIDGE="/nonexistent/bridge")
+        output = subprocess.check_output(
+            (sys.executable, "-c",
+             "from wslwinreg import wslapi; print(wslapi._BRIDGES)"),
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=environ, universal_newlines=True)
+        self.assertEqual(output.strip(), "None")
+
+    def test_failure_is_remembered(self):
+        """
+        A failed start is raised again without another attempt.
+        """
+
+        attempts = []
+
+        def start_bridges():
+            attempts.append(time.time())
+            raise OSError("Failure to connect with bridging executable")
+
+        wslapi._start_bridges = start_bridges
+        for _ in range(3):
+            self.assertRaises(OSError, wslapi._bridge)
+        self.assertEqual(len(attempts), 1)
+        self.assertIsNone(wslapi._BRIDGES)
+
+
+if __name__ == "__main__":
+    unittest.main()
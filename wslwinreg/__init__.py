@@ -29,16 +29,18 @@ Linux.
 # - \ref wslwinreg.cygwinapi
 # - \ref wslwinreg.wslapi
 # - \ref wslwinreg.nullapi
+# - \ref wslwinreg.memapi
+# - \ref wslwinreg.bridgeserver
+# - \ref wslwinreg.bridgebench
+# - \ref wslwinreg.broker
 # - \ref wslwinreg.WinRegKey
 #
 
-import itertools
-
 # pylint: disable=useless-object-inheritance
 # pylint: disable=invalid-name
 # pylint: disable=possibly-used-before-assignment
 
-from .common import IS_CYGWIN, IS_MSYS, IS_WSL, ERROR_SUCCESS, \
+from .common import IS_CYGWIN, IS_MSYS, IS_WSL, IS_MEMORY, ERROR_SUCCESS, \
     ERROR_FILE_NOT_FOUND, ERROR_MORE_DATA, HKEY_CLASSES_ROOT, \
     HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, HKEY_USERS, HKEY_PERFORMANCE_DATA, \
     HKEY_CURRENT_CONFIG, HKEY_DYN_DATA, KEY_QUERY_VALUE, KEY_SET_VALUE, \
@@ -60,7 +62,7 @@ from .common import IS_CYGWIN, IS_MSYS, IS_WSL, ERROR_SUCCESS, \
     FORMAT_MESSAGE_MAX_WIDTH_MASK, LANG_NEUTRAL, LPCVOID, BOOL, WORD, DWORD, \
     PDWORD, LPDWORD, QWORD, PQWORD, LPQWORD, LONG, PLONG, PBYTE, LPBYTE, \
     LPSTR, LPWSTR, LPCWSTR, HANDLE, HKEY, PHKEY, HLOCAL, REGSAM, FILETIME, \
-    PFILETIME, SUBLANG_DEFAULT
+    PFILETIME, SUBLANG_DEFAULT, RegistryFuture
 
 ## Numeric version
 __numversion__ = (1, 1, 2)
@@ -92,31 +94,50 @@ __copyright__ = "Copyright 2020-2025 Rebecca Ann Heineman"
 # Load in the proper implementation based on the
 # underlying operating system
 
-if IS_CYGWIN or IS_MSYS:
+if IS_MEMORY:
+    from .memapi import CloseKey, ConnectRegistry, CreateKey, CreateKeyEx, \
+        DeleteKey, DeleteKeyEx, DeleteValue, EnumKey, EnumValue, \
+        ExpandEnvironmentStrings, FlushKey, LoadKey, OpenKey, OpenKeyEx, \
+        QueryInfoKey, QueryValue, QueryValueEx, SaveKey, SetValue, SetValueEx, \
+        DisableReflectionKey, EnableReflectionKey, QueryReflectionKey, \
+        get_file_info, get_file_info_all, convert_to_windows_path, \
+        convert_from_windows_path, convert_to_windows_paths, \
+        convert_from_windows_paths, DumpTree, EnumKeys, EnumValues
+    from .common import Batch
+elif IS_CYGWIN or IS_MSYS:
     from .cygwinapi import CloseKey, ConnectRegistry, CreateKey, CreateKeyEx, \
         DeleteKey, DeleteKeyEx, DeleteValue, EnumKey, EnumValue, \
         ExpandEnvironmentStrings, FlushKey, LoadKey, OpenKey, OpenKeyEx, \
         QueryInfoKey, QueryValue, QueryValueEx, SaveKey, SetValue, SetValueEx, \
         DisableReflectionKey, EnableReflectionKey, QueryReflectionKey, \
-        get_file_info, convert_to_windows_path, convert_from_windows_path
+        get_file_info, get_file_info_all, convert_to_windows_path, \
+        convert_from_windows_path, convert_to_windows_paths, \
+        convert_from_windows_paths, DumpTree, EnumKeys, EnumValues
+    from .common import Batch
 elif IS_WSL:
     from .wslapi import CloseKey, ConnectRegistry, CreateKey, CreateKeyEx, \
         DeleteKey, DeleteKeyEx, DeleteValue, EnumKey, EnumValue, \
         ExpandEnvironmentStrings, FlushKey, LoadKey, OpenKey, OpenKeyEx, \
         QueryInfoKey, QueryValue, QueryValueEx, SaveKey, SetValue, SetValueEx, \
         DisableReflectionKey, EnableReflectionKey, QueryReflectionKey, \
-        get_file_info, convert_to_windows_path, convert_from_windows_path
+        get_file_info, get_file_info_all, convert_to_windows_path, \
+        convert_from_windows_path, convert_to_windows_paths, \
+        convert_from_windows_paths, DumpTree, EnumKeys, EnumValues, Batch
 else:
-    from .nullapi import convert_to_windows_path, convert_from_windows_path
+    from .nullapi import convert_to_windows_path, convert_from_windows_path, \
+        convert_to_windows_paths, convert_from_windows_paths
+    from .common import Batch
     try:
         # Attempt importing the current name
         from winreg import *
-        from .cygwinapi import get_file_info
+        from .cygwinapi import get_file_info, get_file_info_all, DumpTree, \
+            EnumKeys, EnumValues
     except ImportError:
         try:
             # Attempt importing the old name
             from _winreg import *   # type: ignore
-            from .cygwinapi import get_file_info
+            from .cygwinapi import get_file_info, get_file_info_all, \
+                DumpTree, EnumKeys, EnumValues
         except ImportError:
             # For unsupported platforms, create null apis that always
             # throw exceptions when called
@@ -125,7 +146,34 @@ else:
                 EnumValue, ExpandEnvironmentStrings, FlushKey, LoadKey, \
                 OpenKey, OpenKeyEx, QueryInfoKey, QueryValue, QueryValueEx, \
                 SaveKey, SetValue, SetValueEx, DisableReflectionKey, \
-                EnableReflectionKey, QueryReflectionKey, get_file_info
+                EnableReflectionKey, QueryReflectionKey, get_file_info, \
+                get_file_info_all, DumpTree, EnumKeys, EnumValues
+
+from .filescan import scan_file_info
+
+########################################
+
+
+def batch():
+    """
+    Create a Batch to issue many registry calls at once.
+
+    On Windows Subsystem for Linux, the queued calls are sent to the bridge
+    together and the replies are read back in order, so the whole batch costs
+    a single round trip instead of one per call. On other platforms, the calls
+    are issued immediately.
+
+    @code
+        with wslwinreg.batch() as b:
+            version = b.call(QueryValueEx, key, "Version")
+            path = b.call(QueryValueEx, key, "Path")
+        print(version.result(), path.result())
+    @endcode
+
+    Returns:
+        A new Batch object, usable as a context manager.
+    """
+    return Batch()
 
 ########################################
 
@@ -200,21 +248,18 @@ class WinRegKey(object):
         """
         Return the list of all of the sub key names.
 
-        Iterate over all of the sub keys and place their names in a list.
-        Return the list. Unicode is properly handled.
+        All of the sub key names are retrieved with a single call to
+        EnumKeys(). Unicode is properly handled.
 
         Returns:
             list of names of all the subkeys.
         """
-        subkey_names = []
         try:
-            for item in itertools.count():
-                subkey_names.append(EnumKey(self.key, item))
+            return EnumKeys(self.key)
 
-        # Exception is fired once the list end is reached
+        # Keys that can't be enumerated have no visible sub keys
         except OSError:
-            pass
-        return subkey_names
+            return []
 
     def get_value(self, value_name=None):
         """
@@ -246,19 +291,61 @@ class WinRegKey(object):
         Return a dict of all key name and associated values.
 
         Returns:
-            dict with each item is the returned value from QueryValueEx()
+            dict with each item is the returned value from get_value()
+        """
+        return dict(self.iter_values())
+
+    def iter_values(self, chunk_size=256):
+        """
+        Iterate over all of the values of this key.
+
+        The names, data and types are read with a single call to
+        EnumValues() and converted like get_value() does. REG_EXPAND_SZ
+        values are expanded with one batch per chunk_size values.
+
+        Args:
+            chunk_size: Number of values to convert at a time.
+        Returns:
+            Iterator of (name, (value, value_type)) tuples.
         """
-        value_names = []
-        try:
-            for i in itertools.count():
-                value_names.append(EnumValue(self.key, i))
 
-        # Exception is fired once the list end is reached
+        # Keys that can't be enumerated have no visible values
+        try:
+            values = EnumValues(self.key)
         except OSError:
-            pass
+            return
+
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+
+            # Expand all of the strings in this chunk at once
+            with batch() as expanded:
+                expansions = [
+                    expanded.call(ExpandEnvironmentStrings, value)
+                    if value_type == REG_EXPAND_SZ else None
+                    for _, value, value_type in chunk]
+
+            for (name, value, value_type), expansion in zip(
+                    chunk, expansions):
+                if value_type == REG_SZ:
+                    # Failsafe, truncate at null
+                    index = value.find("\0")
+                    if index != -1:
+                        value = value[:index]
+                elif value_type == REG_EXPAND_SZ:
+                    value = expansion.result()
+                yield (name, (value, value_type))
+
+    def dump(self, max_depth=None):
+        """
+        Read this key and all of its sub keys and values in one call.
 
-        # Convert the list to a dict
-        return {k[0]: self.get_value(k[0]) for k in value_names}
+        Args:
+            max_depth: Number of levels of sub keys to descend, None for all.
+        Returns:
+            list of (path, last_write_time, values) tuples from DumpTree()
+        """
+        return DumpTree(self.key, None, max_depth, self.access)
 
     def __getitem__(self, subkey):
         """
@@ -0,0 +1,696 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Asynchronous versions of the wslwinreg registry functions.
+
+Every function is a coroutine with the same arguments and results as the
+function of the same name in wslwinreg. On WSL, the commands are sent over
+an asyncio stream to the bridge executable, so many calls can be in flight
+at once without blocking the event loop. On other platforms, the calls are
+run in the default executor of the event loop.
+
+Note:
+    Python 3 only, requires Python 3.5 or higher. The coroutines are
+    written with async and await, so importing this module on Python 2.7
+    raises SyntaxError, while the rest of the package still supports it.
+
+@code
+    async def read_values(names):
+        key = await wslwinreg.aio.OpenKeyEx(HKEY_CURRENT_USER, "Software")
+        return await asyncio.gather(
+            *[wslwinreg.aio.QueryValueEx(key, name) for name in names])
+@endcode
+"""
+
+## \package wslwinreg.aio
+
+# Disable camel case requirement for function names
+# pylint: disable=invalid-name
+
+# Disable reusing reserved words.
+# pylint: disable=redefined-builtin
+# pylint: disable=protected-access
+
+import asyncio
+import importlib
+import socket
+import struct
+import weakref
+from collections import OrderedDict
+
+from .common import IS_WSL, IS_MEMORY, KEY_WRITE, KEY_WOW64_64KEY, KEY_READ
+
+## The wslwinreg package, which has the functions for this platform
+_winreg = importlib.import_module(__package__)
+
+## True if calls are sent to the bridge
+_USE_BRIDGE = IS_WSL and not IS_MEMORY
+
+if _USE_BRIDGE:
+    from . import wslapi
+
+## Seconds to wait for the bridge executable to connect
+_CONNECT_TIMEOUT = 10.0
+
+## Connection task for each event loop
+_CONNECTIONS = weakref.WeakKeyDictionary()
+
+########################################
+
+
+class _AsyncBridge(object):
+    """
+    Connection to the bridge executable for one event loop.
+
+    Commands are written to an asyncio stream with a request ID and a task
+    reads the reply frames and completes the future of each request, so any
+    number of coroutines can have commands in flight.
+    """
+
+    def __init__(self, reader, writer):
+        """
+        Initialize the _AsyncBridge class and start the reader task.
+
+        Args:
+            reader: asyncio.StreamReader of the connection.
+            writer: asyncio.StreamWriter of the connection.
+        """
+
+        ## asyncio.StreamReader of the connection
+        self.reader = reader
+
+        ## asyncio.StreamWriter of the connection
+        self.writer = writer
+
+        ## OrderedDict of request IDs to (future, frames received so far),
+        ## in the order the commands were sent
+        self._pending = OrderedDict()
+
+        ## Next request ID to use, 0 is reserved for posted commands
+        self._next_id = 1
+
+        ## Exception that broke the connection
+        self._error = None
+
+        ## Task reading the replies from the bridge
+        self._task = asyncio.ensure_future(self._read_replies())
+
+    async def request(self, buffer, timeout):
+        """
+        Send a command and wait for the reply.
+
+        The timeout restarts whenever a frame arrives, so long replies that
+        are streamed in many frames are not cut short. The bridge runs the
+        commands of a connection one at a time, so the timeout also doesn't
+        count while earlier commands are still running.
+
+        Args:
+            buffer: Encoded command, bytes or a list of segments.
+            timeout: Seconds to wait for a frame.
+        Returns:
+            list of bytes, the frames of the reply.
+        Exception:
+            ``socket.timeout`` if the bridge stopped responding.
+        """
+
+        if self._error is not None:
+            raise self._error
+
+        request_id = self._next_id
+        self._next_id = (request_id % 0xFFFFFFFF) + 1
+        # loop.create_future() needs Python 3.5.2
+        future = asyncio.Future(loop=asyncio.get_event_loop())
+        frames = []
+        self._pending[request_id] = (future, frames)
+
+        self.writer.writelines([struct.pack("<I", request_id)] +
+                               wslapi._command_segments(buffer))
+        await self.writer.drain()
+
+        received = 0
+        queued = self._is_queued(request_id)
+        while True:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                if not queued and len(frames) == received:
+                    # Let the commands behind this one start their timeouts
+                    self._pending.pop(request_id, None)
+                    raise socket.timeout("Timed out waiting for the bridge")
+                received = len(frames)
+                queued = self._is_queued(request_id)
+
+    def _is_queued(self, request_id):
+        """
+        Return True if a request waits for earlier commands to finish.
+
+        Args:
+            request_id: Request ID of the command.
+        Returns:
+            True if an earlier command on this connection has no reply yet.
+        """
+
+        for pending_id in self._pending:
+            return pending_id != request_id
+        return False
+
+    async def _read_replies(self):
+        """
+        Read reply frames and complete the futures waiting for them.
+        """
+
+        try:
+            while True:
+                request_id, length = struct.unpack(
+                    "<II", await self.reader.readexactly(8))
+                data = await self.reader.readexactly(
+                    length & ~wslapi._REPLY_MORE_FRAMES)
+                entry = self._pending.get(request_id)
+
+                # Replies to posted or abandoned commands are dropped
+                if entry is None:
+                    continue
+                future, frames = entry
+                frames.append(data)
+                if not length & wslapi._REPLY_MORE_FRAMES:
+                    del self._pending[request_id]
+                    if not future.done():
+                        future.set_result(frames)
+
+        except asyncio.IncompleteReadError:
+            self._fail(socket.timeout("Connection broken"))
+        except Exception as error:
+            self._fail(error)
+
+    def _fail(self, error):
+        """
+        Mark the connection as broken and fail every pending request.
+
+        Args:
+            error: Exception to raise in the waiting coroutines.
+        """
+
+        self._error = error
+        pending = self._pending
+        self._pending = OrderedDict()
+        for future, _ in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+########################################
+
+
+async def _connect():
+    """
+    Open a new connection to the bridge executable.
+
+    A port is opened on the loopback address and the bridge is asked to
+    connect to it, the connection is served by its own thread in the bridge.
+
+    Returns:
+        _AsyncBridge of the new connection.
+    """
+
+    loop = asyncio.get_event_loop()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.bind((wslapi._LOCALHOST, 0))
+        listener.listen(1)
+        listener.setblocking(False)
+
+        # Ask for the connection with the existing one
+        await loop.run_in_executor(
+            None, wslapi._open_connection, listener.getsockname()[1])
+        connection, _ = await asyncio.wait_for(
+            loop.sock_accept(listener), _CONNECT_TIMEOUT)
+    finally:
+        listener.close()
+
+    reader, writer = await asyncio.open_connection(sock=connection)
+    handshake = await asyncio.wait_for(
+        reader.readexactly(len(wslapi._HANDSHAKE)), _CONNECT_TIMEOUT)
+    if handshake != wslapi._HANDSHAKE:
+        writer.close()
+        raise socket.timeout("Windows Bridge version mismatch")
+    return _AsyncBridge(reader, writer)
+
+########################################
+
+
+async def _get_bridge():
+    """
+    Return the connection to the bridge for the running event loop.
+
+    The connection is opened on first use.
+
+    Returns:
+        _AsyncBridge for the running event loop.
+    """
+
+    loop = asyncio.get_event_loop()
+    connecting = _CONNECTIONS.get(loop)
+    if connecting is None:
+        connecting = asyncio.ensure_future(_connect())
+        _CONNECTIONS[loop] = connecting
+    try:
+        return await asyncio.shield(connecting)
+    except Exception:
+        # Try again on the next call
+        if _CONNECTIONS.get(loop) is connecting:
+            del _CONNECTIONS[loop]
+        raise
+
+########################################
+
+
+async def _run(func, *args):
+    """
+    Call a function in the default executor of the event loop.
+
+    Args:
+        func: Function to call.
+        args: Arguments to pass to the function.
+    Returns:
+        Value returned by the function.
+    """
+
+    return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+########################################
+
+
+async def _call(func, *args):
+    """
+    Call a registry function without blocking the event loop.
+
+    On WSL, the command of the function is sent on the connection of the
+    event loop, otherwise the function is run in the default executor.
+
+    Args:
+        func: Registry function to call, such as QueryValueEx.
+        args: Arguments to pass to the function.
+    Returns:
+        Value returned by the function.
+    """
+
+    if not _USE_BRIDGE:
+        return await _run(func, *args)
+
+    command, result = wslapi._encode_call(func, *args)
+    if command is None:
+        return result
+    buffer, reader, timeout = command
+    bridge = await _get_bridge()
+    return wslapi._decode(await bridge.request(buffer, timeout), reader)
+
+########################################
+
+
+async def CloseKey(hkey):
+    """
+    Closes a previously opened registry key.
+
+    Asynchronous version of wslwinreg.CloseKey().
+    """
+
+    return await _call(_winreg.CloseKey, hkey)
+
+########################################
+
+
+async def ConnectRegistry(computer_name, key):
+    """
+    Establishes a connection to a predefined registry handle.
+
+    Asynchronous version of wslwinreg.ConnectRegistry().
+    """
+
+    return await _call(_winreg.ConnectRegistry, computer_name, key)
+
+########################################
+
+
+async def CreateKey(key, sub_key):
+    """
+    Creates or opens the specified key.
+
+    Asynchronous version of wslwinreg.CreateKey().
+    """
+
+    return await _call(_winreg.CreateKey, key, sub_key)
+
+########################################
+
+
+async def CreateKeyEx(key, sub_key, reserved=0, access=KEY_WRITE):
+    """
+    Creates or opens the specified key.
+
+    Asynchronous version of wslwinreg.CreateKeyEx().
+    """
+
+    return await _call(_winreg.CreateKeyEx, key, sub_key, reserved, access)
+
+########################################
+
+
+async def DeleteKey(key, sub_key):
+    """
+    Deletes the specified key.
+
+    Asynchronous version of wslwinreg.DeleteKey().
+    """
+
+    return await _call(_winreg.DeleteKey, key, sub_key)
+
+########################################
+
+
+async def DeleteKeyEx(key, sub_key, access=KEY_WOW64_64KEY, reserved=0):
+    """
+    Deletes the specified key.
+
+    Asynchronous version of wslwinreg.DeleteKeyEx().
+    """
+
+    return await _call(_winreg.DeleteKeyEx, key, sub_key, access, reserved)
+
+########################################
+
+
+async def DeleteValue(key, value):
+    """
+    Removes a named value from a registry key.
+
+    Asynchronous version of wslwinreg.DeleteValue().
+    """
+
+    return await _call(_winreg.DeleteValue, key, value)
+
+########################################
+
+
+async def EnumKey(key, index):
+    """
+    Enumerates subkeys of an open registry key, returning a string.
+
+    Asynchronous version of wslwinreg.EnumKey().
+    """
+
+    return await _call(_winreg.EnumKey, key, index)
+
+########################################
+
+
+async def EnumKeys(key, start=0, count=None, with_times=False):
+    """
+    Enumerates many subkeys of an open registry key in a single call.
+
+    Asynchronous version of wslwinreg.EnumKeys().
+    """
+
+    return await _call(_winreg.EnumKeys, key, start, count, with_times)
+
+########################################
+
+
+async def EnumValue(key, index):
+    """
+    Enumerates values of an open registry key, returning a tuple.
+
+    Asynchronous version of wslwinreg.EnumValue().
+    """
+
+    return await _call(_winreg.EnumValue, key, index)
+
+########################################
+
+
+async def EnumValues(key):
+    """
+    Enumerates all of the values of an open registry key in a single call.
+
+    Asynchronous version of wslwinreg.EnumValues().
+    """
+
+    return await _call(_winreg.EnumValues, key)
+
+########################################
+
+
+async def ExpandEnvironmentStrings(str):
+    """
+    Expands environment variables.
+
+    Asynchronous version of wslwinreg.ExpandEnvironmentStrings().
+    """
+
+    return await _call(_winreg.ExpandEnvironmentStrings, str)
+
+########################################
+
+
+async def FlushKey(key):
+    """
+    Writes all the attributes of a key to the registry.
+
+    Asynchronous version of wslwinreg.FlushKey().
+    """
+
+    return await _call(_winreg.FlushKey, key)
+
+########################################
+
+
+async def LoadKey(key, sub_key, file_name):
+    """
+    Creates a subkey under the specified key and loads it from a file.
+
+    Asynchronous version of wslwinreg.LoadKey().
+    """
+
+    return await _call(_winreg.LoadKey, key, sub_key, file_name)
+
+########################################
+
+
+async def OpenKey(key, sub_key, reserved=0, access=KEY_READ):
+    """
+    Opens the specified key, returning a handle object.
+
+    Asynchronous version of wslwinreg.OpenKey().
+    """
+
+    return await _call(_winreg.OpenKey, key, sub_key, reserved, access)
+
+########################################
+
+
+async def OpenKeyEx(key, sub_key, reserved=0, access=KEY_READ):
+    """
+    Opens the specified key, returning a handle object.
+
+    Asynchronous version of wslwinreg.OpenKeyEx().
+    """
+
+    return await _call(_winreg.OpenKeyEx, key, sub_key, reserved, access)
+
+########################################
+
+
+async def QueryInfoKey(key):
+    """
+    Returns information about a key, as a tuple.
+
+    Asynchronous version of wslwinreg.QueryInfoKey().
+    """
+
+    return await _call(_winreg.QueryInfoKey, key)
+
+########################################
+
+
+async def QueryValue(key, sub_key):
+    """
+    Retrieves the unnamed value for a key, as a string.
+
+    Asynchronous version of wslwinreg.QueryValue().
+    """
+
+    return await _call(_winreg.QueryValue, key, sub_key)
+
+########################################
+
+
+async def QueryValueEx(key, value_name):
+    """
+    Retrieves the type and data for a specified value name.
+
+    Asynchronous version of wslwinreg.QueryValueEx().
+    """
+
+    return await _call(_winreg.QueryValueEx, key, value_name)
+
+########################################
+
+
+async def SaveKey(key, file_name):
+    """
+    Saves the specified key, and all its subkeys to the specified file.
+
+    Asynchronous version of wslwinreg.SaveKey().
+    """
+
+    return await _call(_winreg.SaveKey, key, file_name)
+
+########################################
+
+
+async def SetValue(key, sub_key, type, value):
+    """
+    Associates a value with a specified key.
+
+    Asynchronous version of wslwinreg.SetValue().
+    """
+
+    return await _call(_winreg.SetValue, key, sub_key, type, value)
+
+########################################
+
+
+async def SetValueEx(key, value_name, reserved, type, value):
+    """
+    Stores data in the value field of an open registry key.
+
+    Asynchronous version of wslwinreg.SetValueEx().
+    """
+
+    return await _call(_winreg.SetValueEx, key, value_name, reserved, type,
+                       value)
+
+########################################
+
+
+async def DisableReflectionKey(key):
+    """
+    Disables registry reflection for 32-bit processes.
+
+    Asynchronous version of wslwinreg.DisableReflectionKey().
+    """
+
+    return await _call(_winreg.DisableReflectionKey, key)
+
+########################################
+
+
+async def EnableReflectionKey(key):
+    """
+    Restores registry reflection for the specified disabled key.
+
+    Asynchronous version of wslwinreg.EnableReflectionKey().
+    """
+
+    return await _call(_winreg.EnableReflectionKey, key)
+
+########################################
+
+
+async def QueryReflectionKey(key):
+    """
+    Determines the reflection state for the specified key.
+
+    Asynchronous version of wslwinreg.QueryReflectionKey().
+    """
+
+    return await _call(_winreg.QueryReflectionKey, key)
+
+########################################
+
+
+async def get_file_info(path_name, string_name):
+    """
+    Extract information from a windows exe file version resource.
+
+    Asynchronous version of wslwinreg.get_file_info(), run in the default
+    executor since it reads the file.
+    """
+
+    return await _run(_winreg.get_file_info, path_name, string_name)
+
+########################################
+
+
+async def get_file_info_all(path_name):
+    """
+    Extract everything from a windows exe file version resource.
+
+    Asynchronous version of wslwinreg.get_file_info_all(), run in the
+    default executor since it reads the file.
+    """
+
+    return await _run(_winreg.get_file_info_all, path_name)
+
+########################################
+
+
+async def DumpTree(key, sub_key=None, max_depth=None, access=KEY_READ):
+    """
+    Read an entire registry tree in a single call.
+
+    Asynchronous version of wslwinreg.DumpTree().
+    """
+
+    return await _call(_winreg.DumpTree, key, sub_key, max_depth, access)
+
+########################################
+
+
+async def convert_to_windows_path(path_name):
+    """
+    Convert a Linux path to a Windows path.
+
+    Asynchronous version of wslwinreg.convert_to_windows_path(), run in the
+    default executor since it can start a process.
+    """
+
+    return await _run(_winreg.convert_to_windows_path, path_name)
+
+########################################
+
+
+async def convert_from_windows_path(path_name):
+    """
+    Convert a Windows path to a Linux path.
+
+    Asynchronous version of wslwinreg.convert_from_windows_path(), run in the
+    default executor since it can start a process.
+    """
+
+    return await _run(_winreg.convert_from_windows_path, path_name)
+
+########################################
+
+
+async def convert_to_windows_paths(path_names):
+    """
+    Convert a list of Linux paths to Windows paths.
+
+    Asynchronous version of wslwinreg.convert_to_windows_paths(), run in the
+    default executor since it can start a process.
+    """
+
+    return await _run(_winreg.convert_to_windows_paths, list(path_names))
+
+########################################
+
+
+async def convert_from_windows_paths(path_names):
+    """
+    Convert a list of Windows paths to Linux paths.
+
+    Asynchronous version of wslwinreg.convert_from_windows_paths(), run in
+    the default executor since it can start a process.
+    """
+
+    return await _run(_winreg.convert_from_windows_paths, list(path_names))
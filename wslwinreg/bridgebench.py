@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the transports between wslapi and the bridge.
+
+Every transport from wslwinreg.wslapi.get_transport() is timed for the
+launch and handshake, the round trip of a small command, and the throughput
+of a large value written and read back. Run it on each host to pick the
+WSLWINREG_TRANSPORT with the lowest latency. With WSLWINREG_BRIDGE set to
+"python" it measures the transports to the Python bridge server instead.
+
+@code
+    python -m wslwinreg.bridgebench -n 2000
+@endcode
+"""
+
+## \package wslwinreg.bridgebench
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+from .common import HKEY_CURRENT_USER, KEY_ALL_ACCESS, REG_BINARY
+from . import wslapi
+
+## Key created and deleted by the benchmark
+_BENCH_KEY = u"Software\\wslwinreg benchmark"
+
+########################################
+
+
+def benchmark_transport(transport, count=1000, size=1 << 20):
+    """
+    Time one transport to the bridge.
+
+    A bridge of its own is launched with the transport and closed when
+    done, so the benchmark doesn't disturb the connections in use.
+
+    Args:
+        transport: Name of the transport, such as "tcp".
+        count: Number of round trips to time.
+        size: Bytes in the value written and read back.
+    Returns:
+        dict with "start" in seconds to launch the bridge and finish the
+        handshake, "round_trip" in seconds per small command and
+        "throughput" in bytes per second.
+    """
+
+    # pylint: disable=protected-access
+    previous = (os.environ.get("WSLWINREG_TRANSPORT"), wslapi._BRIDGES,
+                wslapi._POOL_STATE)
+    os.environ["WSLWINREG_TRANSPORT"] = transport
+    bridges = []
+    try:
+        start = time.time()
+        bridges = wslapi._start_bridges()
+        wslapi._BRIDGES = bridges
+        wslapi._POOL_STATE = threading.local()
+        start = time.time() - start
+
+        key = wslapi.CreateKeyEx(HKEY_CURRENT_USER, _BENCH_KEY, 0,
+                                 KEY_ALL_ACCESS)
+        try:
+            round_trip = time.time()
+            for _ in range(count):
+                wslapi.QueryInfoKey(key)
+            round_trip = (time.time() - round_trip) / count
+
+            value = os.urandom(size)
+            throughput = time.time()
+            wslapi.SetValueEx(key, u"Data", 0, REG_BINARY, value)
+            wslapi.QueryValueEx(key, u"Data")
+            throughput = size * 2 / (time.time() - throughput)
+        finally:
+            key.Close()
+            wslapi.DeleteKey(HKEY_CURRENT_USER, _BENCH_KEY)
+    finally:
+        for bridge in bridges:
+            bridge.close()
+        if previous[0] is None:
+            os.environ.pop("WSLWINREG_TRANSPORT", None)
+        else:
+            os.environ["WSLWINREG_TRANSPORT"] = previous[0]
+        wslapi._BRIDGES, wslapi._POOL_STATE = previous[1:]
+
+    return {"start": start, "round_trip": round_trip,
+            "throughput": throughput}
+
+########################################
+
+
+def main(argv=None):
+    """
+    Benchmark the transports and print the results.
+
+    Args:
+        argv: Command line arguments, sys.argv[1:] if None.
+    Returns:
+        Zero, the exit code.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the transports to the wslwinreg bridge")
+    parser.add_argument("-t", dest="transports", action="append",
+                        choices=sorted(wslapi._TRANSPORTS),
+                        help="Transport to benchmark, all if not given")
+    parser.add_argument("-n", dest="count", type=int, default=1000,
+                        help="Number of round trips to time")
+    parser.add_argument("-s", dest="size", type=int, default=1 << 20,
+                        help="Bytes in the value for the throughput")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print("{:<8}{:>12}{:>16}{:>14}".format(
+        "", "start ms", "round trip us", "MB/s"))
+    for transport in args.transports or sorted(wslapi._TRANSPORTS):
+        try:
+            result = benchmark_transport(transport, args.count, args.size)
+        except OSError as error:
+            print("{:<8}{}".format(transport, error))
+            continue
+        results[transport] = result
+        print("{:<8}{:>12.1f}{:>16.1f}{:>14.1f}".format(
+            transport, result["start"] * 1000.0,
+            result["round_trip"] * 1000000.0,
+            result["throughput"] / 1000000.0))
+
+    if results:
+        best = min(results, key=lambda name: results[name]["round_trip"])
+        print("\nLowest latency: WSLWINREG_TRANSPORT={}".format(best))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
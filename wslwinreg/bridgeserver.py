@@ -0,0 +1,946 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Python stand in for the bridge executable.
+
+The server speaks the same protocol as backend-*.exe, but answers from the
+in-memory registry in wslwinreg.memapi instead of the Windows registry. It
+lets the socket code in wslwinreg.wslapi be tested and benchmarked on any
+platform, without Windows.
+
+Set the environment variable WSLWINREG_BRIDGE to "python" and wslapi
+launches this module instead of the executable. Like the executable, it
+connects back over TCP with -p, over an AF_UNIX socket with -u, or serves
+its standard input and output with -s. An optional latency in
+milliseconds, set with -l or WSLWINREG_BRIDGE_LATENCY, delays every reply
+to simulate the cost of the loopback connection between WSL2 and Windows.
+
+@code
+    WSLWINREG_BRIDGE=python WSLWINREG_BRIDGE_LATENCY=0.2 python bench.py
+@endcode
+"""
+
+## \package wslwinreg.bridgeserver
+
+# pylint: disable=broad-except
+# pylint: disable=useless-object-inheritance
+
+import os
+import sys
+import time
+import struct
+import socket
+import argparse
+import threading
+
+from .common import ERROR_SUCCESS, REG_SZ
+from . import memapi
+from .peinfo import get_file_info, read_version_resource
+from .wslapi import Commands
+
+## Handshake sent on every connection, must match wslapi._HANDSHAKE
+_HANDSHAKE = b"Bridge started 2.0"
+
+## Loopback address
+_LOCALHOST = "127.0.0.1"
+
+## Largest reply frame, like REPLY_FRAME_SIZE in the executable
+_REPLY_FRAME_SIZE = 65536
+
+## Set in the length of a reply frame if more frames of the reply follow
+_REPLY_MORE_FRAMES = 0x80000000
+
+## Size of the receive buffer
+_RECEIVE_SIZE = 65536
+
+## Maximum number of connections, like MAX_CONNECTIONS in the executable
+_MAX_CONNECTIONS = 64
+
+## The parameter is incorrect.
+ERROR_INVALID_PARAMETER = 0x00000057
+
+## Flag for ENUM_KEYS to include the last write times
+_ENUM_KEYS_WITH_TIMES = 1
+
+## Record types of DUMP_TREE, ENUM_KEYS and ENUM_VALUES replies
+_DUMP_END = 0
+_DUMP_KEY = 1
+_DUMP_VALUE = 2
+
+########################################
+
+
+def get_latency():
+    """
+    Return the reply latency set with WSLWINREG_BRIDGE_LATENCY.
+
+    Returns:
+        Latency in milliseconds, 0.0 if not set or invalid.
+    """
+
+    try:
+        return max(0.0, float(os.environ.get("WSLWINREG_BRIDGE_LATENCY",
+                                             "0")))
+    except ValueError:
+        return 0.0
+
+########################################
+
+
+def _error_code(error):
+    """
+    Return the Windows error code of an exception.
+
+    Args:
+        error: Exception raised by a memapi function.
+    Returns:
+        Windows error code, ERROR_INVALID_PARAMETER if it doesn't have one.
+    """
+
+    return getattr(error, "winerror", None) or ERROR_INVALID_PARAMETER
+
+########################################
+
+
+class _StdioConnection(object):
+    """
+    Socket stand in for the standard input and output of the process.
+    """
+
+    def __init__(self):
+        """
+        Initialize the _StdioConnection class.
+        """
+
+        ## File descriptor commands are read from
+        self._input = sys.stdin.fileno()
+
+        ## File descriptor replies are written to
+        self._output = sys.stdout.fileno()
+
+    def recv(self, size):
+        """
+        Receive up to size bytes.
+
+        Args:
+            size: Maximum number of bytes to receive.
+        Returns:
+            bytes received, empty at the end of the input.
+        """
+        return os.read(self._input, size)
+
+    def sendall(self, data):
+        """
+        Write all of the data.
+
+        Args:
+            data: bytes to write.
+        """
+
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._output, view):]
+
+    def close(self):
+        """
+        Close the output, so wslapi sees the end of the connection.
+        """
+        os.close(self._output)
+
+########################################
+
+
+class _Connection(object):
+    """
+    One connection from wslapi, served by its own thread.
+
+    Commands are read through a buffer, so pipelined commands cost one
+    recv() between them, and replies are sent in frames like the executable
+    does.
+    """
+
+    def __init__(self, server, connection):
+        """
+        Initialize the _Connection class.
+
+        Args:
+            server: BridgeServer that owns the connection.
+            connection: Socket, or _StdioConnection, connected to wslapi.
+        """
+
+        ## BridgeServer that owns the connection
+        self.server = server
+
+        ## Socket, or _StdioConnection, connected to wslapi
+        self.connection = connection
+
+        ## bytearray of the data received and not yet read
+        self._received = bytearray()
+
+        ## Offset of the first unread byte in _received
+        self._offset = 0
+
+        ## time.time() when the last data arrived
+        self._arrival = 0.0
+
+        ## Reply being built for the current command
+        self._reply = bytearray()
+
+        ## Request ID of the current command
+        self._request_id = 0
+
+        ## time.time() when the current reply may be sent
+        self._due = 0.0
+
+    def run(self):
+        """
+        Send the handshake and process commands until the connection closes.
+        """
+
+        try:
+            self.connection.sendall(_HANDSHAKE)
+            while True:
+                self._request_id, command = struct.unpack(
+                    "<IB", self._fetch(5))
+                self._due = self._arrival + self.server.latency
+                handler = _HANDLERS.get(command)
+                if handler is not None:
+                    handler(self)
+                self._send_frame(0)
+        except (EOFError, socket.error):
+            pass
+        finally:
+            self.connection.close()
+
+    def _fetch(self, length):
+        """
+        Read an exact number of bytes of the command.
+
+        Args:
+            length: Number of bytes to read.
+        Returns:
+            bytes of the requested length.
+        Exception:
+            ``EOFError`` if the connection was closed.
+        """
+
+        end = self._offset + length
+        if len(self._received) < end:
+            # Discard what was read once, then append each packet, so large
+            # commands aren't copied again for every packet
+            del self._received[:self._offset]
+            self._offset = 0
+            end = length
+            while len(self._received) < end:
+                packet = self.connection.recv(
+                    max(_RECEIVE_SIZE, end - len(self._received)))
+                if not packet:
+                    raise EOFError("Connection closed")
+                self._arrival = time.time()
+                self._received += packet
+        data = bytes(self._received[self._offset:end])
+        self._offset = end
+        return data
+
+    def _fetch_hkey(self):
+        """
+        Read a QWORD HKEY.
+
+        Returns:
+            Integer handle, predefined keys sign extended by 64 bit Windows
+            are truncated.
+        """
+
+        hkey = struct.unpack("<Q", self._fetch(8))[0]
+        if hkey >= 0xFFFFFFFF80000000:
+            hkey &= 0xFFFFFFFF
+        return hkey
+
+    def _fetch_bytes(self):
+        """
+        Read a DWORD length and that many bytes.
+
+        Returns:
+            bytes that were read.
+        """
+
+        length = struct.unpack("<I", self._fetch(4))[0]
+        return self._fetch(length) if length else b""
+
+    def _fetch_string(self):
+        """
+        Read a DWORD length and a UTF-8 string.
+
+        Returns:
+            The string, None if it was empty like FetchWideString().
+        """
+
+        data = self._fetch_bytes()
+        return data.decode("utf-8") if data else None
+
+    def _send(self, data):
+        """
+        Append data to the reply, sending full frames.
+
+        Args:
+            data: bytes to append.
+        """
+
+        self._reply += data
+        while len(self._reply) > _REPLY_FRAME_SIZE:
+            self._send_frame(_REPLY_MORE_FRAMES)
+
+    def _send_frame(self, flags):
+        """
+        Send up to a frame of the reply.
+
+        The first frame of a reply waits for the latency to pass.
+
+        Args:
+            flags: _REPLY_MORE_FRAMES if more frames follow, otherwise 0.
+        """
+
+        delay = self._due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        data = bytes(self._reply[:_REPLY_FRAME_SIZE])
+        del self._reply[:_REPLY_FRAME_SIZE]
+        self.connection.sendall(
+            struct.pack("<II", self._request_id, len(data) | flags) + data)
+
+    def _send_bytes(self, data):
+        """
+        Append a DWORD length and bytes to the reply.
+
+        Args:
+            data: bytes to append.
+        """
+
+        self._send(struct.pack("<I", len(data)) + data)
+
+    def _send_string(self, value):
+        """
+        Append a DWORD length and a UTF-8 string to the reply.
+
+        Args:
+            value: String to append, or None.
+        """
+
+        self._send_bytes(value.encode("utf-8") if value else b"")
+
+    def _send_result(self, error=None):
+        """
+        Append the LRESULT and the error message if any.
+
+        Args:
+            error: Exception raised by the call, or None for success.
+        """
+
+        if error is None:
+            self._send(struct.pack("<I", ERROR_SUCCESS))
+            return
+        message = getattr(error, "strerror", None) or str(error)
+        self._send(struct.pack("<I", _error_code(error)))
+        self._send_string(message)
+
+    def _send_value(self, value):
+        """
+        Append a DUMP_VALUE record.
+
+        Args:
+            value: (name, type, bytes) tuple from the in-memory registry.
+        """
+
+        name, typ, data = value
+        self._send(struct.pack("<B", _DUMP_VALUE))
+        self._send_string(name)
+        self._send(struct.pack("<I", typ))
+        self._send_bytes(data)
+
+    def _open(self, func, *args):
+        """
+        Call a function that opens a key and send the handle and LRESULT.
+
+        Args:
+            func: memapi function returning a PyHKEY.
+            args: Arguments to pass to the function.
+        """
+
+        hkey = 0
+        error = None
+        try:
+            hkey = func(*args).Detach()
+        except Exception as exception:
+            error = exception
+        self._send(struct.pack("<Q", hkey))
+        self._send_result(error)
+
+    def _call(self, func, *args):
+        """
+        Call a function and send the LRESULT.
+
+        Args:
+            func: memapi function to call.
+            args: Arguments to pass to the function.
+        """
+
+        error = None
+        try:
+            func(*args)
+        except Exception as exception:
+            error = exception
+        self._send_result(error)
+
+    def connect(self):
+        """
+        Open another connection to wslapi, served by a new thread.
+        """
+
+        port = struct.unpack("<I", self._fetch(4))[0]
+        error = None
+        try:
+            self.server.connect(port)
+        except Exception as exception:
+            error = exception
+        self._send_result(error)
+
+    def close_key(self):
+        """
+        CloseKey(): QWORD HKEY.
+        """
+
+        hkey = self._fetch_hkey()
+        if hkey:
+            self._call(memapi.CloseKey, hkey)
+        else:
+            self._send_result()
+
+    def connect_registry(self):
+        """
+        ConnectRegistry(): QWORD HKEY, string.
+        """
+
+        hkey = self._fetch_hkey()
+        self._open(memapi.ConnectRegistry, self._fetch_string(), hkey)
+
+    def create_key(self):
+        """
+        CreateKey(): QWORD HKEY, string.
+        """
+
+        hkey = self._fetch_hkey()
+        self._open(memapi.CreateKey, hkey, self._fetch_string())
+
+    def create_key_ex(self):
+        """
+        CreateKeyEx(): QWORD HKEY, DWORD reserved, DWORD access, string.
+        """
+
+        hkey = self._fetch_hkey()
+        reserved, access = struct.unpack("<II", self._fetch(8))
+        self._open(memapi.CreateKeyEx, hkey, self._fetch_string(), reserved,
+                   access)
+
+    def delete_key(self):
+        """
+        DeleteKey(): QWORD HKEY, string.
+        """
+
+        hkey = self._fetch_hkey()
+        self._call(memapi.DeleteKey, hkey, self._fetch_string())
+
+    def delete_key_ex(self):
+        """
+        DeleteKeyEx(): QWORD HKEY, DWORD reserved, DWORD access, string.
+        """
+
+        hkey = self._fetch_hkey()
+        reserved, access = struct.unpack("<II", self._fetch(8))
+        self._call(memapi.DeleteKeyEx, hkey, self._fetch_string(), access,
+                   reserved)
+
+    def delete_value(self):
+        """
+        DeleteValue(): QWORD HKEY, string.
+        """
+
+        hkey = self._fetch_hkey()
+        self._call(memapi.DeleteValue, hkey, self._fetch_string())
+
+    def enum_key(self):
+        """
+        EnumKey(): QWORD HKEY, DWORD index.
+        """
+
+        hkey = self._fetch_hkey()
+        index = struct.unpack("<I", self._fetch(4))[0]
+        name = None
+        error = None
+        try:
+            name = memapi.EnumKey(hkey, index)
+        except Exception as exception:
+            error = exception
+        self._send_string(name)
+        self._send_result(error)
+
+    def enum_value(self):
+        """
+        EnumValue(): QWORD HKEY, DWORD index.
+        """
+
+        hkey = self._fetch_hkey()
+        index = struct.unpack("<I", self._fetch(4))[0]
+        value = (None, 0, b"")
+        error = None
+        try:
+            value = memapi.enum_raw_value(hkey, index)
+        except Exception as exception:
+            error = exception
+        name, typ, data = value
+        self._send_string(name)
+        self._send_bytes(data)
+        self._send(struct.pack("<I", typ))
+        self._send_result(error)
+
+    def expand_environment_strings(self):
+        """
+        ExpandEnvironmentStrings(): string.
+        """
+
+        value = self._fetch_string()
+        result = None
+        error = None
+        try:
+            result = memapi.ExpandEnvironmentStrings(value or u"")
+        except Exception as exception:
+            error = exception
+        self._send_string(result)
+        self._send_result(error)
+
+    def flush_key(self):
+        """
+        FlushKey(): QWORD HKEY.
+        """
+
+        self._call(memapi.FlushKey, self._fetch_hkey())
+
+    def load_key(self):
+        """
+        LoadKey(): QWORD HKEY, string, string.
+        """
+
+        hkey = self._fetch_hkey()
+        sub_key = self._fetch_string()
+        file_name = self._fetch_string()
+
+        # The executable sends an unused QWORD before the LRESULT
+        self._send(struct.pack("<Q", 0))
+        self._call(memapi.LoadKey, hkey, sub_key, file_name)
+
+    def open_key(self):
+        """
+        OpenKey(): QWORD HKEY, DWORD reserved, DWORD access, string.
+        """
+
+        hkey = self._fetch_hkey()
+        reserved, access = struct.unpack("<II", self._fetch(8))
+        self._open(memapi.OpenKey, hkey, self._fetch_string(), reserved,
+                   access)
+
+    def query_info_key(self):
+        """
+        QueryInfoKey(): QWORD HKEY.
+        """
+
+        hkey = self._fetch_hkey()
+        info = (0, 0, 0)
+        error = None
+        try:
+            info = memapi.QueryInfoKey(hkey)
+        except Exception as exception:
+            error = exception
+        self._send(struct.pack("<IIQ", *info))
+        self._send_result(error)
+
+    def query_value(self):
+        """
+        QueryValue(): QWORD HKEY, string.
+        """
+
+        hkey = self._fetch_hkey()
+        sub_key = self._fetch_string()
+        result = None
+        error = None
+        try:
+            result = memapi.QueryValue(hkey, sub_key)
+        except Exception as exception:
+            error = exception
+        self._send_string(result)
+        self._send_result(error)
+
+    def query_value_ex(self):
+        """
+        QueryValueEx(): QWORD HKEY, string.
+        """
+
+        hkey = self._fetch_hkey()
+        name = self._fetch_string()
+        value = (name, 0, b"")
+        error = None
+        try:
+            value = memapi.query_raw_value(hkey, name)
+        except Exception as exception:
+            value = (name, 0, b"")
+            error = exception
+        self._send_bytes(value[2])
+        self._send(struct.pack("<I", value[1]))
+        self._send_result(error)
+
+    def save_key(self):
+        """
+        SaveKey(): QWORD HKEY, string.
+        """
+
+        hkey = self._fetch_hkey()
+        file_name = self._fetch_string()
+
+        # The executable sends an unused QWORD before the LRESULT
+        self._send(struct.pack("<Q", 0))
+        self._call(memapi.SaveKey, hkey, file_name)
+
+    def set_value(self):
+        """
+        SetValue(): QWORD HKEY, string, string.
+        """
+
+        hkey = self._fetch_hkey()
+        sub_key = self._fetch_string()
+        value = self._fetch_string()
+        self._call(memapi.SetValue, hkey, sub_key, REG_SZ,
+                   value or u"")
+
+    def set_value_ex(self):
+        """
+        SetValueEx(): QWORD HKEY, DWORD type, string, bytes.
+
+        The data was already converted by to_registry_bytes() in wslapi, so
+        it's stored as is.
+        """
+
+        hkey = self._fetch_hkey()
+        typ = struct.unpack("<I", self._fetch(4))[0]
+        name = self._fetch_string()
+        data = self._fetch_bytes()
+        error = None
+        try:
+            memapi.set_raw_value(hkey, name, typ, data)
+        except Exception as exception:
+            error = exception
+        self._send_result(error)
+
+    def disable_reflection_key(self):
+        """
+        DisableReflectionKey(): QWORD HKEY.
+        """
+
+        self._call(memapi.DisableReflectionKey, self._fetch_hkey())
+
+    def enable_reflection_key(self):
+        """
+        EnableReflectionKey(): QWORD HKEY.
+        """
+
+        self._call(memapi.EnableReflectionKey, self._fetch_hkey())
+
+    def query_reflection_key(self):
+        """
+        QueryReflectionKey(): QWORD HKEY.
+        """
+
+        hkey = self._fetch_hkey()
+        result = False
+        error = None
+        try:
+            result = memapi.QueryReflectionKey(hkey)
+        except Exception as exception:
+            error = exception
+        self._send(struct.pack("<B", 1 if result else 0))
+        self._send_result(error)
+
+    def get_file_info(self):
+        """
+        get_file_info(): string, string.
+
+        The path is read as a host pathname.
+        """
+
+        path_name = self._fetch_string()
+        string_name = self._fetch_string()
+        result = None
+        if path_name and string_name:
+            result = get_file_info(path_name, string_name)
+        self._send_string(result)
+        self._send_result()
+
+    def dump_tree(self):
+        """
+        DumpTree(): QWORD HKEY, DWORD access, DWORD max depth, string.
+        """
+
+        hkey = self._fetch_hkey()
+        max_depth = struct.unpack("<II", self._fetch(8))[1]
+        sub_key = self._fetch_string()
+        error = None
+        try:
+            records = memapi.dump_raw_tree(hkey, sub_key, max_depth)
+        except Exception as exception:
+            error = exception
+            records = []
+
+        for path, last_write_time, values in records:
+            self._send(struct.pack("<B", _DUMP_KEY))
+            self._send_string(path)
+            self._send(struct.pack("<Q", last_write_time))
+            for value in values:
+                self._send_value(value)
+        self._send(struct.pack("<B", _DUMP_END))
+        self._send_result(error)
+
+    def enum_keys(self):
+        """
+        EnumKeys(): QWORD HKEY, DWORD start, DWORD count, DWORD flags.
+        """
+
+        hkey = self._fetch_hkey()
+        start, count, flags = struct.unpack("<III", self._fetch(12))
+        keys = []
+        error = None
+        try:
+            keys = memapi.EnumKeys(hkey, start, count, True)
+        except Exception as exception:
+            error = exception
+        for name, last_write_time in keys:
+            self._send(struct.pack("<B", 1))
+            self._send_string(name)
+            if flags & _ENUM_KEYS_WITH_TIMES:
+                self._send(struct.pack("<Q", last_write_time))
+        self._send(struct.pack("<B", 0))
+        self._send_result(error)
+
+    def enum_values(self):
+        """
+        EnumValues(): QWORD HKEY.
+        """
+
+        hkey = self._fetch_hkey()
+        values = []
+        error = None
+        try:
+            values = memapi.enum_raw_values(hkey)
+        except Exception as exception:
+            error = exception
+        for value in values:
+            self._send_value(value)
+        self._send(struct.pack("<B", _DUMP_END))
+        self._send_result(error)
+
+    def get_file_info_all(self):
+        """
+        get_file_info_all(): string.
+
+        The path is read as a host pathname.
+        """
+
+        path_name = self._fetch_string()
+        self._send_bytes(
+            (read_version_resource(path_name) if path_name else None) or b"")
+        self._send_result()
+
+
+## Handlers for each command, keyed by wslapi.Commands
+_HANDLERS = {
+    Commands.CONNECT: _Connection.connect,
+    Commands.CLOSE_KEY: _Connection.close_key,
+    Commands.CONNECT_REGISTRY: _Connection.connect_registry,
+    Commands.CREATE_KEY: _Connection.create_key,
+    Commands.CREATE_KEY_EX: _Connection.create_key_ex,
+    Commands.DELETE_KEY: _Connection.delete_key,
+    Commands.DELETE_KEY_EX: _Connection.delete_key_ex,
+    Commands.DELETE_VALUE: _Connection.delete_value,
+    Commands.ENUM_KEY: _Connection.enum_key,
+    Commands.ENUM_VALUE: _Connection.enum_value,
+    Commands.EXPAND_ENVIRONMENTSTRINGS:
+        _Connection.expand_environment_strings,
+    Commands.FLUSH_KEY: _Connection.flush_key,
+    Commands.LOAD_KEY: _Connection.load_key,
+    Commands.OPEN_KEY: _Connection.open_key,
+    Commands.OPEN_KEY_EX: _Connection.open_key,
+    Commands.QUERY_INFO_KEY: _Connection.query_info_key,
+    Commands.QUERY_VALUE: _Connection.query_value,
+    Commands.QUERY_VALUE_EX: _Connection.query_value_ex,
+    Commands.SAVE_KEY: _Connection.save_key,
+    Commands.SET_VALUE: _Connection.set_value,
+    Commands.SET_VALUE_EX: _Connection.set_value_ex,
+    Commands.DISABLE_REFLECTION_KEY: _Connection.disable_reflection_key,
+    Commands.ENABLE_REFLECTION_KEY: _Connection.enable_reflection_key,
+    Commands.QUERY_REFLECTION_KEY: _Connection.query_reflection_key,
+    Commands.GET_FILE_INFO: _Connection.get_file_info,
+    Commands.DUMP_TREE: _Connection.dump_tree,
+    Commands.ENUM_KEYS: _Connection.enum_keys,
+    Commands.ENUM_VALUES: _Connection.enum_values,
+    Commands.GET_FILE_INFO_ALL: _Connection.get_file_info_all
+}
+
+########################################
+
+
+class BridgeServer(object):
+    """
+    Serve the bridge protocol from the in-memory registry.
+
+    Like the executable, the server connects to a port or AF_UNIX socket
+    that wslapi is listening on, once per connection, and serves each
+    connection with its own thread. It can also serve a single connection
+    over its standard input and output. Handles are shared by all
+    connections.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        Initialize the BridgeServer class.
+
+        Args:
+            latency: Milliseconds to delay every reply.
+        """
+
+        ## Seconds to delay every reply, after its command arrived
+        self.latency = latency / 1000.0
+
+        ## list of threads serving the connections
+        self.threads = []
+
+    def connect(self, port):
+        """
+        Connect to wslapi and serve the connection with a new thread.
+
+        Args:
+            port: Port on the loopback address that wslapi is listening on.
+        Returns:
+            threading.Thread serving the connection.
+        """
+
+        connection = socket.create_connection((_LOCALHOST, port))
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self._start(connection)
+
+    def connect_unix(self, path_name):
+        """
+        Connect to wslapi over an AF_UNIX socket and serve the connection.
+
+        Args:
+            path_name: Pathname of the socket that wslapi is listening on.
+        Returns:
+            threading.Thread serving the connection.
+        """
+
+        # pylint: disable=no-member
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(path_name)
+        except socket.error:
+            connection.close()
+            raise
+        return self._start(connection)
+
+    def serve(self, port=None, connections=1, path_name=None):
+        """
+        Open the connections and wait until all of them are closed.
+
+        Args:
+            port: Port on the loopback address that wslapi is listening on.
+            connections: Number of connections to open.
+            path_name: Pathname of an AF_UNIX socket to use instead of port.
+        """
+
+        for _ in range(max(1, min(connections, _MAX_CONNECTIONS))):
+            if path_name is not None:
+                self.connect_unix(path_name)
+            else:
+                self.connect(port)
+        self.wait()
+
+    def serve_stdio(self):
+        """
+        Serve the standard input and output until the input is closed.
+        """
+
+        self._start(_StdioConnection())
+        self.wait()
+
+    def wait(self):
+        """
+        Wait until all of the connections are closed.
+        """
+
+        # Connections opened with Commands.CONNECT are added while waiting
+        while self.threads:
+            self.threads.pop(0).join()
+
+    def _start(self, connection):
+        """
+        Serve a connection with a new thread.
+
+        Args:
+            connection: Socket, or _StdioConnection, connected to wslapi.
+        Returns:
+            threading.Thread serving the connection.
+        """
+
+        thread = threading.Thread(
+            target=_Connection(self, connection).run,
+            name="wslwinreg bridge server")
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+        return thread
+
+########################################
+
+
+def main(argv=None):
+    """
+    Run the server with the command line of the bridge executable.
+
+    Args:
+        argv: Command line arguments, sys.argv[1:] if None.
+    Returns:
+        Zero, the exit code.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Python stand in for the wslwinreg bridge executable")
+    transport = parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument("-p", dest="port", type=int,
+                           help="Port to connect to")
+    transport.add_argument("-u", dest="path_name",
+                           help="AF_UNIX socket to connect to")
+    transport.add_argument("-s", dest="stdio", action="store_true",
+                           help="Serve the standard input and output")
+    parser.add_argument("-c", dest="connections", type=int, default=1,
+                        help="Number of connections to open")
+    parser.add_argument("-l", dest="latency", type=float,
+                        default=get_latency(),
+                        help="Milliseconds to delay every reply")
+    args = parser.parse_args(argv)
+
+    server = BridgeServer(args.latency)
+    if args.stdio:
+        server.serve_stdio()
+    else:
+        server.serve(args.port, args.connections, args.path_name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per user broker that shares one bridge executable between processes.
+
+Launching the bridge executable from WSL takes hundreds of milliseconds,
+which adds up when many short Python processes use wslwinreg. With the
+environment variable WSLWINREG_BROKER set, wslapi connects to this broker
+over an AF_UNIX socket instead, and starts it if it isn't running.
+
+The broker owns one long lived bridge. A process that attaches opens a
+port on the loopback address and sends its number to the broker, which asks
+the bridge to connect to it with Commands.CONNECT. The commands of the
+process then go straight to the bridge, the broker only hands out the
+connections. A process stays attached, with its socket to the broker open,
+until it exits. Registry handles are shared by all of the processes, so
+wslapi closes the ones still open when a process exits.
+
+The broker exits once no process has been attached for the idle time, set
+with -i or WSLWINREG_BROKER_IDLE in seconds, or if its bridge stops.
+"""
+
+## \package wslwinreg.broker
+
+# pylint: disable=useless-object-inheritance
+
+import os
+import sys
+import time
+import errno
+import fcntl
+import struct
+import socket
+import argparse
+import threading
+
+from . import wslapi
+
+## Default seconds without an attached process before exiting
+_IDLE_TIMEOUT = 600.0
+
+## Returned to the client if the bridge of the broker stopped
+ERROR_BROKEN_PIPE = 0x0000006D
+
+########################################
+
+
+def get_idle_timeout():
+    """
+    Return the idle time set with WSLWINREG_BROKER_IDLE.
+
+    Returns:
+        Seconds, _IDLE_TIMEOUT if not set or invalid.
+    """
+
+    try:
+        return max(0.0, float(os.environ.get("WSLWINREG_BROKER_IDLE",
+                                             _IDLE_TIMEOUT)))
+    except ValueError:
+        return _IDLE_TIMEOUT
+
+########################################
+
+
+class Broker(object):
+    """
+    Hand out connections to a shared bridge over an AF_UNIX socket.
+    """
+
+    def __init__(self, path_name, idle_timeout=_IDLE_TIMEOUT):
+        """
+        Initialize the Broker class.
+
+        Args:
+            path_name: Pathname of the AF_UNIX socket to listen on.
+            idle_timeout: Seconds without clients before exiting, 0 for
+                never.
+        """
+
+        ## Pathname of the AF_UNIX socket
+        self.path_name = path_name
+
+        ## Seconds without clients before exiting, 0 for never
+        self.idle_timeout = idle_timeout
+
+        ## Lock protecting _clients and _last_use
+        self._lock = threading.Lock()
+
+        ## Number of clients attached
+        self._clients = 0
+
+        ## time.time() when the last client disconnected
+        self._last_use = time.time()
+
+        ## Set once the bridge stopped working
+        self._stopped = threading.Event()
+
+    def serve(self):
+        """
+        Start the bridge and serve clients until idle.
+
+        Returns:
+            False if another broker already owns the socket.
+        Exception:
+            ``OSError`` if the bridge can't be started.
+        """
+
+        directory = os.path.dirname(self.path_name)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Only one broker per socket, the lock is released when it exits
+        with open(self.path_name + ".lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as error:
+                if error.errno in (errno.EAGAIN, errno.EACCES):
+                    return False
+                raise
+
+            # Start the bridge before clients can connect
+            wslapi._bridge()
+
+            # Remove the socket of a broker that died
+            if os.path.exists(self.path_name):
+                os.remove(self.path_name)
+
+            listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                listen_socket.bind(self.path_name)
+                listen_socket.listen(16)
+                listen_socket.settimeout(1.0)
+                while not self._is_done():
+                    try:
+                        connection, _ = listen_socket.accept()
+                    except socket.timeout:
+                        continue
+                    with self._lock:
+                        self._clients += 1
+                    thread = threading.Thread(
+                        target=self._serve_client, args=(connection,),
+                        name="wslwinreg broker client")
+                    thread.daemon = True
+                    thread.start()
+            finally:
+                listen_socket.close()
+                os.remove(self.path_name)
+        return True
+
+    def _is_done(self):
+        """
+        Return True if the broker should exit.
+
+        Returns:
+            True if the bridge stopped, or no client was attached for too
+            long.
+        """
+
+        if self._stopped.is_set():
+            return True
+        if not self.idle_timeout:
+            return False
+        with self._lock:
+            return not self._clients and \
+                time.time() - self._last_use > self.idle_timeout
+
+    def _serve_client(self, connection):
+        """
+        Open a connection from the bridge for every port a client sends.
+
+        The client is attached until it closes the socket.
+
+        Args:
+            connection: Socket connected to the client.
+        """
+
+        try:
+            while True:
+                data = b""
+                while len(data) < 4:
+                    packet = connection.recv(4 - len(data))
+                    if not packet:
+                        return
+                    data += packet
+                port = struct.unpack("<I", data)[0]
+
+                return_code = 0
+                try:
+                    wslapi._open_connection(port)
+                except wslapi.WindowsError as error:
+                    return_code = error.winerror
+                except Exception:
+                    # The bridge is gone, let the next client start another
+                    return_code = ERROR_BROKEN_PIPE
+                    self._stopped.set()
+                connection.sendall(struct.pack("<I", return_code))
+        except socket.error:
+            pass
+        finally:
+            connection.close()
+            with self._lock:
+                self._clients -= 1
+                self._last_use = time.time()
+
+########################################
+
+
+def main(argv=None):
+    """
+    Run the broker for the bridge selected by the environment.
+
+    Args:
+        argv: Command line arguments, sys.argv[1:] if None.
+    Returns:
+        Zero, the exit code.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Share one wslwinreg bridge between processes")
+    parser.add_argument("-i", dest="idle", type=float,
+                        default=get_idle_timeout(),
+                        help="Seconds without clients before exiting")
+    args = parser.parse_args(argv)
+
+    # The broker's own bridge is private, with a single connection
+    os.environ.pop("WSLWINREG_BROKER", None)
+    os.environ["WSLWINREG_CONNECTIONS"] = "1"
+
+    Broker(wslapi.get_broker_path(), args.idle).serve()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
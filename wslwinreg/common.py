@@ -15,7 +15,9 @@ module.
 # pylint: disable=invalid-name
 # pylint: disable=too-few-public-methods
 
+import os
 import sys
+import json
 import platform
 from struct import pack, unpack_from
 from locale import getpreferredencoding
@@ -45,9 +47,12 @@ __all__ = [
     "IS_CYGWIN",
     "IS_MSYS",
     "IS_WSL",
+    "IS_MEMORY",
     "ERROR_SUCCESS",
     "ERROR_FILE_NOT_FOUND",
+    "ERROR_ACCESS_DENIED",
     "ERROR_MORE_DATA",
+    "ERROR_NO_MORE_ITEMS",
     "HKEY_CLASSES_ROOT",
     "HKEY_CURRENT_USER",
     "HKEY_LOCAL_MACHINE",
@@ -133,9 +138,15 @@ __all__ = [
     "FILETIME",
     "PFILETIME",
     "winerror_to_errno",
+    "registry_error",
     "convert_to_utf16",
     "to_registry_bytes",
-    "from_registry_bytes"
+    "from_registry_bytes",
+    "get_cache_dir",
+    "read_json_file",
+    "write_json_file",
+    "RegistryFuture",
+    "Batch"
 ]
 
 ## Type long for Python 2 compatibility
@@ -154,6 +165,16 @@ except NameError:
     basestring = str
     __all__.append("basestring")
 
+try:
+    FileNotFoundError
+except NameError:
+    class FileNotFoundError(OSError):
+        """
+        pypy2 does not define this exception
+        """
+        # pylint: disable=unnecessary-pass
+        pass
+
 # Force Python2 to use builtins
 try:
     import builtins
@@ -176,15 +197,24 @@ IS_MSYS = sys.platform.startswith("msys")
 ## Running on Windows Subsystem for Linux
 IS_WSL = IS_LINUX and "icrosoft" in platform.platform()
 
+## Using the in-memory registry, set WSLWINREG_BACKEND=memory to select it
+IS_MEMORY = os.environ.get("WSLWINREG_BACKEND", "").lower() == "memory"
+
 ## The operation completed successfully.
 ERROR_SUCCESS = 0x00000000
 
 ## The system cannot find the file specified.
 ERROR_FILE_NOT_FOUND = 0x00000002
 
+## Access is denied.
+ERROR_ACCESS_DENIED = 0x00000005
+
 ## More data is available.
 ERROR_MORE_DATA = 0x000000ea
 
+## No more data is available.
+ERROR_NO_MORE_ITEMS = 0x00000103
+
 ## Registry entries subordinate to this key define types
 # (or classes) of documents and the properties associated with those types.
 HKEY_CLASSES_ROOT = 0x80000000
@@ -590,6 +620,31 @@ def winerror_to_errno(winerror):
 ########################################
 
 
+def registry_error(winerror, strerror, filename=None):
+    """
+    Create the exception a Windows registry call would raise.
+
+    Args:
+        winerror: Integer error code number returned by Windows
+        strerror: The string describing the error
+        filename: Name of the file or key responsible, if applicable.
+
+    Returns:
+        ``FileNotFoundError`` for ERROR_FILE_NOT_FOUND, ``OSError``
+        otherwise, with the winerror attribute set.
+    """
+
+    if winerror == ERROR_FILE_NOT_FOUND:
+        error_class = FileNotFoundError
+    else:
+        error_class = OSError
+    error = error_class(winerror_to_errno(winerror), strerror, filename)
+    error.winerror = winerror
+    return error
+
+########################################
+
+
 def convert_to_utf16(input_string):
     """
     Convert the input string into utf-16-le.
@@ -779,3 +834,246 @@ def from_registry_bytes(input_data, input_size, typ):
     if not input_size:
         return None
     return input_data[:input_size]
+
+########################################
+
+
+def get_cache_dir():
+    """
+    Return the folder for the cache files of this package.
+
+    The folder is $XDG_CACHE_HOME/wslwinreg, which defaults to
+    ~/.cache/wslwinreg. It's not created by this function.
+
+    Returns:
+        Pathname of the cache folder.
+    """
+
+    cache_dir = os.environ.get("XDG_CACHE_HOME")
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "wslwinreg")
+
+########################################
+
+
+def read_json_file(path_name):
+    """
+    Read a JSON file holding a dict.
+
+    Args:
+        path_name: Pathname of the file.
+    Returns:
+        dict of the file contents or None if it can't be read.
+    """
+
+    try:
+        with open(path_name, "r") as fileref:
+            record = json.load(fileref)
+    except (OSError, IOError, ValueError):
+        return None
+    if not isinstance(record, dict):
+        return None
+    return record
+
+########################################
+
+
+def write_json_file(path_name, record):
+    """
+    Write a JSON file, creating its folder if needed.
+
+    The file is written to a temporary name and renamed, so other
+    processes never read a partial file. Errors are ignored, since the
+    files are only caches.
+
+    Args:
+        path_name: Pathname of the file.
+        record: Object to store.
+    """
+
+    temp_path = "{}.{}".format(path_name, os.getpid())
+    try:
+        folder = os.path.dirname(path_name)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(temp_path, "w") as fileref:
+            json.dump(record, fileref)
+        os.rename(temp_path, path_name)
+    except (OSError, IOError):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+########################################
+
+
+class RegistryFuture(object):
+    """
+    Result of a registry call queued in a Batch.
+
+    The result is available once the batch that owns this future has been
+    flushed. Calling result() on a pending future will flush the batch.
+    """
+
+    def __init__(self, batch=None):
+        """
+        Initialize the RegistryFuture class.
+
+        Args:
+            batch: Batch that will resolve this future, None if resolved.
+        """
+
+        ## Batch that will resolve this future
+        self._batch = batch
+
+        ## True if the result or exception has been set
+        self._done = False
+
+        ## Value returned by the registry call
+        self._result = None
+
+        ## Exception raised by the registry call
+        self._exception = None
+
+    def done(self):
+        """
+        Return True if the call has completed.
+        """
+        return self._done
+
+    def result(self):
+        """
+        Return the value of the registry call.
+
+        If the call has not been sent yet, the owning batch is flushed first.
+
+        Returns:
+            Value returned by the registry function.
+        Exception:
+            The exception raised by the registry function, if any.
+        """
+        if not self._done and self._batch is not None:
+            self._batch.flush()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """
+        Return the exception raised by the registry call, or None.
+        """
+        if not self._done and self._batch is not None:
+            self._batch.flush()
+        return self._exception
+
+    def set_result(self, result):
+        """
+        Mark the future as completed with a value.
+
+        Args:
+            result: Value returned by the registry function.
+        """
+        self._result = result
+        self._done = True
+        self._batch = None
+
+    def set_exception(self, exception):
+        """
+        Mark the future as completed with an exception.
+
+        Args:
+            exception: Exception raised by the registry function.
+        """
+        self._exception = exception
+        self._done = True
+        self._batch = None
+
+########################################
+
+
+class Batch(object):
+    """
+    Queue of registry calls whose results are returned as futures.
+
+    This implementation issues every call immediately, since the Cygwin, MSYS2
+    and native Windows implementations call the Windows API directly and have
+    no round trip to save. The WSL implementation overrides this class to
+    send all queued calls to the bridge at once.
+
+    @code
+        with wslwinreg.batch() as b:
+            version = b.call(QueryValueEx, key, "Version")
+            path = b.call(QueryValueEx, key, "Path")
+        print(version.result(), path.result())
+    @endcode
+    """
+
+    def __init__(self):
+        """
+        Initialize the Batch class.
+        """
+
+        ## Futures for every call issued through this batch, in order
+        self.futures = []
+
+    def call(self, func, *args, **kwargs):
+        """
+        Queue a registry function call.
+
+        Note:
+            Calls in a batch can't use the result of another call in the
+            same batch, such as a handle returned by OpenKey().
+
+        Args:
+            func: Registry function to call, such as QueryValueEx.
+            args: Arguments to pass to the function.
+            kwargs: Keyword arguments to pass to the function.
+        Returns:
+            RegistryFuture for the result of the call.
+        """
+
+        future = RegistryFuture()
+        try:
+            future.set_result(func(*args, **kwargs))
+        # pylint: disable=broad-except
+        except Exception as error:
+            future.set_exception(error)
+        self.futures.append(future)
+        return future
+
+    def flush(self):
+        """
+        Send all queued calls and resolve their futures.
+        """
+
+    def results(self):
+        """
+        Return the results of all calls in the order they were queued.
+
+        Returns:
+            list of values returned by the registry functions.
+        Exception:
+            The first exception raised by any queued call.
+        """
+        self.flush()
+        return [future.result() for future in self.futures]
+
+    def __enter__(self):
+        """
+        Enable enter/exit functionality
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        """
+        Send any queued calls on exit.
+
+        Args:
+            exc_type: Ignored
+            exc_value: Ignored
+            exc_traceback: Ignored
+        """
+        self.flush()
+        return False
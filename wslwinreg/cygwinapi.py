@@ -23,12 +23,15 @@ from ctypes import cdll, create_unicode_buffer, c_void_p, c_ulong, byref, \
     cast, sizeof, create_string_buffer, wstring_at, string_at, RTLD_LOCAL
 
 from .common import PY2, builtins, ERROR_SUCCESS, ERROR_FILE_NOT_FOUND, \
-    ERROR_MORE_DATA, KEY_WOW64_64KEY, KEY_WRITE, KEY_READ, REG_SZ, \
+    ERROR_ACCESS_DENIED, ERROR_MORE_DATA, ERROR_NO_MORE_ITEMS, \
+    KEY_WOW64_64KEY, KEY_WRITE, KEY_READ, REG_SZ, \
     FORMAT_MESSAGE_ALLOCATE_BUFFER, FORMAT_MESSAGE_IGNORE_INSERTS, \
     FORMAT_MESSAGE_FROM_SYSTEM, LANG_NEUTRAL, LPCVOID, LPVOID, DWORD, PDWORD, \
     LPDWORD, LONG, PLONG, PBYTE, LPBYTE, LPWSTR, LPCWSTR, HKEY, PHKEY, \
     HLOCAL, REGSAM, FILETIME, PFILETIME, SUBLANG_DEFAULT, \
     to_registry_bytes, from_registry_bytes, winerror_to_errno, BOOL
+from .pathconv import CygwinPathTranslator
+from .peinfo import parse_version_info
 
 # Test kernel32 in case cdll is the broken version
 try:
@@ -770,6 +773,58 @@ def EnumKey(key, index):
 ########################################
 
 
+def EnumKeys(key, start=0, count=None, with_times=False):
+    """
+    Enumerates many subkeys of an open registry key in a single call.
+
+    Instead of calling EnumKey() once per index until an ``OSError`` is
+    raised, all of the names are returned in one list.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        start: Index of the first subkey to retrieve.
+        count: Maximum number of subkeys to retrieve, None for all.
+        with_times: If True, return (name, last_write_time) tuples with
+            the time as 100’s of nanoseconds since Jan 1, 1601.
+    Returns:
+        list of subkey names, or list of tuples if with_times is True.
+    Exception:
+        ``WindowsError`` or ``FileNotFileError``
+    """
+
+    # Handles from the native winreg module are used, but not closed
+    if isinstance(key, PyHKEY):
+        hkey = key.hkey
+    else:
+        hkey = int(key)
+
+    # max key name length is 256 if unterminated
+    tmpbuf = create_unicode_buffer(257)
+    length = DWORD()
+    last_write_time = FILETIME()
+    result = []
+    index = start
+    while count is None or len(result) < count:
+        length.value = len(tmpbuf)
+        rc = RegEnumKeyExW(hkey, index, tmpbuf, byref(length),
+                           None, None, None, byref(last_write_time))
+        if rc != ERROR_SUCCESS:
+            if rc == ERROR_NO_MORE_ITEMS:
+                break
+            check_LRESULT(rc)
+        if with_times:
+            result.append((tmpbuf[:length.value],
+                           (last_write_time.high << 32) |
+                           last_write_time.low))
+        else:
+            result.append(tmpbuf[:length.value])
+        index += 1
+    return result
+
+########################################
+
+
 def EnumValue(key, index):
     # pylint: disable=line-too-long
     """
@@ -847,6 +902,74 @@ def EnumValue(key, index):
 ########################################
 
 
+def EnumValues(key):
+    """
+    Enumerates all of the values of an open registry key in a single call.
+
+    The key sizes are queried once and RegEnumValueW() is called for each
+    index with the same buffers, instead of calling EnumValue() repeatedly.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Returns:
+        list of (name, data, type) tuples as returned by EnumValue()
+    Exception:
+        ``WindowsError`` or ``FileNotFileError``
+    """
+
+    # Handles from the native winreg module are used, but not closed
+    if isinstance(key, PyHKEY):
+        hkey = key.hkey
+    else:
+        hkey = int(key)
+
+    # Get the sizes of the largest entries
+    value_size = DWORD()
+    data_size = DWORD()
+    check_LRESULT(
+        RegQueryInfoKeyW(hkey, None, None, None, None, None, None, None,
+                         byref(value_size), byref(data_size), None, None))
+
+    # Include null terminators
+    save_value_size = value_size.value + 1
+    save_data_size = data_size.value + 1
+
+    value_buf = create_unicode_buffer(save_value_size)
+    data_buf = create_string_buffer(save_data_size)
+    typ = DWORD()
+    result = []
+    index = 0
+    while True:
+        value_size.value = save_value_size
+        data_size.value = save_data_size
+        rc = RegEnumValueW(hkey, index, value_buf, byref(value_size), None,
+                           byref(typ), data_buf, byref(data_size))
+
+        # The key changed while being walked? Make room and retry.
+        if rc == ERROR_MORE_DATA:
+            # Value names are never larger than 16383 characters
+            if save_value_size < 16384:
+                save_value_size = 16384
+                value_buf = create_unicode_buffer(save_value_size)
+            save_data_size = max(save_data_size * 2, data_size.value)
+            data_buf = create_string_buffer(save_data_size)
+            continue
+
+        if rc != ERROR_SUCCESS:
+            if rc == ERROR_NO_MORE_ITEMS:
+                break
+            check_LRESULT(rc)
+
+        result.append((value_buf[:value_size.value],
+                       from_registry_bytes(data_buf, data_size, typ),
+                       typ.value))
+        index += 1
+    return result
+
+########################################
+
+
 def ExpandEnvironmentStrings(str):
     """
     Expands environment variables.
@@ -1306,30 +1429,19 @@ def QueryReflectionKey(key):
 ########################################
 
 
-def convert_to_windows_path(path_name):
+def _cygpath(flag, path_name):
     """
-    Convert a MSYS/Cygwin path to windows if needed.
-
-    If the path is already Windows format, it will be returned unchanged.
+    Convert a pathname by running cygpath.
 
     Args:
-        path_name: Windows or Linux pathname
+        flag: "-w" to convert to Windows, "-u" to convert from Windows.
+        path_name: Pathname to convert.
     Return:
-        Pathname converted to Windows.
-    See Also:
-        convert_from_windows_path
+        Converted pathname or None on failure.
     """
 
-    # Network drive name?
-    if path_name.startswith("\\\\") or ":" in path_name:
-        return path_name
-
-    # The tool doesn't process ~ properly, help it by preprocessing here.
-    args = ("cygpath",
-            "-a",
-            "-w",
-            os.path.abspath(os.path.expanduser(path_name))
-            )
+    # Create command list
+    args = ("cygpath", "-a", flag, path_name)
 
     # Perform the conversion
     tempfp = subprocess.Popen(args, stdout=subprocess.PIPE,
@@ -1345,12 +1457,96 @@ def convert_to_windows_path(path_name):
 ########################################
 
 
+def _cygpath_many(flag, path_names):
+    """
+    Convert a list of pathnames by running cygpath once.
+
+    The pathnames are passed through stdin, one per line, so the length of
+    the list isn't limited by the size of the command line.
+
+    Args:
+        flag: "-w" to convert to Windows, "-u" to convert from Windows.
+        path_names: list of pathnames to convert.
+    Return:
+        list of converted pathnames, None for each failure.
+    """
+
+    # Names that can't be sent as a line are converted one at a time
+    if any("\n" in path_name for path_name in path_names):
+        return [_cygpath(flag, path_name) for path_name in path_names]
+
+    # Create command list
+    args = ("cygpath", "-a", flag, "-f", "-")
+
+    # Perform the conversion
+    tempfp = subprocess.Popen(args, stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+    stdoutstr, _ = tempfp.communicate("\n".join(path_names) + "\n")
+
+    # If the lines don't match up, find the failures one at a time
+    results = stdoutstr.splitlines()
+    if tempfp.returncode or len(results) != len(path_names):
+        return [_cygpath(flag, path_name) for path_name in path_names]
+    return results
+
+########################################
+
+
+## Translator created on first use from the mount table
+_TRANSLATOR = None
+
+
+def _translator():
+    """
+    Return the path translator for this system.
+
+    Returns:
+        CygwinPathTranslator instance.
+    """
+
+    # pylint: disable=global-statement
+    global _TRANSLATOR
+
+    if _TRANSLATOR is None:
+        _TRANSLATOR = CygwinPathTranslator.from_system(
+            _cygpath, _cygpath_many)
+    return _TRANSLATOR
+
+########################################
+
+
+def convert_to_windows_path(path_name):
+    """
+    Convert a MSYS/Cygwin path to windows if needed.
+
+    If the path is already Windows format, it will be returned unchanged.
+
+    The path is converted using the mount table, which is read once, so
+    cygpath isn't run for every call. Results are cached.
+
+    Args:
+        path_name: Windows or Linux pathname
+    Return:
+        Pathname converted to Windows.
+    See Also:
+        convert_from_windows_path
+    """
+
+    return _translator().to_windows(path_name)
+
+########################################
+
+
 def convert_from_windows_path(path_name):
     """
     Convert an absolute Windows path to Cygwin/MSYS2.
 
     If the path is already Cygwin/MSYS2 format, it will be returned unchanged.
 
+    The path is converted using the mount table, cygpath is only run for
+    network names that aren't mounted. Results are cached.
+
     Args:
         path_name: Absolute Windows pathname
     Return:
@@ -1359,23 +1555,49 @@ def convert_from_windows_path(path_name):
         convert_to_windows_path
     """
 
-    # Network drive name?
-    if path_name[0] in ("~", "/"):
-        return path_name
+    return _translator().from_windows(path_name)
 
-    # Create command list
-    args = ("cygpath", "-a", "-u", path_name)
+########################################
 
-    # Perform the conversion
-    tempfp = subprocess.Popen(args, stdout=subprocess.PIPE,
-                              stderr=None, universal_newlines=True)
-    # Get the string returned by cygpath
-    stdoutstr, _ = tempfp.communicate()
 
-    # Error? Fail
-    if tempfp.returncode:
-        return None
-    return stdoutstr.strip()
+def convert_to_windows_paths(path_names):
+    """
+    Convert a list of MSYS/Cygwin paths to windows.
+
+    All the pathnames are converted using the mount table, the ones it
+    doesn't cover are passed to a single run of cygpath.
+
+    Args:
+        path_names: iterable of Windows or Linux pathnames.
+    Return:
+        list of pathnames converted to Windows, in the same order, with
+        None for each pathname that couldn't be converted.
+    See Also:
+        convert_to_windows_path
+    """
+
+    return _translator().to_windows_many(path_names)
+
+########################################
+
+
+def convert_from_windows_paths(path_names):
+    """
+    Convert a list of absolute Windows paths to Cygwin/MSYS2.
+
+    All the pathnames are converted using the mount table, the ones it
+    doesn't cover are passed to a single run of cygpath.
+
+    Args:
+        path_names: iterable of absolute Windows pathnames.
+    Return:
+        list of pathnames converted to Linux, in the same order, with None
+        for each pathname that couldn't be converted.
+    See Also:
+        convert_from_windows_path
+    """
+
+    return _translator().from_windows_many(path_names)
 
 ########################################
 
@@ -1451,3 +1673,135 @@ def get_file_info(path_name, string_name):
                 # Return the final result removing the terminating zero
                 return wstring_at(record.value, length.value - 1)
     return None
+
+########################################
+
+
+def get_file_info_all(path_name):
+    """
+    Extract everything from a windows exe file version resource.
+
+    GetFileVersionInfoW() is called once, and every string of every
+    translation is returned along with the numeric versions from
+    VS_FIXEDFILEINFO.
+
+    Examples:
+        info = get_file_info_all("devenv.exe")
+        file_version = info["file_version"]
+
+    Args:
+        path_name: Name of the windows file.
+
+    Return:
+        None if the file has no version resource or an error, or the dict
+        described in wslwinreg.peinfo.VersionInfo.as_dict()
+    """
+
+    # Handle import for Cygwin
+    path_name = convert_to_windows_path(path_name)
+
+    # Ensure it's unicode
+    wchar_filename = LPWSTR(path_name)
+
+    # Call windows to get the data size
+    size = GetFileVersionInfoSizeW(wchar_filename, None)
+
+    # Was there no data to return?
+    if not size:
+        return None
+
+    # Extract the file data and parse all of it
+    res_data = create_string_buffer(size)
+    if not GetFileVersionInfoW(wchar_filename, 0, size, res_data):
+        return None
+    try:
+        return parse_version_info(res_data.raw).as_dict()
+    except ValueError:
+        return None
+
+########################################
+
+
+def DumpTree(key, sub_key=None, max_depth=None, access=KEY_READ):
+    # pylint: disable=line-too-long
+    """
+    Read an entire registry tree in a single call.
+
+    The key, every sub key and every value are walked and returned in one
+    list. Sub keys that can't be opened because access is denied are
+    skipped, any other error is raised.
+
+    Each entry in the returned list is a tuple of 3 items.
+
+    <table>
+    <tr><th>Index<th>Meaning
+    <tr><td>0<td>Path of the key relative to sub_key, "" for sub_key itself.
+    <tr><td>1<td>An integer giving when the key was last modified
+        as 100’s of nanoseconds since Jan 1, 1601.
+    <tr><td>2<td>list of (name, data, type) tuples as returned by EnumValue()
+    </table>
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that identifies the sub_key to dump, or None.
+        max_depth: Number of levels of sub keys to descend, None for all.
+        access: Is an integer that specifies an access mask used to open
+            every key in the tree. Default is KEY_READ.
+    Returns:
+        list of tuples, parents are listed before their sub keys.
+    Exception:
+        ``WindowsError`` or ``FileNotFileError``
+    """
+
+    result = []
+    if sub_key:
+        with OpenKey(key, sub_key, 0, access) as hkey:
+            _dump_key(hkey, u"", 0, max_depth, access, result)
+        return result
+
+    # Handles from the native winreg module are wrapped, but not closed
+    if isinstance(key, PyHKEY):
+        hkey = key
+    else:
+        hkey = PyHKEY(int(key))
+    try:
+        _dump_key(hkey, u"", 0, max_depth, access, result)
+    finally:
+        if hkey is not key:
+            hkey.Detach()
+    return result
+
+########################################
+
+
+def _dump_key(hkey, path, depth, max_depth, access, result):
+    """
+    Append a key, its values and its sub keys to a DumpTree() result.
+
+    Args:
+        hkey: PyHKEY of the key to dump.
+        path: Path of the key relative to the root of the dump.
+        depth: Number of levels below the root of the dump.
+        max_depth: Number of levels of sub keys to descend, None for all.
+        access: Access mask to open the sub keys with.
+        result: list to append the entries to.
+    """
+
+    last_write_time = QueryInfoKey(hkey)[2]
+    result.append((path, last_write_time, EnumValues(hkey)))
+
+    if max_depth is not None and depth >= max_depth:
+        return
+
+    for name in EnumKeys(hkey):
+        try:
+            sub_hkey = OpenKey(hkey, name, 0, access)
+        except OSError as error:
+            # Access denied, skip it
+            if getattr(error, "winerror", None) != ERROR_ACCESS_DENIED:
+                raise
+            continue
+        with sub_hkey:
+            _dump_key(sub_hkey, path + "\\" + name if path else name,
+                      depth + 1, max_depth, access, result)
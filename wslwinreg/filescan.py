@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Read the version resources of many files at once.
+
+The files are read by a pool of threads and the results are stored in a
+cache file, so files that haven't changed since the last scan are not read
+again.
+"""
+
+## \package wslwinreg.filescan
+
+# pylint: disable=consider-using-f-string
+
+import os
+import threading
+
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+from .common import get_cache_dir, read_json_file, write_json_file
+from .peinfo import VersionInfo
+
+## Type basestring for Python 2 compatibility
+try:
+    basestring  # type: ignore
+except NameError:
+    # Fake it for Python 3
+    basestring = str
+
+## Default number of threads reading files
+_WORKERS = 8
+
+## File extensions scanned when a folder is passed
+_EXTENSIONS = (".exe", ".dll", ".sys", ".ocx", ".cpl", ".drv", ".mui")
+
+## Version of the layout of the cache file
+_CACHE_VERSION = 1
+
+########################################
+
+
+def get_scan_cache_path():
+    """
+    Return the pathname of the file caching the scanned version resources.
+
+    Returns:
+        Pathname of the cache file.
+    """
+
+    return os.path.join(get_cache_dir(), "file_info.json")
+
+########################################
+
+
+def _list_files(paths_or_root, extensions):
+    """
+    Return the list of files to scan.
+
+    Args:
+        paths_or_root: Folder to scan recursively, a single file, or an
+            iterable of pathnames.
+        extensions: File extensions to pick when scanning a folder.
+    Returns:
+        tuple of the list of pathnames and the host pathname of the folder,
+        or None if paths_or_root isn't a folder.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from . import convert_from_windows_path
+
+    if not isinstance(paths_or_root, basestring):
+        return list(paths_or_root), None
+
+    root = convert_from_windows_path(paths_or_root)
+    if not os.path.isdir(root):
+        return [paths_or_root], None
+
+    result = []
+    for folder, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(extensions):
+                result.append(os.path.join(folder, name))
+    return result, root
+
+########################################
+
+
+def _from_json(info):
+    """
+    Restore the tuples of a dict from get_file_info_all() read from JSON.
+
+    Args:
+        info: dict as stored in the cache or None.
+    Returns:
+        dict matching the one returned by get_file_info_all() or None.
+    """
+
+    if info is None:
+        return None
+    info["translations"] = [tuple(item) for item in info["translations"]]
+    for key in ("file_version", "product_version"):
+        if info[key] is not None:
+            info[key] = tuple(info[key])
+    return info
+
+########################################
+
+
+def _select(info, fields):
+    """
+    Pick the requested strings from the default translation.
+
+    The strings are looked up like get_file_info() does, with
+    VersionInfo.query().
+
+    Args:
+        info: dict returned by get_file_info_all() or None.
+        fields: list of string names or None for the whole dict.
+    Returns:
+        dict of the requested strings, the whole dict, or None.
+    """
+
+    if fields is None or info is None:
+        return info
+
+    version_info = VersionInfo(translations=info["translations"],
+                               string_tables=info["strings"])
+    return dict((field, version_info.query(field)) for field in fields)
+
+########################################
+
+
+def scan_file_info(paths_or_root, fields=None, workers=_WORKERS,
+                   extensions=_EXTENSIONS, use_cache=True):
+    r"""
+    Read the version resources of many files in parallel.
+
+    The files are read with get_file_info_all() by a pool of threads. The
+    results are kept in the file returned by get_scan_cache_path(), keyed
+    by the pathname, size and modification time, so unchanged files are
+    not read again on the next scan. When a folder is scanned, the entries
+    of files in it that weren't found are removed from the cache.
+
+    Examples:
+        versions = scan_file_info(
+            "C:\\Program Files\\Microsoft Visual Studio",
+            ["FileVersion", "ProductVersion"], workers=16)
+
+    Args:
+        paths_or_root: Folder to scan recursively, a single file, or an
+            iterable of pathnames.
+        fields: list of string names, such as "FileVersion", to read from
+            the default translation, or None for everything.
+        workers: Number of threads reading files.
+        extensions: File extensions to pick when scanning a folder.
+        use_cache: False to neither read nor update the cache file.
+    Returns:
+        dict mapping each pathname to a dict of the requested strings, the
+        dict returned by get_file_info_all() if fields is None, or None if
+        the file has no version resource.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from . import __version__, get_file_info_all, convert_from_windows_path
+
+    path_names, root = _list_files(paths_or_root, extensions)
+
+    cache_path = get_scan_cache_path()
+    cache = read_json_file(cache_path) if use_cache else None
+    if not cache or cache.get("version") != [__version__, _CACHE_VERSION]:
+        cache = {"version": [__version__, _CACHE_VERSION], "files": {}}
+    entries = cache["files"]
+
+    results = {}
+    seen = set()
+    pending = queue.Queue()
+    for path_name in path_names:
+        host_name = convert_from_windows_path(path_name)
+        try:
+            stat = os.stat(host_name)
+        except (OSError, TypeError):
+            results[path_name] = None
+            continue
+
+        key = os.path.abspath(host_name)
+        seen.add(key)
+        entry = entries.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            results[path_name] = _select(_from_json(entry[2]), fields)
+        else:
+            pending.put((path_name, key, stat.st_size, stat.st_mtime))
+
+    # Drop the files that were deleted from the folder
+    updated = []
+    if root is not None:
+        prefix = os.path.join(os.path.abspath(root), "")
+        for key in list(entries):
+            if key.startswith(prefix) and key not in seen:
+                del entries[key]
+                updated.append(key)
+
+    lock = threading.Lock()
+
+    def worker():
+        """
+        Read files until the queue is empty.
+        """
+
+        while True:
+            try:
+                path_name, key, size, mtime = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                info = get_file_info_all(path_name)
+            # pylint: disable=broad-except
+            except Exception:
+                # Not cached, so it's tried again next time
+                with lock:
+                    results[path_name] = None
+                continue
+            with lock:
+                entries[key] = [size, mtime, info]
+                results[path_name] = _select(info, fields)
+                updated.append(key)
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(max(1, min(workers, pending.qsize())))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if use_cache and updated:
+        write_json_file(cache_path, cache)
+    return results
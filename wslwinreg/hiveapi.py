@@ -0,0 +1,995 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Read only access to Windows registry hive files without Windows.
+
+Hive files, such as NTUSER.DAT, the files in Windows\\System32\\config or
+the output of SaveKey(), are memory mapped and parsed in place. Key and
+value cells are decoded the first time they are visited, so reading a few
+keys from a large hive only touches the pages holding them.
+
+@code
+    with OpenHive("/mnt/c/backup/SOFTWARE") as root:
+        with OpenKey(root, "Microsoft\\\\Windows NT\\\\CurrentVersion") as key:
+            print(QueryValueEx(key, "ProductName")[0])
+@endcode
+"""
+
+## \package wslwinreg.hiveapi
+
+# Disable camel case requirement for function names
+# pylint: disable=invalid-name
+# pylint: disable=useless-object-inheritance
+# pylint: disable=unused-argument
+# pylint: disable=consider-using-f-string
+
+import mmap
+import threading
+from struct import unpack_from, error as StructError
+
+from .common import KEY_READ, PY2, ERROR_FILE_NOT_FOUND, \
+    ERROR_NO_MORE_ITEMS, REG_DWORD, REG_QWORD, registry_error, \
+    from_registry_bytes
+
+## The handle is invalid.
+ERROR_INVALID_HANDLE = 0x00000006
+
+## The configuration registry database is corrupt.
+ERROR_BADDB = 0x000003f1
+
+## Messages for the errors raised by this module
+_MESSAGES = {
+    ERROR_FILE_NOT_FOUND: "The system cannot find the file specified.",
+    ERROR_INVALID_HANDLE: "The handle is invalid.",
+    ERROR_NO_MORE_ITEMS: "No more data is available.",
+    ERROR_BADDB: "The configuration registry database is corrupt."
+}
+
+## Size of the base block, hive bins start after it
+_BASE_BLOCK_SIZE = 0x1000
+
+## Key name is stored as ASCII instead of UTF-16
+_KEY_COMP_NAME = 0x0020
+
+## Value name is stored as ASCII instead of UTF-16
+_VALUE_COMP_NAME = 0x0001
+
+## Bit set in a value size when the data is stored in the offset field
+_DATA_IN_OFFSET = 0x80000000
+
+## Largest value stored in a single cell in hives version 1.4 and later
+_MAX_CELL_DATA = 16344
+
+########################################
+
+
+def _error(winerror, filename=None):
+    """
+    Create the exception a Windows registry call would raise.
+
+    Args:
+        winerror: Windows error code.
+        filename: Name of the hive or key responsible, if applicable.
+    Returns:
+        ``FileNotFoundError`` or ``OSError`` from registry_error().
+    """
+
+    return registry_error(winerror, _MESSAGES[winerror], filename)
+
+########################################
+
+
+def _decode_name(data, offset, size, compressed):
+    """
+    Decode the name of a key or value.
+
+    Args:
+        data: Buffer holding the hive.
+        offset: Offset of the name.
+        size: Size of the name in bytes.
+        compressed: True if the name is stored one byte per character.
+    Returns:
+        Decoded name.
+    """
+
+    if compressed:
+        return data[offset:offset + size].decode("latin-1")
+    return data[offset:offset + size].decode("utf-16-le", "replace")
+
+########################################
+
+
+class Hive(object):
+    """
+    A memory mapped registry hive file.
+
+    The hive stays mapped while any HiveKey opened from it is open. Decoded
+    keys are kept, so each key cell is only parsed once.
+
+    Attributes:
+        file_name: Name of the hive file.
+        data: Memory map of the file.
+        version: tuple of the major and minor format version.
+    """
+
+    def __init__(self, file_name):
+        """
+        Map a hive file and check its base block.
+
+        Args:
+            file_name: Host pathname of the hive file.
+        Exception:
+            ``OSError`` if the file can't be read or isn't a hive.
+        """
+
+        ## Name of the hive file
+        self.file_name = file_name
+
+        try:
+            with open(file_name, "rb") as fileref:
+                data = mmap.mmap(fileref.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            raise _error(ERROR_BADDB, file_name)
+
+        try:
+            if len(data) < _BASE_BLOCK_SIZE or data[0:4] != b"regf":
+                raise _error(ERROR_BADDB, file_name)
+            major, minor = unpack_from("<II", data, 0x14)
+            root_offset = unpack_from("<I", data, 0x24)[0]
+        except BaseException:
+            data.close()
+            raise
+
+        ## tuple of the major and minor format version
+        self.version = (major, minor)
+
+        ## Memory map of the file, None once closed
+        self.data = data
+
+        ## Cell offset of the root key
+        self._root_offset = root_offset
+
+        ## Decoded keys, keyed by cell offset
+        self._nodes = {}
+
+        ## Number of open HiveKey handles
+        self._handles = 0
+
+        ## Lock for the handle count
+        self._lock = threading.Lock()
+
+    def cell(self, offset):
+        """
+        Locate the data of an allocated cell.
+
+        Args:
+            offset: Cell offset, relative to the first hive bin.
+        Returns:
+            tuple of the file offsets of the start and end of the cell data.
+        Exception:
+            ``OSError`` if the cell is free or out of the file.
+        """
+
+        start = _BASE_BLOCK_SIZE + offset
+        try:
+            size = unpack_from("<i", self.data, start)[0]
+        except (StructError, TypeError, ValueError):
+            raise _error(ERROR_BADDB, self.file_name)
+
+        # Allocated cells have a negative size
+        end = start - size
+        if size >= 0 or end > len(self.data):
+            raise _error(ERROR_BADDB, self.file_name)
+        return start + 4, end
+
+    def node(self, offset):
+        """
+        Return the decoded key at a cell offset.
+
+        Args:
+            offset: Cell offset of the nk record.
+        Returns:
+            HiveNode instance.
+        """
+
+        node = self._nodes.get(offset)
+        if node is None:
+            node = HiveNode(self, offset)
+            self._nodes[offset] = node
+        return node
+
+    def root(self):
+        """
+        Return the decoded root key.
+
+        Returns:
+            HiveNode instance of the root key.
+        """
+
+        return self.node(self._root_offset)
+
+    def acquire(self):
+        """
+        Count a new open handle.
+        """
+
+        with self._lock:
+            if self.data is None:
+                raise _error(ERROR_INVALID_HANDLE, self.file_name)
+            self._handles += 1
+
+    def release(self):
+        """
+        Count a closed handle, unmapping the file after the last one.
+        """
+
+        with self._lock:
+            self._handles -= 1
+            if not self._handles:
+                self.close()
+
+    def close(self):
+        """
+        Unmap the file, invalidating every decoded key.
+        """
+
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+            self._nodes = {}
+
+########################################
+
+
+class HiveNode(object):
+    """
+    A key decoded from an nk cell.
+
+    The fixed part of the record is decoded on creation. The lists of sub
+    keys and values are only read when first used, and an index of the
+    names is built on the first lookup.
+
+    Attributes:
+        name: Name of the key.
+        last_write_time: When the key was last modified as 100's of
+            nanoseconds since Jan 1, 1601.
+        subkey_count: Number of sub keys.
+        value_count: Number of values.
+    """
+
+    def __init__(self, hive, offset):
+        """
+        Decode the fixed part of an nk record.
+
+        Args:
+            hive: Hive holding the key.
+            offset: Cell offset of the nk record.
+        """
+
+        data = hive.data
+        start, end = hive.cell(offset)
+        if data[start:start + 2] != b"nk" or end - start < 0x4C:
+            raise _error(ERROR_BADDB, hive.file_name)
+
+        flags, last_write_time = unpack_from("<HQ", data, start + 2)
+        subkey_count, _, subkey_list, _, value_count, value_list = \
+            unpack_from("<6I", data, start + 0x14)
+        name_size = unpack_from("<H", data, start + 0x48)[0]
+
+        ## Hive holding the key
+        self.hive = hive
+
+        ## Name of the key
+        self.name = _decode_name(data, start + 0x4C,
+                                 min(name_size, end - start - 0x4C),
+                                 flags & _KEY_COMP_NAME)
+
+        ## 100's of nanoseconds since Jan 1, 1601
+        self.last_write_time = last_write_time
+
+        ## Number of sub keys
+        self.subkey_count = subkey_count
+
+        ## Number of values
+        self.value_count = value_count
+
+        ## Cell offset of the sub key list
+        self._subkey_list = subkey_list
+
+        ## Cell offset of the value list
+        self._value_list = value_list
+
+        ## Cell offsets of the sub keys, read on first use
+        self._subkeys = None
+
+        ## dict of upper case sub key names to cell offsets
+        self._subkey_index = None
+
+        ## Cell offsets of the values, read on first use
+        self._values = None
+
+        ## dict of upper case value names to cell offsets
+        self._value_index = None
+
+    def _read_list(self, offset, nested=False):
+        """
+        Read a sub key list cell.
+
+        Args:
+            offset: Cell offset of an li, lf, lh or ri record.
+            nested: True when reading a list referenced by an ri record.
+        Returns:
+            list of cell offsets of the sub keys.
+        """
+
+        data = self.hive.data
+        start, end = self.hive.cell(offset)
+        signature = data[start:start + 2]
+        count = unpack_from("<H", data, start + 2)[0]
+
+        # lf and lh records hold a hint after each offset
+        step = 2 if signature in (b"lf", b"lh") else 1
+        if (signature not in (b"li", b"lf", b"lh", b"ri") or
+                (nested and signature == b"ri") or
+                start + 4 + count * step * 4 > end):
+            raise _error(ERROR_BADDB, self.hive.file_name)
+
+        offsets = unpack_from("<%dI" % (count * step), data, start + 4)
+        if step == 2:
+            return list(offsets[0::2])
+        if signature == b"li":
+            return list(offsets)
+
+        result = []
+        for item in offsets:
+            result.extend(self._read_list(item, True))
+        return result
+
+    def subkeys(self):
+        """
+        Return the cell offsets of the sub keys, in enumeration order.
+
+        Returns:
+            list of cell offsets.
+        """
+
+        if self._subkeys is None:
+            if self.subkey_count:
+                self._subkeys = self._read_list(self._subkey_list)
+            else:
+                self._subkeys = []
+        return self._subkeys
+
+    def subkey(self, name):
+        """
+        Find a sub key by name, ignoring case.
+
+        Args:
+            name: Name of the sub key, without backslashes.
+        Returns:
+            HiveNode instance or None if not found.
+        """
+
+        if self._subkey_index is None:
+            index = {}
+            for offset in self.subkeys():
+                index[self.hive.node(offset).name.upper()] = offset
+            self._subkey_index = index
+
+        offset = self._subkey_index.get(name.upper())
+        if offset is None:
+            return None
+        return self.hive.node(offset)
+
+    def find(self, sub_key):
+        """
+        Follow a path of sub keys.
+
+        Args:
+            sub_key: Path of the sub key, with backslashes, None or empty.
+        Returns:
+            HiveNode instance or None if not found.
+        """
+
+        node = self
+        for name in (sub_key or u"").split(u"\\"):
+            if name:
+                node = node.subkey(name)
+                if node is None:
+                    return None
+        return node
+
+    def values(self):
+        """
+        Return the cell offsets of the values, in enumeration order.
+
+        Returns:
+            list of cell offsets.
+        """
+
+        if self._values is None:
+            if self.value_count:
+                start, end = self.hive.cell(self._value_list)
+                if start + self.value_count * 4 > end:
+                    raise _error(ERROR_BADDB, self.hive.file_name)
+                self._values = list(unpack_from(
+                    "<%dI" % self.value_count, self.hive.data, start))
+            else:
+                self._values = []
+        return self._values
+
+    def value_name(self, offset):
+        """
+        Decode the name of a value.
+
+        Args:
+            offset: Cell offset of the vk record.
+        Returns:
+            Name of the value, empty for the default value.
+        """
+
+        data = self.hive.data
+        start, end = self.hive.cell(offset)
+        if data[start:start + 2] != b"vk" or end - start < 0x14:
+            raise _error(ERROR_BADDB, self.hive.file_name)
+        name_size = unpack_from("<H", data, start + 2)[0]
+        flags = unpack_from("<H", data, start + 0x10)[0]
+        return _decode_name(data, start + 0x14,
+                            min(name_size, end - start - 0x14),
+                            flags & _VALUE_COMP_NAME)
+
+    def value_data(self, offset):
+        """
+        Decode the data of a value.
+
+        Args:
+            offset: Cell offset of the vk record.
+        Returns:
+            tuple of the converted data and the registry type.
+        """
+
+        hive = self.hive
+        data = hive.data
+        start = hive.cell(offset)[0]
+        size, data_offset, typ = unpack_from("<III", data, start + 4)
+
+        if size & _DATA_IN_OFFSET:
+            # Small values are stored in place of the offset
+            size &= ~_DATA_IN_OFFSET
+            raw = data[start + 8:start + 8 + min(size, 4)]
+        elif not size:
+            raw = b""
+        else:
+            cell_start, cell_end = hive.cell(data_offset)
+            if size > _MAX_CELL_DATA and hive.version >= (1, 4) and \
+                    data[cell_start:cell_start + 2] == b"db":
+                raw = self._big_data(cell_start, size)
+            else:
+                raw = data[cell_start:min(cell_start + size, cell_end)]
+
+        # Corrupt integers are padded rather than rejected
+        if typ == REG_DWORD and 0 < len(raw) < 4:
+            raw = raw + b"\0" * (4 - len(raw))
+        elif typ == REG_QWORD and 0 < len(raw) < 8:
+            raw = raw + b"\0" * (8 - len(raw))
+        return from_registry_bytes(raw, len(raw), typ), typ
+
+    def _big_data(self, start, size):
+        """
+        Join the segments of a value stored in a db record.
+
+        Args:
+            start: File offset of the db record data.
+            size: Size of the value in bytes.
+        Returns:
+            bytes of the value.
+        """
+
+        hive = self.hive
+        data = hive.data
+        count, segments = unpack_from("<HI", data, start + 2)
+        list_start, list_end = hive.cell(segments)
+        if list_start + count * 4 > list_end:
+            raise _error(ERROR_BADDB, hive.file_name)
+
+        chunks = []
+        remaining = size
+        for segment in unpack_from("<%dI" % count, data, list_start):
+            chunk_start, chunk_end = hive.cell(segment)
+            chunk = data[chunk_start:min(
+                chunk_start + min(remaining, _MAX_CELL_DATA), chunk_end)]
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            if remaining <= 0:
+                break
+        return b"".join(chunks)
+
+    def value(self, name):
+        """
+        Find a value by name, ignoring case.
+
+        Args:
+            name: Name of the value, None or empty for the default value.
+        Returns:
+            Cell offset of the vk record or None if not found.
+        """
+
+        if self._value_index is None:
+            index = {}
+            for offset in self.values():
+                index.setdefault(self.value_name(offset).upper(), offset)
+            self._value_index = index
+        return self._value_index.get((name or u"").upper())
+
+########################################
+
+
+class HiveKey(object):
+    """
+    A handle to a key of an open hive.
+
+    Handles are returned by OpenHive() and OpenKey() and accepted by every
+    function of this module. Like PyHKEY, they can be closed with Close()
+    or CloseKey(), used in a ``with`` statement, and are true while open.
+    The hive file is unmapped when its last handle is closed.
+    """
+
+    def __init__(self, hive, node):
+        """
+        Open a handle to a decoded key.
+
+        Args:
+            hive: Hive holding the key.
+            node: HiveNode of the key.
+        """
+
+        hive.acquire()
+
+        ## Hive holding the key
+        self.hive = hive
+
+        ## HiveNode of the key, None once closed
+        self.node = node
+
+    def __del__(self):
+        """
+        Called when this object is garbage collected.
+        """
+        self.Close()
+
+    def Close(self):
+        """
+        Closes the handle.
+
+        Note:
+            If the handle is already closed, no error is raised.
+        """
+        if getattr(self, "node", None) is not None:
+            self.node = None
+            self.hive.release()
+
+    def __enter__(self):
+        """
+        Called when object is entered.
+
+        Note:
+            Needed for the Python ``with`` statement.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        """
+        Release handle on class destruction.
+
+        Note:
+            Needed for the Python ``with`` statement.
+        """
+        self.Close()
+        return False
+
+    if PY2:
+        def __nonzero__(self):
+            """
+            Handles with an open key return true, otherwise false.
+            """
+            return self.node is not None
+    else:
+        def __bool__(self):
+            """
+            Handles with an open key return true, otherwise false.
+            """
+            return self.node is not None
+
+    def __repr__(self):
+        """
+        Return descriptive string for the class object.
+        """
+        if self.node is None:
+            return "<HiveKey at %08X (closed)>" % id(self)
+        return "<HiveKey at %08X (%s)>" % (id(self), self.node.name)
+
+########################################
+
+
+def _node(key):
+    """
+    Return the decoded key of an open handle.
+
+    Args:
+        key: HiveKey instance.
+    Returns:
+        HiveNode instance.
+    Exception:
+        ``OSError`` if the handle isn't an open HiveKey.
+    """
+
+    node = getattr(key, "node", None) if isinstance(key, HiveKey) else None
+    if node is None:
+        raise _error(ERROR_INVALID_HANDLE)
+    return node
+
+########################################
+
+
+def OpenHive(file_name):
+    """
+    Open a registry hive file for reading.
+
+    The file is memory mapped, so only the pages holding the keys and values
+    that are read are loaded. Hives copied from a running system may have
+    changes pending in their .LOG files, those changes are not applied.
+
+    Args:
+        file_name: Host pathname of the hive file.
+    Returns:
+        HiveKey of the root key of the hive.
+    Exception:
+        ``OSError`` if the file can't be read or isn't a hive.
+    """
+
+    hive = Hive(file_name)
+    try:
+        root = hive.root()
+    except (StructError, OSError):
+        hive.close()
+        raise _error(ERROR_BADDB, file_name)
+    return HiveKey(hive, root)
+
+########################################
+
+
+def CloseKey(hkey):
+    """
+    Closes a previously opened registry key.
+
+    Note:
+        If ``hkey`` is not closed using this method (or via hkey.Close()),
+        it is closed when the ``hkey`` object is destroyed by Python.
+
+    Args:
+        hkey: A previously opened key.
+    """
+
+    if isinstance(hkey, HiveKey):
+        hkey.Close()
+
+########################################
+
+
+def OpenKey(key, sub_key, reserved=0, access=KEY_READ):
+    """
+    Opens the specified key, returning a handle object.
+
+    Names are matched without regard to case, as Windows does.
+
+    Args:
+        key: Is an already open HiveKey.
+        sub_key: Is a string that identifies the sub_key to open.
+        reserved: Is a reserved integer, and must be zero. The default is
+            zero.
+        access: Ignored, hives are always opened for reading.
+    Returns:
+        A new HiveKey.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    node = _node(key)
+    try:
+        found = node.find(sub_key)
+    except StructError:
+        raise _error(ERROR_BADDB, node.hive.file_name)
+    if found is None:
+        raise _error(ERROR_FILE_NOT_FOUND, sub_key)
+    return HiveKey(node.hive, found)
+
+########################################
+
+
+def OpenKeyEx(key, sub_key, reserved=0, access=KEY_READ):
+    """
+    Opens the specified key, returning a handle object.
+
+    Note:
+        Identical to OpenKey().
+
+    Args:
+        key: Is an already open HiveKey.
+        sub_key: Is a string that identifies the sub_key to open.
+        reserved: Is a reserved integer, and must be zero. The default is
+            zero.
+        access: Ignored, hives are always opened for reading.
+    Returns:
+        A new HiveKey.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    return OpenKey(key, sub_key, reserved, access)
+
+########################################
+
+
+def EnumKey(key, index):
+    """
+    Enumerates subkeys of an open registry key, returning a string.
+
+    Args:
+        key: Is an already open HiveKey.
+        index: Is an integer that identifies the index of the key to retrieve.
+    Returns:
+        Name of the sub key.
+    Exception:
+        ``OSError`` with ERROR_NO_MORE_ITEMS after the last sub key.
+    """
+
+    names = EnumKeys(key, index, 1)
+    if not names:
+        raise _error(ERROR_NO_MORE_ITEMS)
+    return names[0]
+
+########################################
+
+
+def EnumKeys(key, start=0, count=None, with_times=False):
+    """
+    Enumerates many subkeys of an open registry key in a single call.
+
+    Args:
+        key: Is an already open HiveKey.
+        start: Index of the first subkey to retrieve.
+        count: Maximum number of subkeys to retrieve, None for all.
+        with_times: If True, return (name, last_write_time) tuples with
+            the time as 100’s of nanoseconds since Jan 1, 1601.
+    Returns:
+        list of subkey names, or list of tuples if with_times is True.
+    Exception:
+        ``OSError``
+    """
+
+    node = _node(key)
+    try:
+        offsets = node.subkeys()[start:]
+        if count is not None:
+            offsets = offsets[:count]
+        nodes = [node.hive.node(offset) for offset in offsets]
+    except StructError:
+        raise _error(ERROR_BADDB, node.hive.file_name)
+
+    if with_times:
+        return [(item.name, item.last_write_time) for item in nodes]
+    return [item.name for item in nodes]
+
+########################################
+
+
+def EnumValue(key, index):
+    # pylint: disable=line-too-long
+    """
+    Enumerates values of an open registry key, returning a tuple.
+
+    <table>
+    <tr><th>Index<th>Meaning
+    <tr><td>0<td>A string that identifies the value.
+    <tr><td>1<td>An object that holds the value data,
+        and whose type depends on the underlying registry type
+    <tr><td>2<td>An integer that identifies the type of the value data
+    </table>
+
+    Args:
+        key: Is an already open HiveKey.
+        index: Is an integer that identifies the index of the value to retrieve.
+    Returns:
+       A tuple of 3 items.
+    Exception:
+        ``OSError`` with ERROR_NO_MORE_ITEMS after the last value.
+    """
+
+    node = _node(key)
+    try:
+        offsets = node.values()
+        if index < 0 or index >= len(offsets):
+            raise _error(ERROR_NO_MORE_ITEMS)
+        offset = offsets[index]
+        return (node.value_name(offset),) + node.value_data(offset)
+    except StructError:
+        raise _error(ERROR_BADDB, node.hive.file_name)
+
+########################################
+
+
+def EnumValues(key):
+    """
+    Enumerates all of the values of an open registry key in a single call.
+
+    Args:
+        key: Is an already open HiveKey.
+    Returns:
+        list of (name, data, type) tuples as returned by EnumValue()
+    Exception:
+        ``OSError``
+    """
+
+    node = _node(key)
+    try:
+        return [(node.value_name(offset),) + node.value_data(offset)
+                for offset in node.values()]
+    except StructError:
+        raise _error(ERROR_BADDB, node.hive.file_name)
+
+########################################
+
+
+def QueryInfoKey(key):
+    # pylint: disable=line-too-long
+    """
+    Returns information about a key, as a tuple.
+
+    <table>
+    <tr><th>Index<th>Meaning
+    <tr><td>0<td>An integer giving the number of sub keys this key has.
+    <tr><td>1<td>An integer giving the number of values this key has.
+    <tr><td>2<td>An integer giving when the key was last modified
+        as 100’s of nanoseconds since Jan 1, 1601.
+    </table>
+
+    Args:
+        key: Is an already open HiveKey.
+    Returns:
+        A tuple of 3 items.
+    Exception:
+        ``OSError``
+    """
+
+    node = _node(key)
+    return (node.subkey_count, node.value_count, node.last_write_time)
+
+########################################
+
+
+def QueryValue(key, sub_key):
+    """
+    Retrieves the unnamed value for a key, as a string.
+
+    Args:
+        key: Is an already open HiveKey.
+        sub_key: Is a string that holds the name of the subkey with which the
+            value is associated. If this parameter is None or empty, the
+            default value of ``key`` is read.
+    Returns:
+        The string, or an empty string if the key has no default value.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    with OpenKey(key, sub_key) as hkey:
+        node = hkey.node
+        try:
+            offset = node.value(None)
+            if offset is None:
+                return u""
+            value = node.value_data(offset)[0]
+        except StructError:
+            raise _error(ERROR_BADDB, node.hive.file_name)
+
+    # Only strings are returned by RegQueryValueW()
+    if not isinstance(value, type(u"")):
+        return u""
+    return value
+
+########################################
+
+
+def QueryValueEx(key, value_name):
+    """
+    Retrieves the type and data for a specified value name.
+
+    | Index | Meaning |
+    | ----- | ------- |
+    | 0 | The value of the registry item. |
+    | 1 | An integer giving the registry type for this value. |
+
+    Args:
+        key: Is an already open HiveKey.
+        value_name: Is a string indicating the value to query.
+    Returns:
+        A tuple of 2 items.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    node = _node(key)
+    try:
+        offset = node.value(value_name)
+        if offset is None:
+            raise _error(ERROR_FILE_NOT_FOUND, value_name)
+        return node.value_data(offset)
+    except StructError:
+        raise _error(ERROR_BADDB, node.hive.file_name)
+
+########################################
+
+
+def DumpTree(key, sub_key=None, max_depth=None, access=KEY_READ):
+    # pylint: disable=line-too-long
+    """
+    Read an entire registry tree in a single call.
+
+    Each entry in the returned list is a tuple of 3 items.
+
+    <table>
+    <tr><th>Index<th>Meaning
+    <tr><td>0<td>Path of the key relative to sub_key, "" for sub_key itself.
+    <tr><td>1<td>An integer giving when the key was last modified
+        as 100’s of nanoseconds since Jan 1, 1601.
+    <tr><td>2<td>list of (name, data, type) tuples as returned by EnumValue()
+    </table>
+
+    Args:
+        key: Is an already open HiveKey.
+        sub_key: Is a string that identifies the sub_key to dump, or None.
+        max_depth: Number of levels of sub keys to descend, None for all.
+        access: Ignored, hives are always opened for reading.
+    Returns:
+        list of tuples, parents are listed before their sub keys.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    result = []
+    with OpenKey(key, sub_key) as hkey:
+        node = hkey.node
+        try:
+            _dump_node(node, u"", 0, max_depth, result)
+        except StructError:
+            raise _error(ERROR_BADDB, node.hive.file_name)
+    return result
+
+########################################
+
+
+def _dump_node(node, path, depth, max_depth, result):
+    """
+    Append a key, its values and its sub keys to a DumpTree() result.
+
+    Args:
+        node: HiveNode of the key to dump.
+        path: Path of the key relative to the root of the dump.
+        depth: Number of levels below the root of the dump.
+        max_depth: Number of levels of sub keys to descend, None for all.
+        result: list to append the entries to.
+    """
+
+    values = [(node.value_name(offset),) + node.value_data(offset)
+              for offset in node.values()]
+    result.append((path, node.last_write_time, values))
+
+    if max_depth is not None and depth >= max_depth:
+        return
+
+    for offset in node.subkeys():
+        child = node.hive.node(offset)
+        _dump_node(child, path + u"\\" + child.name if path else child.name,
+                   depth + 1, max_depth, result)
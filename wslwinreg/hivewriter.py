@@ -0,0 +1,761 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Build registry hive files without Windows.
+
+A tree of keys and values, in the format returned by DumpTree(), or the
+contents of a .reg file are written to a hive file in one pass. The file
+can be loaded with LoadKey() or read with the hiveapi module.
+
+@code
+    tree = [
+        (u"", None, [(u"Version", u"1.0", REG_SZ)]),
+        (u"Settings", None, [(u"Count", 4, REG_DWORD)])]
+    write_hive("/tmp/provision.hiv", tree)
+@endcode
+"""
+
+## \package wslwinreg.hivewriter
+
+# pylint: disable=useless-object-inheritance
+# pylint: disable=consider-using-f-string
+
+import os
+import re
+import time
+import codecs
+from struct import pack, pack_into, unpack_from
+from binascii import unhexlify
+
+from .common import REG_SZ, REG_EXPAND_SZ, REG_MULTI_SZ, REG_DWORD, \
+    REG_BINARY, to_registry_bytes, from_registry_bytes
+
+## Size of the base block, hive bins start after it
+_BASE_BLOCK_SIZE = 0x1000
+
+## Size of a hive bin header
+_BIN_HEADER_SIZE = 0x20
+
+## Hive bins are multiples of this size
+_BIN_SIZE = 0x1000
+
+## Key name is stored as ASCII instead of UTF-16
+_KEY_COMP_NAME = 0x0020
+
+## Root key of the hive, which can't be deleted
+_KEY_HIVE_ENTRY = 0x0004 | 0x0008
+
+## Value name is stored as ASCII instead of UTF-16
+_VALUE_COMP_NAME = 0x0001
+
+## Bit set in a value size when the data is stored in the offset field
+_DATA_IN_OFFSET = 0x80000000
+
+## Largest value stored in a single cell, larger ones are split into a db
+_MAX_CELL_DATA = 16344
+
+## Largest number of entries Windows puts in one lh list
+_MAX_LIST_ENTRIES = 1012
+
+## Offset used for lists that don't exist
+_NO_CELL = 0xFFFFFFFF
+
+## Difference between the Unix and FILETIME epochs in seconds
+_EPOCH_DELTA = 11644473600
+
+## Security descriptor given to every key. Full control for SYSTEM and
+# Administrators, read access for Users, inherited by sub keys.
+_SECURITY = (
+    # Revision, control (self relative, DACL present), owner, group,
+    # SACL and DACL offsets
+    pack("<BBHIIII", 1, 0, 0x8004, 20, 36, 0, 52) +
+    # Owner and group, BUILTIN\Administrators
+    pack("<BB6sII", 1, 2, b"\0\0\0\0\0\5", 32, 544) +
+    pack("<BB6sII", 1, 2, b"\0\0\0\0\0\5", 32, 544) +
+    # DACL with three container inherited ACCESS_ALLOWED entries
+    pack("<BBHHH", 2, 0, 8 + 20 + 24 + 24, 3, 0) +
+    pack("<BBHIBB6sI", 0, 2, 20, 0xF003F, 1, 1, b"\0\0\0\0\0\5", 18) +
+    pack("<BBHIBB6sII", 0, 2, 24, 0xF003F, 1, 2, b"\0\0\0\0\0\5",
+         32, 544) +
+    pack("<BBHIBB6sII", 0, 2, 24, 0x20019, 1, 2, b"\0\0\0\0\0\5",
+         32, 545))
+
+## Header line of a .reg file written by regedit 5 and later
+_REG_HEADER_5 = u"Windows Registry Editor Version 5.00"
+
+## Header line of a .reg file written by regedit 4
+_REG_HEADER_4 = u"REGEDIT4"
+
+## Matches a quoted name or string in a .reg file
+_REG_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+########################################
+
+
+def _upcase(name):
+    """
+    Upper case a name one character at a time, as Windows compares names.
+
+    Args:
+        name: Name of a key.
+    Returns:
+        Upper case name, with the same length.
+    """
+
+    result = []
+    for char in name:
+        upper = char.upper()
+        result.append(upper if len(upper) == 1 else char)
+    return u"".join(result)
+
+########################################
+
+
+def _lh_hash(name):
+    """
+    Compute the hash of a key name stored in an lh list.
+
+    Args:
+        name: Name of a key.
+    Returns:
+        32 bit hash.
+    """
+
+    result = 0
+    for char in _upcase(name):
+        result = (result * 37 + ord(char)) & 0xFFFFFFFF
+    return result
+
+########################################
+
+
+def _encode_name(name):
+    """
+    Encode a key or value name as Windows stores it.
+
+    Args:
+        name: Name to encode.
+    Returns:
+        tuple of the encoded name and True if it is stored one byte per
+        character.
+    """
+
+    try:
+        return name.encode("latin-1"), True
+    except UnicodeEncodeError:
+        return name.encode("utf-16-le"), False
+
+########################################
+
+
+def _value_bytes(data, typ):
+    """
+    Convert value data to the bytes stored in the hive.
+
+    The data is converted by to_registry_bytes(), as SetValueEx() does, so
+    a value reads back the same from a written hive as from the registry.
+
+    Args:
+        data: Python value, as returned by EnumValue().
+        typ: Registry type of the value.
+    Returns:
+        bytes of the value.
+    """
+
+    raw = to_registry_bytes(data, typ).raw
+    # Strings are terminated by a 16 bit zero
+    if typ in (REG_SZ, REG_EXPAND_SZ) and len(raw) & 1:
+        raw += b"\0"
+    return raw
+
+########################################
+
+
+def _filetime(last_write_time):
+    """
+    Return a last write time, or the current time if None.
+
+    Args:
+        last_write_time: 100's of nanoseconds since Jan 1, 1601, or None.
+    Returns:
+        100's of nanoseconds since Jan 1, 1601.
+    """
+
+    if last_write_time is None:
+        return int((time.time() + _EPOCH_DELTA) * 10000000)
+    return last_write_time
+
+########################################
+
+
+class _TreeKey(object):
+    """
+    A key of the tree being written.
+    """
+
+    def __init__(self, name):
+        """
+        Create an empty key.
+
+        Args:
+            name: Name of the key.
+        """
+
+        ## Name of the key
+        self.name = name
+
+        ## 100's of nanoseconds since Jan 1, 1601, or None for now
+        self.last_write_time = None
+
+        ## list of (name, data, type) tuples
+        self.values = []
+
+        ## dict of upper case names to sub keys
+        self.subkeys = {}
+
+        ## dict of upper case value names to indexes in values
+        self._value_index = {}
+
+    def child(self, name):
+        """
+        Return a sub key, creating it if needed.
+
+        Args:
+            name: Name of the sub key.
+        Returns:
+            _TreeKey of the sub key.
+        """
+
+        key = _upcase(name)
+        subkey = self.subkeys.get(key)
+        if subkey is None:
+            subkey = _TreeKey(name)
+            self.subkeys[key] = subkey
+        return subkey
+
+    def set_value(self, name, data, typ):
+        """
+        Add a value, replacing an earlier one with the same name.
+
+        Args:
+            name: Name of the value, None or empty for the default value.
+            data: Python value, as returned by EnumValue().
+            typ: Registry type of the value.
+        """
+
+        name = name or u""
+        key = _upcase(name)
+        index = self._value_index.get(key)
+        if index is None:
+            self._value_index[key] = len(self.values)
+            self.values.append((name, data, typ))
+        else:
+            self.values[index] = (name, data, typ)
+
+########################################
+
+
+def _build_tree(tree, root, root_name):
+    """
+    Convert DumpTree() entries into a tree of _TreeKey objects.
+
+    Args:
+        tree: Iterable of (path, last_write_time, values) tuples.
+        root: Path prefix to remove, entries outside of it are skipped.
+        root_name: Name of the root key.
+    Returns:
+        _TreeKey of the root key.
+    """
+
+    result = _TreeKey(root_name)
+    prefix = None
+    if root:
+        prefix = _upcase(root.strip(u"\\")) + u"\\"
+
+    for path, last_write_time, values in tree:
+        if prefix is not None:
+            upper = _upcase(path.strip(u"\\")) + u"\\"
+            if not upper.startswith(prefix):
+                continue
+            path = path.strip(u"\\")[len(prefix) - 1:]
+
+        key = result
+        for name in path.split(u"\\"):
+            if name:
+                key = key.child(name)
+        if last_write_time is not None:
+            key.last_write_time = last_write_time
+
+        for name, data, typ in values:
+            key.set_value(name, data, typ)
+    return result
+
+########################################
+
+
+class _HiveImage(object):
+    """
+    Cells of a hive being written, packed into hive bins.
+    """
+
+    def __init__(self):
+        """
+        Start with an empty first bin.
+        """
+
+        ## Contents of all the bins
+        self.data = bytearray()
+
+        ## Offset of the bin being filled
+        self._bin = 0
+
+        ## Offset of the free space in the bin being filled
+        self._free = 0
+
+        self._new_bin(_BIN_SIZE)
+
+    def _new_bin(self, size):
+        """
+        Close the current bin and start a new one.
+
+        Args:
+            size: Size of the new bin, a multiple of _BIN_SIZE.
+        """
+
+        self._close_bin()
+        self._bin = len(self.data)
+        self.data += b"hbin" + pack("<II", self._bin, size) + \
+            b"\0" * (_BIN_HEADER_SIZE - 12) + b"\0" * (size - _BIN_HEADER_SIZE)
+        self._free = self._bin + _BIN_HEADER_SIZE
+
+    def _close_bin(self):
+        """
+        Mark the rest of the current bin as a free cell.
+        """
+
+        end = len(self.data)
+        if self._free < end:
+            pack_into("<i", self.data, self._free, end - self._free)
+            self._free = end
+
+    def alloc(self, size):
+        """
+        Allocate a cell.
+
+        Cells never cross bins, so a new bin is started when the current
+        one is full. Cells larger than a bin get a bin of their own.
+
+        Args:
+            size: Size of the cell data in bytes.
+        Returns:
+            Cell offset.
+        """
+
+        size = (size + 4 + 7) & ~7
+        if self._free + size > len(self.data):
+            self._new_bin(max(_BIN_SIZE, (size + _BIN_HEADER_SIZE +
+                                          _BIN_SIZE - 1) & ~(_BIN_SIZE - 1)))
+        offset = self._free
+        pack_into("<i", self.data, offset, -size)
+        self._free += size
+        return offset
+
+    def add(self, payload):
+        """
+        Allocate a cell and fill it.
+
+        Args:
+            payload: Contents of the cell.
+        Returns:
+            Cell offset.
+        """
+
+        offset = self.alloc(len(payload))
+        self.data[offset + 4:offset + 4 + len(payload)] = payload
+        return offset
+
+    def finish(self):
+        """
+        Close the last bin.
+
+        Returns:
+            bytearray of all the bins.
+        """
+
+        self._close_bin()
+        return self.data
+
+########################################
+
+
+class _HiveWriter(object):
+    """
+    Lay out the cells of a tree of keys.
+    """
+
+    def __init__(self):
+        """
+        Start an empty hive with its shared security descriptor.
+        """
+
+        ## Cells being written
+        self.image = _HiveImage()
+
+        ## Number of keys written
+        self.key_count = 0
+
+        # The sk cell lists itself as the next and previous descriptor
+        self.security = self.image.alloc(20 + len(_SECURITY))
+        self.image.data[self.security + 4:self.security + 24 +
+                        len(_SECURITY)] = \
+            b"sk\0\0" + pack("<IIII", self.security, self.security, 0,
+                             len(_SECURITY)) + _SECURITY
+
+    def write_key(self, key, parent, flags=0):
+        """
+        Write a key, its values and its sub keys.
+
+        Args:
+            key: _TreeKey to write.
+            parent: Cell offset of the parent key.
+            flags: Extra flags for the key.
+        Returns:
+            Cell offset of the nk record.
+        """
+
+        image = self.image
+        name, compressed = _encode_name(key.name)
+        if compressed:
+            flags |= _KEY_COMP_NAME
+        offset = image.add(
+            b"nk" + pack("<HQII", flags, _filetime(key.last_write_time), 0,
+                         parent) + b"\0" * 0x34 + pack("<HH", len(name), 0) +
+            name)
+        self.key_count += 1
+
+        # Windows keeps sub keys sorted for binary searches
+        subkeys = sorted(key.subkeys.values(),
+                         key=lambda item: _upcase(item.name))
+        children = [(self.write_key(subkey, offset), _lh_hash(subkey.name))
+                    for subkey in subkeys]
+        values = [self.write_value(*item) for item in key.values]
+        max_data = max([item[1] for item in values] or [0])
+        values = [item[0] for item in values]
+
+        subkey_list = _NO_CELL
+        if children:
+            subkey_list = self.write_subkey_list(children)
+        value_list = _NO_CELL
+        if values:
+            value_list = image.add(pack("<%dI" % len(values), *values))
+
+        max_name = max([len(subkey.name) * 2 for subkey in subkeys] or [0])
+        max_value_name = max(
+            [len(item[0]) * 2 for item in key.values] or [0])
+        pack_into("<IIIIIIIIIIII", image.data, offset + 0x18,
+                  len(children), 0, subkey_list, _NO_CELL, len(values),
+                  value_list, self.security, _NO_CELL, max_name, 0,
+                  max_value_name, max_data)
+        return offset
+
+    def write_subkey_list(self, children):
+        """
+        Write the lh lists of a key, under an ri list if more than one.
+
+        Args:
+            children: list of (cell offset, hash) tuples, sorted by name.
+        Returns:
+            Cell offset of the list.
+        """
+
+        lists = []
+        for start in range(0, len(children), _MAX_LIST_ENTRIES):
+            chunk = children[start:start + _MAX_LIST_ENTRIES]
+            items = []
+            for item in chunk:
+                items.extend(item)
+            lists.append(self.image.add(
+                b"lh" + pack("<H%dI" % len(items), len(chunk), *items)))
+        if len(lists) == 1:
+            return lists[0]
+        return self.image.add(
+            b"ri" + pack("<H%dI" % len(lists), len(lists), *lists))
+
+    def write_value(self, name, data, typ):
+        """
+        Write a vk record and its data.
+
+        Args:
+            name: Name of the value, empty for the default value.
+            data: Python value, as returned by EnumValue().
+            typ: Registry type of the value.
+        Returns:
+            tuple of the cell offset of the vk record and the data size.
+        """
+
+        image = self.image
+        raw = _value_bytes(data, typ)
+        size = len(raw)
+        if size <= 4:
+            # Small values are stored in place of the offset
+            field = raw + b"\0" * (4 - size)
+            size |= _DATA_IN_OFFSET
+        elif size <= _MAX_CELL_DATA:
+            field = pack("<I", image.add(raw))
+        else:
+            segments = [image.add(raw[index:index + _MAX_CELL_DATA])
+                        for index in range(0, size, _MAX_CELL_DATA)]
+            segment_list = image.add(
+                pack("<%dI" % len(segments), *segments))
+            field = pack("<I", image.add(
+                b"db" + pack("<HII", len(segments), segment_list, 0)))
+
+        encoded, compressed = _encode_name(name)
+        return image.add(
+            b"vk" + pack("<HI", len(encoded), size) + field +
+            pack("<IHH", typ, _VALUE_COMP_NAME if compressed else 0, 0) +
+            encoded), len(raw)
+
+########################################
+
+
+def write_hive(file_name, tree, root=None, root_name=u"ROOT"):
+    """
+    Write a registry hive file from a tree of keys.
+
+    The tree uses the format returned by DumpTree(), so a tree read from
+    the registry or from another hive can be written back as is. Parent
+    keys that aren't listed are created. Sub keys are sorted, values keep
+    their order.
+
+    The hive uses format version 1.5 and every key gets a security
+    descriptor giving full control to SYSTEM and Administrators, and read
+    access to Users.
+
+    Args:
+        file_name: Host pathname of the hive file to create.
+        tree: Iterable of (path, last_write_time, values) tuples. The path
+            is relative to the root of the hive, the time is 100's of
+            nanoseconds since Jan 1, 1601 or None for now, and values is a
+            list of (name, data, type) tuples.
+        root: Path prefix removed from every path. Entries outside of it
+            are skipped. None to use the paths as is.
+        root_name: Name of the root key of the hive.
+    Exception:
+        ``ValueError`` or ``TypeError`` for values that can't be converted,
+        ``OSError`` if the file can't be written.
+    """
+
+    writer = _HiveWriter()
+    root_key = _build_tree(tree, root, root_name)
+    root_offset = writer.write_key(root_key, _NO_CELL, _KEY_HIVE_ENTRY)
+
+    # Every key shares the one security descriptor
+    pack_into("<I", writer.image.data, writer.security + 16,
+              writer.key_count)
+    bins = writer.image.finish()
+
+    # Base block, the checksum covers the first 508 bytes
+    base = bytearray(_BASE_BLOCK_SIZE)
+    pack_into("<4sIIQIIIIIII", base, 0, b"regf", 1, 1,
+              _filetime(root_key.last_write_time), 1, 5, 0, 1, root_offset,
+              len(bins), 1)
+    label = os.path.basename(file_name)[-31:]
+    if not isinstance(label, type(u"")):
+        label = label.decode("utf-8", "replace")
+    base[0x30:0x30 + len(label) * 2] = label.encode("utf-16-le")
+    checksum = 0
+    for index in range(0, 0x1FC, 4):
+        checksum ^= unpack_from("<I", base, index)[0]
+    if checksum == 0:
+        checksum = 1
+    elif checksum == 0xFFFFFFFF:
+        checksum = 0xFFFFFFFE
+    pack_into("<I", base, 0x1FC, checksum)
+
+    with open(file_name, "wb") as fileref:
+        fileref.write(bytes(base))
+        fileref.write(bytes(bins))
+
+########################################
+
+
+def _unescape(text):
+    """
+    Remove the backslash escapes of a quoted .reg file string.
+
+    Args:
+        text: String between the quotes.
+    Returns:
+        Unescaped string.
+    """
+
+    return re.sub(r"\\(.)", r"\1", text)
+
+########################################
+
+
+def _parse_reg_data(data, unicode_strings):
+    """
+    Convert the data of a .reg file value.
+
+    Args:
+        data: Text after the equal sign.
+        unicode_strings: True if hex(2) and hex(7) data is UTF-16, as
+            written by regedit 5, False if it's ANSI, as by regedit 4.
+    Returns:
+        tuple of the Python value and the registry type.
+    Exception:
+        ``ValueError`` if the data can't be parsed.
+    """
+
+    if data.startswith(u"\""):
+        match = _REG_STRING.match(data)
+        if match is None:
+            raise ValueError("Unterminated string %r" % data)
+        return _unescape(match.group(1)), REG_SZ
+
+    if data.lower().startswith(u"dword:"):
+        return int(data[6:], 16), REG_DWORD
+
+    prefix, _, text = data.partition(u":")
+    prefix = prefix.lower()
+    if prefix == u"hex":
+        typ = REG_BINARY
+    elif prefix.startswith(u"hex(") and prefix.endswith(u")"):
+        typ = int(prefix[4:-1], 16)
+    else:
+        raise ValueError("Unknown value data %r" % data)
+
+    raw = unhexlify(re.sub(r"[\s,]", u"", text).encode("ascii"))
+    if not unicode_strings and typ in (REG_EXPAND_SZ, REG_MULTI_SZ):
+        raw = raw.decode("latin-1").encode("utf-16-le")
+    return from_registry_bytes(raw, len(raw), typ), typ
+
+########################################
+
+
+def parse_reg_file(text):
+    """
+    Parse the contents of a .reg file.
+
+    Files from regedit 4 and 5 are accepted. Deleted keys and values, the
+    lines starting with a minus sign, are skipped since a new hive has
+    nothing to delete.
+
+    Args:
+        text: Contents of the file as a string.
+    Returns:
+        list of (path, None, values) tuples in the format of DumpTree(),
+        with the full paths found in the file, such as
+        "HKEY_LOCAL_MACHINE\\SOFTWARE\\Example".
+    Exception:
+        ``ValueError`` if the text isn't a .reg file.
+    """
+
+    lines = text.lstrip(u"\ufeff").splitlines()
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    if not lines or lines[0].strip() not in (_REG_HEADER_5, _REG_HEADER_4):
+        raise ValueError("Not a .reg file")
+    unicode_strings = lines[0].strip() == _REG_HEADER_5
+
+    result = []
+    values = None
+    pending = u""
+    for line in lines[1:]:
+        line = pending + line.strip()
+        # Hex data continues on the next line after a backslash
+        if line.endswith(u"\\") and not line.startswith(u"["):
+            pending = line[:-1]
+            continue
+        pending = u""
+
+        if not line or line.startswith(u";"):
+            continue
+
+        if line.startswith(u"["):
+            path = line[1:line.rfind(u"]")]
+            if path.startswith(u"-"):
+                values = None
+            else:
+                values = []
+                result.append((path, None, values))
+            continue
+
+        if values is None:
+            continue
+
+        if line.startswith(u"@"):
+            name = u""
+            rest = line[1:]
+        else:
+            match = _REG_STRING.match(line)
+            if match is None:
+                raise ValueError("Invalid line %r" % line)
+            name = _unescape(match.group(1))
+            rest = line[match.end():]
+
+        rest = rest.strip()
+        if not rest.startswith(u"="):
+            raise ValueError("Invalid line %r" % line)
+        rest = rest[1:].strip()
+        if rest == u"-":
+            continue
+        values.append((name,) + _parse_reg_data(rest, unicode_strings))
+    return result
+
+########################################
+
+
+def read_reg_file(file_name):
+    """
+    Read and parse a .reg file.
+
+    Files from regedit 5 are UTF-16 with a byte order mark, files from
+    regedit 4 are ANSI. UTF-8 files are also accepted.
+
+    Args:
+        file_name: Host pathname of the .reg file.
+    Returns:
+        list of tuples as returned by parse_reg_file().
+    Exception:
+        ``ValueError`` if the file isn't a .reg file.
+    """
+
+    with open(file_name, "rb") as fileref:
+        data = fileref.read()
+
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        text = data.decode("utf-16")
+    else:
+        try:
+            text = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            text = data.decode("latin-1")
+    return parse_reg_file(text)
+
+########################################
+
+
+def write_hive_from_reg(file_name, reg_file_name, root, root_name=u"ROOT"):
+    """
+    Write a registry hive file from a .reg file.
+
+    @code
+        write_hive_from_reg("/tmp/provision.hiv", "provision.reg",
+            "HKEY_LOCAL_MACHINE\\SOFTWARE\\Example")
+    @endcode
+
+    Args:
+        file_name: Host pathname of the hive file to create.
+        reg_file_name: Host pathname of the .reg file.
+        root: Path of the key in the .reg file that becomes the root of
+            the hive. Keys outside of it are skipped.
+        root_name: Name of the root key of the hive.
+    Exception:
+        ``ValueError`` if the .reg file can't be parsed.
+    """
+
+    write_hive(file_name, read_reg_file(reg_file_name), root, root_name)
@@ -0,0 +1,1311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A registry kept in memory, for tests and benchmarks.
+
+Every function of winreg is implemented on a tree of keys in this process,
+so code using wslwinreg can run on any platform without Windows or the
+bridge. The registry starts empty except for the predefined keys and a few
+common sub keys, and is lost when the process exits.
+
+Set the environment variable WSLWINREG_BACKEND to "memory" before wslwinreg
+is imported to use it instead of the platform registry.
+
+@code
+    WSLWINREG_BACKEND=memory python -m pytest unittests
+@endcode
+"""
+
+## \package wslwinreg.memapi
+
+# Disable camel case requirement for function names
+# pylint: disable=invalid-name
+
+# Disable reusing reserved words.
+# pylint: disable=redefined-builtin
+# pylint: disable=unused-argument
+# pylint: disable=useless-object-inheritance
+# pylint: disable=global-statement
+
+import os
+import re
+import time
+import threading
+import itertools
+from collections import OrderedDict
+
+from .common import KEY_WRITE, KEY_WOW64_64KEY, KEY_READ, PY2, \
+    ERROR_FILE_NOT_FOUND, ERROR_ACCESS_DENIED, ERROR_NO_MORE_ITEMS, \
+    HKEY_CLASSES_ROOT, HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, HKEY_USERS, \
+    HKEY_PERFORMANCE_DATA, HKEY_CURRENT_CONFIG, HKEY_DYN_DATA, REG_SZ, \
+    registry_error, to_registry_bytes, from_registry_bytes
+from .nullapi import get_file_info, get_file_info_all, \
+    convert_to_windows_path, convert_from_windows_path, \
+    convert_to_windows_paths, convert_from_windows_paths
+
+## Type long for Python 2 compatibility
+try:
+    long        # type: ignore
+except NameError:
+    # Fake it for Python 3
+    long = int
+
+## The handle is invalid.
+ERROR_INVALID_HANDLE = 0x00000006
+
+## The network path was not found.
+ERROR_BAD_NETPATH = 0x00000035
+
+## The parameter is incorrect.
+ERROR_INVALID_PARAMETER = 0x00000057
+
+## Cannot create a file when that file already exists.
+ERROR_ALREADY_EXISTS = 0x000000b7
+
+## Illegal operation attempted on a registry key that has been marked for
+# deletion.
+ERROR_KEY_DELETED = 0x000003fa
+
+## Messages for the errors raised by this module
+_MESSAGES = {
+    ERROR_FILE_NOT_FOUND: "The system cannot find the file specified.",
+    ERROR_ACCESS_DENIED: "Access is denied.",
+    ERROR_INVALID_HANDLE: "The handle is invalid.",
+    ERROR_BAD_NETPATH: "The network path was not found.",
+    ERROR_INVALID_PARAMETER: "The parameter is incorrect.",
+    ERROR_ALREADY_EXISTS:
+        "Cannot create a file when that file already exists.",
+    ERROR_NO_MORE_ITEMS: "No more data is available.",
+    ERROR_KEY_DELETED: "Illegal operation attempted on a registry key that "
+                       "has been marked for deletion."
+}
+
+## Sub keys created when the registry is reset
+_DEFAULT_KEYS = (
+    (HKEY_LOCAL_MACHINE, u"SOFTWARE\\Classes"),
+    (HKEY_LOCAL_MACHINE, u"SYSTEM"),
+    (HKEY_CURRENT_USER, u"SOFTWARE"),
+    (HKEY_CURRENT_USER, u"Environment"),
+    (HKEY_USERS, u".DEFAULT"))
+
+## Difference between the Unix and FILETIME epochs in seconds
+_EPOCH_DELTA = 11644473600
+
+## Matches an environment variable reference in ExpandEnvironmentStrings()
+_ENVIRONMENT_VARIABLE = re.compile(u"%([^%]+)%")
+
+## Lock held while the tree or the handle table is accessed
+_LOCK = threading.RLock()
+
+## Open handles, keyed by handle value
+_HANDLES = {}
+
+## Source of new handle values, like Windows they are multiples of 4
+_NEXT_HANDLE = itertools.count(0x100, 4)
+
+## Root keys of the predefined handles
+_ROOTS = {}
+
+########################################
+
+
+def _error(winerror, filename=None):
+    """
+    Create the exception a Windows registry call would raise.
+
+    Args:
+        winerror: Windows error code.
+        filename: Name of the key or value responsible, if applicable.
+    Returns:
+        ``FileNotFoundError`` or ``OSError`` from registry_error().
+    """
+
+    return registry_error(winerror, _MESSAGES[winerror], filename)
+
+########################################
+
+
+def _now():
+    """
+    Return the current time as a FILETIME.
+
+    Returns:
+        100's of nanoseconds since Jan 1, 1601.
+    """
+
+    return int((time.time() + _EPOCH_DELTA) * 10000000)
+
+########################################
+
+
+def _text(name):
+    """
+    Return a key or value name as a unicode string.
+
+    Args:
+        name: Name of the key or value, None or empty for the default.
+    Returns:
+        Name as unicode, Python 2 byte strings are decoded as UTF-8.
+    """
+
+    if not name:
+        return u""
+    if PY2 and isinstance(name, str):
+        return name.decode("utf-8")
+    return name
+
+########################################
+
+
+class _MemoryKey(object):
+    """
+    A key of the in-memory registry.
+
+    Names are matched without regard to case and stored as given. Sub keys
+    are enumerated in sorted order and values in the order they were
+    created, as Windows does.
+    """
+
+    def __init__(self, name, parent=None):
+        """
+        Create an empty key.
+
+        Args:
+            name: Name of the key.
+            parent: _MemoryKey of the parent, None for a root key.
+        """
+
+        ## Name of the key
+        self.name = name
+
+        ## _MemoryKey of the parent, None for a root key
+        self.parent = parent
+
+        ## 100's of nanoseconds since Jan 1, 1601
+        self.last_write_time = _now()
+
+        ## True once the key is deleted
+        self.deleted = False
+
+        ## dict of upper case names to sub keys
+        self.subkeys = {}
+
+        ## OrderedDict of upper case names to (name, type, bytes) tuples
+        self.values = OrderedDict()
+
+        ## Sorted list of sub keys, None when out of date
+        self._subkey_list = None
+
+        ## list of values in order, None when out of date
+        self._value_list = None
+
+    def touch(self):
+        """
+        Update the last write time after a change.
+        """
+
+        self.last_write_time = _now()
+
+    def subkey_list(self):
+        """
+        Return the sub keys in enumeration order.
+
+        Returns:
+            list of _MemoryKey.
+        """
+
+        if self._subkey_list is None:
+            self._subkey_list = sorted(
+                self.subkeys.values(), key=lambda item: item.name.upper())
+        return self._subkey_list
+
+    def value_list(self):
+        """
+        Return the values in enumeration order.
+
+        Returns:
+            list of (name, type, bytes) tuples.
+        """
+
+        if self._value_list is None:
+            self._value_list = list(self.values.values())
+        return self._value_list
+
+    def find(self, sub_key):
+        """
+        Follow a path of sub keys.
+
+        Args:
+            sub_key: Path of the sub key, with backslashes, None or empty.
+        Returns:
+            _MemoryKey or None if not found.
+        """
+
+        key = self
+        for name in _text(sub_key).split(u"\\"):
+            if name:
+                key = key.subkeys.get(name.upper())
+                if key is None:
+                    return None
+        return key
+
+    def create(self, sub_key):
+        """
+        Follow a path of sub keys, creating the missing ones.
+
+        Args:
+            sub_key: Path of the sub key, with backslashes, None or empty.
+        Returns:
+            _MemoryKey of the sub key.
+        """
+
+        key = self
+        for name in _text(sub_key).split(u"\\"):
+            if name:
+                child = key.subkeys.get(name.upper())
+                if child is None:
+                    child = _MemoryKey(name, key)
+                    key.subkeys[name.upper()] = child
+                    key._subkey_list = None
+                    key.touch()
+                key = child
+        return key
+
+    def remove(self, child):
+        """
+        Delete a sub key that has no sub keys of its own.
+
+        Args:
+            child: _MemoryKey to delete.
+        """
+
+        del self.subkeys[child.name.upper()]
+        self._subkey_list = None
+        child.deleted = True
+        self.touch()
+
+    def set_value(self, name, typ, data):
+        """
+        Create or replace a value.
+
+        Args:
+            name: Name of the value, None or empty for the default value.
+            typ: Registry type of the value.
+            data: bytes of the value.
+        """
+
+        name = _text(name)
+        self.values[name.upper()] = (name, typ, data)
+        self._value_list = None
+        self.touch()
+
+    def delete_value(self, name):
+        """
+        Delete a value.
+
+        Args:
+            name: Name of the value, None or empty for the default value.
+        Returns:
+            True if the value was found.
+        """
+
+        try:
+            del self.values[_text(name).upper()]
+        except KeyError:
+            return False
+        self._value_list = None
+        self.touch()
+        return True
+
+########################################
+
+
+def _convert(value):
+    """
+    Convert a stored value to the tuple returned by EnumValue().
+
+    Args:
+        value: (name, type, bytes) tuple.
+    Returns:
+        tuple of name, data and type.
+    """
+
+    name, typ, data = value
+    return (name, from_registry_bytes(data, len(data), typ), typ)
+
+########################################
+
+
+def reset_registry():
+    """
+    Empty the in-memory registry.
+
+    Every key and value is deleted, every handle is closed and the
+    predefined keys and the sub keys every Windows system has, such as
+    HKEY_LOCAL_MACHINE\\SOFTWARE, are created again. HKEY_CLASSES_ROOT is
+    HKEY_LOCAL_MACHINE\\SOFTWARE\\Classes.
+    """
+
+    with _LOCK:
+        _HANDLES.clear()
+        _ROOTS.clear()
+        for hkey in (HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, HKEY_USERS,
+                     HKEY_CURRENT_CONFIG, HKEY_DYN_DATA):
+            _ROOTS[hkey] = _MemoryKey(u"")
+        for hkey, sub_key in _DEFAULT_KEYS:
+            _ROOTS[hkey].create(sub_key)
+        _ROOTS[HKEY_CLASSES_ROOT] = _ROOTS[HKEY_LOCAL_MACHINE].find(
+            u"SOFTWARE\\Classes")
+
+
+reset_registry()
+
+########################################
+
+
+def _key(key):
+    """
+    Return the key of a handle.
+
+    Must be called with _LOCK held.
+
+    Args:
+        key: PyHKEY, handle value or one of the HKEY_* constants.
+    Returns:
+        _MemoryKey of the handle.
+    Exception:
+        ``OSError`` if the handle is closed or the key deleted.
+    """
+
+    if isinstance(key, PyHKEY):
+        hkey = key.hkey
+    elif isinstance(key, (int, long)):
+        hkey = key
+    else:
+        raise TypeError("A handle must be a HKEY object or an integer")
+
+    # Performance counters aren't emulated
+    if hkey == HKEY_PERFORMANCE_DATA:
+        raise _error(ERROR_ACCESS_DENIED)
+
+    node = _ROOTS.get(hkey)
+    if node is None:
+        node = _HANDLES.get(hkey)
+        if node is None:
+            raise _error(ERROR_INVALID_HANDLE)
+    if node.deleted:
+        raise _error(ERROR_KEY_DELETED)
+    return node
+
+########################################
+
+
+def _open(node):
+    """
+    Create a handle to a key.
+
+    Must be called with _LOCK held.
+
+    Args:
+        node: _MemoryKey to open.
+    Returns:
+        A new PyHKEY.
+    """
+
+    hkey = next(_NEXT_HANDLE)
+    _HANDLES[hkey] = node
+    return PyHKEY(hkey)
+
+########################################
+
+
+def query_raw_value(key, value_name):
+    """
+    Retrieve a value as it's stored, without converting the data.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        value_name: Is a string indicating the value to query.
+    Returns:
+        tuple of name, type and bytes of the data.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    with _LOCK:
+        value = _key(key).values.get(_text(value_name).upper())
+    if value is None:
+        raise _error(ERROR_FILE_NOT_FOUND, value_name)
+    return value
+
+########################################
+
+
+def enum_raw_value(key, index):
+    """
+    Retrieve a value by index as it's stored.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        index: Is an integer that identifies the index of the value.
+    Returns:
+        tuple of name, type and bytes of the data.
+    Exception:
+        ``OSError`` with ERROR_NO_MORE_ITEMS after the last value.
+    """
+
+    with _LOCK:
+        values = _key(key).value_list()
+        if index < 0 or index >= len(values):
+            raise _error(ERROR_NO_MORE_ITEMS)
+        return values[index]
+
+########################################
+
+
+def enum_raw_values(key):
+    """
+    Retrieve every value of a key as it's stored.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Returns:
+        list of (name, type, bytes) tuples in the order EnumValue() uses.
+    Exception:
+        ``OSError``
+    """
+
+    with _LOCK:
+        return _key(key).value_list()
+
+########################################
+
+
+def set_raw_value(key, value_name, type, data):
+    """
+    Store a value whose data was already converted by to_registry_bytes().
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        value_name: Is a string that names the value.
+        type: Is an integer that specifies the type of the data.
+        data: bytes of the data.
+    Exception:
+        ``OSError``
+    """
+
+    with _LOCK:
+        _key(key).set_value(value_name, type, data)
+
+########################################
+
+
+def dump_raw_tree(key, sub_key=None, max_depth=None):
+    """
+    Read an entire registry tree without converting the value data.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that identifies the sub_key to dump, or None.
+        max_depth: Number of levels of sub keys to descend, None for all.
+    Returns:
+        list of (path, last_write_time, values) tuples as described in
+        DumpTree(), with the values as (name, type, bytes) tuples.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    result = []
+    with _LOCK:
+        node = _key(key).find(sub_key)
+        if node is None:
+            raise _error(ERROR_FILE_NOT_FOUND, sub_key)
+        pending = [(node, u"", 0)]
+        while pending:
+            node, path, depth = pending.pop()
+            result.append((path, node.last_write_time, node.value_list()))
+            if max_depth is not None and depth >= max_depth:
+                continue
+            # Reversed, so the sub keys are popped in order
+            for child in reversed(node.subkey_list()):
+                pending.append((child, path + u"\\" + child.name
+                                if path else child.name, depth + 1))
+    return result
+
+########################################
+
+
+class PyHKEY(object):
+    """
+    A Python object representing a key of the in-memory registry.
+
+    This object wraps a handle value, automatically closing it when the
+    object is destroyed. To guarantee cleanup, you can call either the Close()
+    method on the object, or the CloseKey() function.
+
+    Like the winreg handle object, it is true while the handle is open, can
+    be converted to an integer and used in a ``with`` statement. Functions
+    of this module also accept the integer handle values.
+    """
+
+    def __init__(self, hkey):
+        """
+        Initialize the PyHKEY class.
+
+        Args:
+            hkey: Integer handle value.
+        """
+
+        ## Integer handle value
+        self.hkey = hkey
+
+    def __del__(self):
+        """
+        Called when this object is garbage collected.
+        """
+        self.Close()
+
+    def Close(self):
+        """
+        Closes the handle.
+
+        Note:
+            If the handle is already closed, no error is raised.
+        """
+        if self.hkey:
+            with _LOCK:
+                _HANDLES.pop(self.hkey, None)
+        self.hkey = 0
+
+    def Detach(self):
+        """
+        Detaches the handle from the handle object.
+
+        The handle stays open, so it can still be used as an integer.
+
+        Returns:
+            Previous handle value.
+        """
+        hkey = self.hkey
+        self.hkey = 0
+        return hkey
+
+    def _handle(self):
+        """
+        The integer handle value.
+        """
+        return self.hkey
+
+    ## The integer handle value.
+    handle = property(_handle)
+
+    def __enter__(self):
+        """
+        Called when object is entered.
+
+        Note:
+            Needed for the Python ``with`` statement.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        """
+        Release handle on class destruction.
+
+        Note:
+            Needed for the Python ``with`` statement.
+        """
+        self.Close()
+        return False
+
+    def __hash__(self):
+        """
+        Convert the object into a hash.
+        """
+        return id(self)
+
+    def __int__(self):
+        """
+        Converting a handle to an integer returns the handle value.
+        """
+        return self.hkey
+
+    if PY2:
+        def __nonzero__(self):
+            """
+            Handles with an open object return true, otherwise false.
+            """
+            return bool(self.hkey)
+    else:
+        def __bool__(self):
+            """
+            Handles with an open object return true, otherwise false.
+            """
+            return bool(self.hkey)
+
+    def __repr__(self):
+        """
+        Return descriptive string for the class object.
+        """
+        return "<PyHKEY at %08X (%08X)>" % (id(self), self.hkey)
+
+    def __str__(self):
+        """
+        Return short string for the handle object.
+        """
+        return "<PyHKEY:%08X>" % self.hkey
+
+########################################
+
+
+def CloseKey(hkey):
+    """
+    Closes a previously opened registry key.
+
+    Args:
+        hkey: A previously opened key.
+    """
+
+    if isinstance(hkey, PyHKEY):
+        hkey.Close()
+        return
+    with _LOCK:
+        _HANDLES.pop(hkey, None)
+
+########################################
+
+
+def ConnectRegistry(computer_name, key):
+    """
+    Establishes a connection to a predefined registry handle.
+
+    Only the local registry exists, so any computer name fails.
+
+    Args:
+        computer_name: None or an empty string for the local computer.
+        key: Is the predefined handle to connect to.
+    Returns:
+        A new PyHKEY.
+    Exception:
+        ``OSError`` for a remote computer or a key that isn't predefined.
+    """
+
+    if computer_name:
+        raise _error(ERROR_BAD_NETPATH, computer_name)
+    with _LOCK:
+        if key not in _ROOTS and key != HKEY_PERFORMANCE_DATA:
+            raise _error(ERROR_INVALID_HANDLE)
+        return _open(_key(key))
+
+########################################
+
+
+def CreateKey(key, sub_key):
+    """
+    Creates or opens the specified key, returning a handle object.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that names the key this method opens or creates.
+    Returns:
+        A new PyHKEY.
+    Exception:
+        ``OSError``
+    """
+
+    with _LOCK:
+        return _open(_key(key).create(sub_key))
+
+########################################
+
+
+def CreateKeyEx(key, sub_key, reserved=0, access=KEY_WRITE):
+    """
+    Creates or opens the specified key, returning a handle object.
+
+    Note:
+        Identical to CreateKey(), there is only one registry view.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that names the key this method opens or creates.
+        reserved: Is a reserved integer, and must be zero. The default is
+            zero.
+        access: Ignored, every handle has full access.
+    Returns:
+        A new PyHKEY.
+    Exception:
+        ``OSError``
+    """
+
+    return CreateKey(key, sub_key)
+
+########################################
+
+
+def DeleteKey(key, sub_key):
+    """
+    Deletes the specified key.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that must be a subkey of the key identified by
+            the key parameter.
+    Exception:
+        ``OSError`` if the key has sub keys, ``FileNotFoundError`` if it
+        doesn't exist.
+    """
+
+    with _LOCK:
+        node = _key(key).find(sub_key)
+        if node is None:
+            raise _error(ERROR_FILE_NOT_FOUND, sub_key)
+        if node.parent is None or node.subkeys:
+            raise _error(ERROR_ACCESS_DENIED, sub_key)
+        node.parent.remove(node)
+
+########################################
+
+
+def DeleteKeyEx(key, sub_key, access=KEY_WOW64_64KEY, reserved=0):
+    """
+    Deletes the specified key.
+
+    Note:
+        Identical to DeleteKey(), there is only one registry view.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that must be a subkey of the key identified by
+            the key parameter.
+        access: Ignored.
+        reserved: Is a reserved integer, and must be zero. The default is
+            zero.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    DeleteKey(key, sub_key)
+
+########################################
+
+
+def DeleteValue(key, value):
+    """
+    Removes a named value from a registry key.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        value: Is a string that identifies the value to remove.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    with _LOCK:
+        if not _key(key).delete_value(value):
+            raise _error(ERROR_FILE_NOT_FOUND, value)
+
+########################################
+
+
+def EnumKey(key, index):
+    """
+    Enumerates subkeys of an open registry key, returning a string.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        index: Is an integer that identifies the index of the key to retrieve.
+    Returns:
+        Name of the sub key.
+    Exception:
+        ``OSError`` with ERROR_NO_MORE_ITEMS after the last sub key.
+    """
+
+    with _LOCK:
+        subkeys = _key(key).subkey_list()
+        if index < 0 or index >= len(subkeys):
+            raise _error(ERROR_NO_MORE_ITEMS)
+        return subkeys[index].name
+
+########################################
+
+
+def EnumKeys(key, start=0, count=None, with_times=False):
+    """
+    Enumerates many subkeys of an open registry key in a single call.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        start: Index of the first subkey to retrieve.
+        count: Maximum number of subkeys to retrieve, None for all.
+        with_times: If True, return (name, last_write_time) tuples with
+            the time as 100’s of nanoseconds since Jan 1, 1601.
+    Returns:
+        list of subkey names, or list of tuples if with_times is True.
+    Exception:
+        ``OSError``
+    """
+
+    with _LOCK:
+        subkeys = _key(key).subkey_list()[start:]
+        if count is not None:
+            subkeys = subkeys[:count]
+        if with_times:
+            return [(item.name, item.last_write_time) for item in subkeys]
+        return [item.name for item in subkeys]
+
+########################################
+
+
+def EnumValue(key, index):
+    # pylint: disable=line-too-long
+    """
+    Enumerates values of an open registry key, returning a tuple.
+
+    <table>
+    <tr><th>Index<th>Meaning
+    <tr><td>0<td>A string that identifies the value.
+    <tr><td>1<td>An object that holds the value data,
+        and whose type depends on the underlying registry type
+    <tr><td>2<td>An integer that identifies the type of the value data
+    </table>
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        index: Is an integer that identifies the index of the value to retrieve.
+    Returns:
+       A tuple of 3 items.
+    Exception:
+        ``OSError`` with ERROR_NO_MORE_ITEMS after the last value.
+    """
+
+    return _convert(enum_raw_value(key, index))
+
+########################################
+
+
+def EnumValues(key):
+    """
+    Enumerates all of the values of an open registry key in a single call.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Returns:
+        list of (name, data, type) tuples as returned by EnumValue()
+    Exception:
+        ``OSError``
+    """
+
+    return [_convert(value) for value in enum_raw_values(key)]
+
+########################################
+
+
+def ExpandEnvironmentStrings(str):
+    """
+    Expands environment variable strings %NAME% to their values.
+
+    The variables of this process are used, names are matched without
+    regard to case and unknown variables are left as is, as Windows does.
+
+    Args:
+        str: String to expand.
+    Returns:
+        String with the environment variables replaced.
+    """
+
+    environment = dict((name.upper(), value)
+                       for name, value in os.environ.items())
+
+    def expand(match):
+        """
+        Return the value of a variable, or the reference if not found.
+        """
+        return environment.get(match.group(1).upper(), match.group(0))
+
+    return _ENVIRONMENT_VARIABLE.sub(expand, str)
+
+########################################
+
+
+def FlushKey(key):
+    """
+    Writes all the attributes of a key to the registry.
+
+    Nothing is written since the registry is only in memory.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Exception:
+        ``OSError`` if the handle isn't valid.
+    """
+
+    with _LOCK:
+        _key(key)
+
+########################################
+
+
+def LoadKey(key, sub_key, file_name):
+    """
+    Creates a subkey under the specified key and loads it from a file.
+
+    The hive file is read with the hiveapi module and copied into the
+    in-memory registry.
+
+    Args:
+        key: HKEY_LOCAL_MACHINE or HKEY_USERS.
+        sub_key: Is a string that identifies the subkey to load.
+        file_name: Host pathname of the hive file.
+    Exception:
+        ``OSError`` if the key already exists or the file isn't a hive.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from .hiveapi import OpenHive, DumpTree as DumpHive
+
+    if key not in (HKEY_LOCAL_MACHINE, HKEY_USERS):
+        raise _error(ERROR_INVALID_PARAMETER)
+    with OpenHive(file_name) as root:
+        tree = DumpHive(root)
+
+    with _LOCK:
+        parent = _key(key)
+        if parent.find(sub_key) is not None:
+            raise _error(ERROR_ALREADY_EXISTS, sub_key)
+        node = parent.create(sub_key)
+        nodes = []
+        for path, last_write_time, values in tree:
+            child = node.create(path)
+            for name, data, typ in values:
+                child.set_value(name, typ, to_registry_bytes(data, typ).raw)
+            nodes.append((child, last_write_time))
+
+        # Creating sub keys touches their parents, so set the times last
+        for child, last_write_time in nodes:
+            child.last_write_time = last_write_time
+
+########################################
+
+
+def OpenKey(key, sub_key, reserved=0, access=KEY_READ):
+    """
+    Opens the specified key, returning a handle object.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that identifies the sub_key to open.
+        reserved: Is a reserved integer, and must be zero. The default is
+            zero.
+        access: Ignored, every handle has full access.
+    Returns:
+        A new PyHKEY.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    with _LOCK:
+        node = _key(key).find(sub_key)
+        if node is None:
+            raise _error(ERROR_FILE_NOT_FOUND, sub_key)
+        return _open(node)
+
+########################################
+
+
+def OpenKeyEx(key, sub_key, reserved=0, access=KEY_READ):
+    """
+    Opens the specified key, returning a handle object.
+
+    Note:
+        Identical to OpenKey().
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that identifies the sub_key to open.
+        reserved: Is a reserved integer, and must be zero. The default is
+            zero.
+        access: Ignored, every handle has full access.
+    Returns:
+        A new PyHKEY.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    return OpenKey(key, sub_key, reserved, access)
+
+########################################
+
+
+def QueryInfoKey(key):
+    # pylint: disable=line-too-long
+    """
+    Returns information about a key, as a tuple.
+
+    <table>
+    <tr><th>Index<th>Meaning
+    <tr><td>0<td>An integer giving the number of sub keys this key has.
+    <tr><td>1<td>An integer giving the number of values this key has.
+    <tr><td>2<td>An integer giving when the key was last modified
+        as 100’s of nanoseconds since Jan 1, 1601.
+    </table>
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Returns:
+        A tuple of 3 items.
+    Exception:
+        ``OSError``
+    """
+
+    with _LOCK:
+        node = _key(key)
+        return (len(node.subkeys), len(node.values), node.last_write_time)
+
+########################################
+
+
+def QueryValue(key, sub_key):
+    """
+    Retrieves the unnamed value for a key, as a string.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that holds the name of the subkey with which the
+            value is associated. If this parameter is None or empty, the
+            default value of ``key`` is read.
+    Returns:
+        The string, or an empty string if the key has no default value.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    with _LOCK:
+        node = _key(key).find(sub_key)
+        if node is None:
+            raise _error(ERROR_FILE_NOT_FOUND, sub_key)
+        value = node.values.get(u"")
+    if value is None:
+        return u""
+    value = _convert(value)[1]
+
+    # Only strings are returned by RegQueryValueW()
+    if not isinstance(value, type(u"")):
+        return u""
+    return value
+
+########################################
+
+
+def QueryValueEx(key, value_name):
+    """
+    Retrieves the type and data for a specified value name.
+
+    | Index | Meaning |
+    | ----- | ------- |
+    | 0 | The value of the registry item. |
+    | 1 | An integer giving the registry type for this value. |
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        value_name: Is a string indicating the value to query.
+    Returns:
+        A tuple of 2 items.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    return _convert(query_raw_value(key, value_name))[1:]
+
+########################################
+
+
+def SaveKey(key, file_name):
+    """
+    Saves the specified key, and all its subkeys to the specified file.
+
+    The hive file is written with the hivewriter module.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        file_name: Host pathname of the hive file, which must not exist.
+    Exception:
+        ``OSError`` if the file already exists.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from .hivewriter import write_hive
+
+    if os.path.exists(file_name):
+        raise _error(ERROR_ALREADY_EXISTS, file_name)
+    with _LOCK:
+        name = _key(key).name or u"ROOT"
+        tree = DumpTree(key)
+    write_hive(file_name, tree, root_name=name)
+
+########################################
+
+
+def SetValue(key, sub_key, type, value):
+    """
+    Associates a value with a specified key.
+
+    The sub key is created if needed and its default value is set.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that names the subkey with which the value is
+            associated.
+        type: Is an integer that specifies the type of the data. Currently
+            this must be REG_SZ, meaning only strings are supported.
+        value: Is a string that specifies the new value.
+    Exception:
+        ``TypeError`` if type isn't REG_SZ, ``OSError``
+    """
+
+    if type != REG_SZ:
+        raise TypeError("type must be winreg.REG_SZ")
+    data = to_registry_bytes(value, REG_SZ).raw
+    with _LOCK:
+        _key(key).create(sub_key).set_value(u"", REG_SZ, data)
+
+########################################
+
+
+def SetValueEx(key, value_name, reserved, type, value):
+    """
+    Stores data in the value field of an open registry key.
+
+    The data is converted with to_registry_bytes() like the other backends
+    do, so it reads back the same way.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        value_name: Is a string that names the subkey with which
+            the value is associated.
+        reserved: can be anything – zero is always passed to the API.
+        type: Is an integer that specifies the type of the data.
+        value: Is a string that specifies the new value.
+    Exception:
+        ``ValueError``, ``TypeError`` or ``OSError``
+    """
+
+    set_raw_value(key, value_name, type, to_registry_bytes(value, type).raw)
+
+########################################
+
+
+def DisableReflectionKey(key):
+    """
+    Disables registry reflection for 32-bit processes running on a 64-bit.
+
+    Nothing is done since there is only one registry view.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Exception:
+        ``OSError`` if the handle isn't valid.
+    """
+
+    with _LOCK:
+        _key(key)
+
+########################################
+
+
+def EnableReflectionKey(key):
+    """
+    Restores registry reflection for the specified disabled key.
+
+    Nothing is done since there is only one registry view.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Exception:
+        ``OSError`` if the handle isn't valid.
+    """
+
+    with _LOCK:
+        _key(key)
+
+########################################
+
+
+def QueryReflectionKey(key):
+    """
+    Determines the reflection state for the specified key.
+
+    Like Windows 7 and later, keys are never reflected.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Returns:
+        True, reflection is always disabled.
+    Exception:
+        ``OSError`` if the handle isn't valid.
+    """
+
+    with _LOCK:
+        _key(key)
+    return True
+
+########################################
+
+
+def DumpTree(key, sub_key=None, max_depth=None, access=KEY_READ):
+    # pylint: disable=line-too-long
+    """
+    Read an entire registry tree in a single call.
+
+    Each entry in the returned list is a tuple of 3 items.
+
+    <table>
+    <tr><th>Index<th>Meaning
+    <tr><td>0<td>Path of the key relative to sub_key, "" for sub_key itself.
+    <tr><td>1<td>An integer giving when the key was last modified
+        as 100’s of nanoseconds since Jan 1, 1601.
+    <tr><td>2<td>list of (name, data, type) tuples as returned by EnumValue()
+    </table>
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that identifies the sub_key to dump, or None.
+        max_depth: Number of levels of sub keys to descend, None for all.
+        access: Ignored, every handle has full access.
+    Returns:
+        list of tuples, parents are listed before their sub keys.
+    Exception:
+        ``OSError`` or ``FileNotFoundError``
+    """
+
+    return [(path, last_write_time, [_convert(value) for value in values])
+            for path, last_write_time, values
+            in dump_raw_tree(key, sub_key, max_depth)]
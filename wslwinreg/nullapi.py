@@ -16,6 +16,10 @@ Package that contains stub functions for unsupported platforms.
 
 from .common import KEY_WRITE, KEY_WOW64_64KEY, KEY_READ
 
+# The version resource is parsed directly, since there is no Windows to ask
+# pylint: disable=unused-import
+from .peinfo import get_file_info, get_file_info_all
+
 ## Shared ``NotImplementedError`` for this module
 _NOT_IMPL = NotImplementedError(
     "Only supported under Cygwin, MSYS2, or Windows Subsystem for Linux")
@@ -125,6 +129,19 @@ def EnumKey(key, index):
 ########################################
 
 
+def EnumKeys(key, start=0, count=None, with_times=False):
+    """
+    Not implemented.
+
+    Exception:
+        ``NotImplementedError`` is always thrown.
+    """
+
+    raise _NOT_IMPL
+
+########################################
+
+
 def EnumValue(key, index):
     """
     Not implemented.
@@ -138,6 +155,19 @@ def EnumValue(key, index):
 ########################################
 
 
+def EnumValues(key):
+    """
+    Not implemented.
+
+    Exception:
+        ``NotImplementedError`` is always thrown.
+    """
+
+    raise _NOT_IMPL
+
+########################################
+
+
 def ExpandEnvironmentStrings(str):
     """
     Not implemented.
@@ -353,16 +383,44 @@ def convert_from_windows_path(path_name):
 ########################################
 
 
-def get_file_info(path_name, string_name):
+def convert_to_windows_paths(path_names):
     """
-    Not implemented.
+    Convert a list of pathnames to Windows.
+
+    This is the null function, it returns the pathnames unchanged.
 
     Args:
-        path_name: Name of the windows file.
-        string_name: Name of the data chunk to retrieve
+        path_names: iterable of Windows pathnames
+    Return:
+        list of the pathnames as is.
+    """
+    return list(path_names)
+
+########################################
+
+
+def convert_from_windows_paths(path_names):
+    """
+    Convert a list of pathnames from Windows.
+
+    This is the null function, it returns the pathnames unchanged.
 
+    Args:
+        path_names: iterable of Windows pathnames
     Return:
-        None
+        list of the pathnames as is.
     """
+    return list(path_names)
 
-    return None
+########################################
+
+
+def DumpTree(key, sub_key=None, max_depth=None, access=KEY_READ):
+    """
+    Not implemented.
+
+    Exception:
+        ``NotImplementedError`` is always thrown.
+    """
+
+    raise _NOT_IMPL
@@ -0,0 +1,768 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+In process translation of pathnames between Windows and the host.
+
+Launching ``wslpath`` or ``cygpath`` for every pathname is slow, so the
+mount table of the host is parsed once and pathnames are translated with
+string operations. Results are kept in a bounded cache.
+
+The translators don't access the file system themselves, so they can be
+tested on any platform by passing in the contents of the mount tables.
+"""
+
+## \package wslwinreg.pathconv
+
+# pylint: disable=useless-object-inheritance
+# pylint: disable=consider-using-f-string
+
+import os
+import re
+import subprocess
+import threading
+from collections import OrderedDict
+
+try:
+    from configparser import ConfigParser, Error as ConfigParserError
+except ImportError:
+    # Python 2
+    from ConfigParser import SafeConfigParser as ConfigParser, \
+        Error as ConfigParserError
+
+## Number of translated pathnames to remember
+_CACHE_SIZE = 4096
+
+## Default root for the automatically mounted Windows drives in WSL
+_WSL_AUTOMOUNT_ROOT = "/mnt/"
+
+## Octal escapes used by /proc/self/mounts for spaces and backslashes
+_MOUNT_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+## Line of the output of the Cygwin mount command
+_MOUNT_LINE = re.compile(r"^(.+) on (.+) type (\S+) \((.*)\)$")
+
+## Windows pathname starting with a drive letter
+_DRIVE_PATH = re.compile(r"^([A-Za-z]):(?:[\\/]|$)")
+
+########################################
+
+
+class LRUCache(object):
+    """
+    Thread safe cache that discards the least recently used entries.
+
+    Attributes:
+        maxsize: Maximum number of entries.
+    """
+
+    def __init__(self, maxsize=_CACHE_SIZE):
+        """
+        Create an empty cache.
+
+        Args:
+            maxsize: Maximum number of entries.
+        """
+
+        ## Maximum number of entries
+        self.maxsize = maxsize
+
+        ## Entries, ordered from oldest to most recently used
+        self._data = OrderedDict()
+
+        ## Lock for the entries
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Return the number of entries.
+        """
+
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """
+        Return the entry for a key and mark it as recently used.
+
+        Args:
+            key: Key of the entry.
+            default: Value to return if the key is not present.
+        Returns:
+            Cached value or default.
+        """
+
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def put(self, key, value):
+        """
+        Add an entry, discarding the oldest one if the cache is full.
+
+        Args:
+            key: Key of the entry.
+            value: Value to store.
+        """
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+
+        with self._lock:
+            self._data.clear()
+
+########################################
+
+
+def unescape_mount_field(field):
+    r"""
+    Decode the octal escapes of a field of /proc/self/mounts.
+
+    Spaces, tabs, newlines and backslashes are written as ``\040``,
+    ``\011``, ``\012`` and ``\134``.
+
+    Args:
+        field: Field as it appears in the file.
+    Returns:
+        Decoded string.
+    """
+
+    return _MOUNT_ESCAPE.sub(lambda match: chr(int(match.group(1), 8)), field)
+
+########################################
+
+
+def parse_proc_mounts(text):
+    r"""
+    Extract the Windows drive mounts from the contents of /proc/self/mounts.
+
+    WSL 1 mounts the drives with the drvfs file system, and the device is
+    the Windows path of the mount, such as ``C:\``. WSL 2 mounts them with
+    9p and the options ``aname=drvfs;path=C:\``. Some builds set the
+    device of those to ``drvfs``, so the path is taken from the options.
+    Mounts of anything but a drive or a UNC path are skipped.
+
+    Args:
+        text: Contents of /proc/self/mounts.
+    Returns:
+        list of (mount point, Windows root) tuples.
+    """
+
+    mounts = []
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        device, mount_point, fs_type, options = fields[:4]
+        if fs_type != "drvfs" and not (
+                fs_type == "9p" and "aname=drvfs" in options):
+            continue
+
+        if fs_type == "9p":
+            device = None
+            for option in re.split(r"[,;]", options):
+                if option.startswith("path="):
+                    device = option[5:]
+                    break
+            if device is None:
+                continue
+
+        windows_root = unescape_mount_field(device)
+        if not _DRIVE_PATH.match(windows_root) and \
+                not windows_root.startswith("\\\\"):
+            continue
+        if not windows_root.endswith("\\"):
+            windows_root += "\\"
+        mounts.append((unescape_mount_field(mount_point), windows_root))
+    return mounts
+
+########################################
+
+
+def parse_wsl_conf_root(text):
+    """
+    Extract the automount root from the contents of /etc/wsl.conf.
+
+    Args:
+        text: Contents of /etc/wsl.conf.
+    Returns:
+        Root directory ending with a slash, "/mnt/" if not set.
+    """
+
+    parser = ConfigParser()
+    try:
+        if hasattr(parser, "read_string"):
+            parser.read_string(text)
+        else:
+            # Python 2
+            # pylint: disable=import-outside-toplevel
+            from io import StringIO
+            parser.readfp(StringIO(type(u"")(text)))
+        root = parser.get("automount", "root")
+    except ConfigParserError:
+        return _WSL_AUTOMOUNT_ROOT
+
+    root = root.strip().strip("\"'")
+    if not root.startswith("/"):
+        return _WSL_AUTOMOUNT_ROOT
+    if not root.endswith("/"):
+        root += "/"
+    return root
+
+########################################
+
+
+def _to_backslashes(windows_name):
+    """
+    Return a Windows pathname with backslashes and no trailing separator.
+
+    Drive roots keep the backslash, so "C:/" becomes "C:\\".
+
+    Args:
+        windows_name: Windows pathname.
+    Returns:
+        Normalized pathname.
+    """
+
+    windows_name = windows_name.replace("/", "\\").rstrip("\\")
+    if windows_name.endswith(":"):
+        windows_name += "\\"
+    return windows_name
+
+########################################
+
+
+def parse_fstab(text):
+    """
+    Extract the mounts and cygdrive prefix from a Cygwin /etc/fstab.
+
+    Args:
+        text: Contents of /etc/fstab.
+    Returns:
+        tuple of a list of (mount point, Windows root) tuples and the
+        cygdrive prefix, which is None if the file doesn't set it.
+    """
+
+    mounts = []
+    cygdrive = None
+    for line in text.splitlines():
+        fields = line.split("#", 1)[0].split()
+        if len(fields) < 3:
+            continue
+        device, mount_point, fs_type = [
+            unescape_mount_field(field) for field in fields[:3]]
+        if fs_type == "cygdrive":
+            cygdrive = mount_point
+        elif _DRIVE_PATH.match(device) or device.startswith("//"):
+            mounts.append((mount_point, _to_backslashes(device)))
+    return mounts, cygdrive
+
+########################################
+
+
+def parse_mount_output(text):
+    """
+    Extract the mounts from the output of the Cygwin mount command.
+
+    Each line reads "C:/cygwin64/bin on /usr/bin type ntfs (binary,auto)".
+
+    Args:
+        text: Output of mount.
+    Returns:
+        list of (mount point, Windows root) tuples.
+    """
+
+    mounts = []
+    for line in text.splitlines():
+        match = _MOUNT_LINE.match(line)
+        if match:
+            device, mount_point = match.group(1, 2)
+            if _DRIVE_PATH.match(device) or device.startswith("//") or \
+                    device.startswith("\\\\"):
+                mounts.append((mount_point, _to_backslashes(device)))
+    return mounts
+
+########################################
+
+
+def find_cygdrive_prefix(mounts):
+    """
+    Determine the cygdrive prefix from the automatic drive mounts.
+
+    Drives are mounted as the prefix followed by the lower case drive
+    letter, such as "C:" on "/cygdrive/c" or "/c" for MSYS2.
+
+    Args:
+        mounts: list of (mount point, Windows root) tuples.
+    Returns:
+        Prefix ending with a slash or None if no drive is mounted.
+    """
+
+    for mount_point, windows_root in mounts:
+        if len(windows_root) == 3 and windows_root[1:] == ":\\" and \
+                mount_point.endswith("/" + windows_root[0].lower()):
+            return mount_point[:-1]
+    return None
+
+########################################
+
+
+def _read_text(path_name):
+    """
+    Return the contents of a text file, or an empty string on failure.
+
+    Args:
+        path_name: Pathname of the file.
+    Returns:
+        Contents of the file.
+    """
+
+    try:
+        with open(path_name, "r") as fileref:
+            return fileref.read()
+    except (OSError, IOError):
+        return ""
+
+########################################
+
+
+class PathTranslator(object):
+    """
+    Base class for the pathname translators.
+
+    Handles the pathnames that need no translation, the cache and the
+    fallback function. Subclasses translate with the mount table in
+    _to_windows() and _from_windows().
+
+    Attributes:
+        fallback: Function called as fallback(flag, path_name) for pathnames
+            that can't be translated, flag is "-w" or "-u".
+        batch_fallback: Function called as batch_fallback(flag, path_names)
+            to convert a list of pathnames at once, returning a list.
+        cache: LRUCache of the translated pathnames.
+    """
+
+    def __init__(self, fallback=None, cache_size=_CACHE_SIZE,
+                 batch_fallback=None):
+        """
+        Create the cache.
+
+        Args:
+            fallback: Function for the pathnames that can't be translated.
+            cache_size: Number of translated pathnames to remember.
+            batch_fallback: Function for a list of pathnames that can't be
+                translated.
+        """
+
+        ## Function for the pathnames that can't be translated
+        self.fallback = fallback
+
+        ## Function for a list of pathnames that can't be translated
+        self.batch_fallback = batch_fallback
+
+        ## Cache of the translated pathnames
+        self.cache = LRUCache(cache_size)
+
+    def _to_windows(self, path_name):
+        """
+        Translate an absolute host pathname with the mount table.
+
+        Args:
+            path_name: Absolute host pathname.
+        Returns:
+            Windows pathname or None if the mount table doesn't cover it.
+        """
+
+        # pylint: disable=unused-argument
+        return None
+
+    def _from_windows(self, path_name):
+        """
+        Translate a Windows pathname with the mount table.
+
+        Args:
+            path_name: Windows pathname using backslashes.
+        Returns:
+            Host pathname or None if the mount table doesn't cover it.
+        """
+
+        # pylint: disable=unused-argument
+        return None
+
+    def _convert(self, flag, path_name, use_fallback=True):
+        """
+        Convert a pathname with the cache, the mount table and the fallback.
+
+        Args:
+            flag: "-w" to convert to Windows, "-u" to convert from Windows.
+            path_name: Pathname to convert.
+            use_fallback: False to return None instead of calling fallback.
+        Returns:
+            tuple of the pathname used as the cache key and the converted
+            pathname or None on failure.
+        """
+
+        if flag == "-w":
+            # Network drive name?
+            if path_name.startswith("\\\\") or ":" in path_name:
+                return path_name, path_name
+            path_name = os.path.abspath(os.path.expanduser(path_name))
+        elif path_name[0] in ("~", "/"):
+            return path_name, path_name
+
+        key = (flag, path_name)
+        result = self.cache.get(key)
+        if result is not None:
+            return path_name, result
+
+        if flag == "-w":
+            result = self._to_windows(path_name)
+        else:
+            result = self._from_windows(path_name.replace("/", "\\"))
+        if result is None and use_fallback and self.fallback is not None:
+            result = self.fallback(flag, path_name)
+
+        if result is not None:
+            self.cache.put(key, result)
+        return path_name, result
+
+    def _convert_many(self, flag, path_names):
+        """
+        Convert a list of pathnames with one call to the batch fallback.
+
+        Args:
+            flag: "-w" to convert to Windows, "-u" to convert from Windows.
+            path_names: iterable of pathnames.
+        Returns:
+            list of converted pathnames, None for each failure.
+        """
+
+        use_fallback = self.batch_fallback is None
+        items = [self._convert(flag, path_name, use_fallback)
+                 for path_name in path_names]
+
+        # Pass the ones the table didn't cover to the batch fallback
+        missing = [key for key, result in items if result is None]
+        if not use_fallback and missing:
+            missing = list(OrderedDict.fromkeys(missing))
+            converted = dict(zip(missing, self.batch_fallback(flag, missing)))
+            for key in missing:
+                if converted.get(key) is not None:
+                    self.cache.put((flag, key), converted[key])
+            return [converted.get(key) if result is None else result
+                    for key, result in items]
+        return [result for _, result in items]
+
+    def to_windows(self, path_name):
+        """
+        Convert a host path to Windows.
+
+        If the path is already Windows format, it will be returned unchanged.
+
+        Args:
+            path_name: Windows or host pathname
+        Return:
+            Pathname converted to Windows or None on failure.
+        """
+
+        return self._convert("-w", path_name)[1]
+
+    def from_windows(self, path_name):
+        """
+        Convert an absolute Windows path to the host.
+
+        If the path is already host format, it will be returned unchanged.
+
+        Args:
+            path_name: Absolute Windows pathname
+        Return:
+            Pathname converted to the host or None on failure.
+        """
+
+        return self._convert("-u", path_name)[1]
+
+    def to_windows_many(self, path_names):
+        """
+        Convert a list of host paths to Windows.
+
+        The pathnames the mount table doesn't cover are converted with a
+        single call to the batch fallback.
+
+        Args:
+            path_names: iterable of Windows or host pathnames.
+        Return:
+            list of pathnames converted to Windows, None for each failure.
+        See Also:
+            to_windows
+        """
+
+        return self._convert_many("-w", path_names)
+
+    def from_windows_many(self, path_names):
+        """
+        Convert a list of absolute Windows paths to the host.
+
+        The pathnames the mount table doesn't cover are converted with a
+        single call to the batch fallback.
+
+        Args:
+            path_names: iterable of absolute Windows pathnames.
+        Return:
+            list of pathnames converted to the host, None for each failure.
+        See Also:
+            from_windows
+        """
+
+        return self._convert_many("-u", path_names)
+
+########################################
+
+
+class WslPathTranslator(PathTranslator):
+    r"""
+    Translate pathnames between WSL and Windows without running wslpath.
+
+    Pathnames on a mounted Windows drive are translated with the mount
+    table. Pathnames that can't be translated that way, such as files in
+    the Linux file system that are reached through ``\\wsl$``, are passed
+    to the fallback function.
+
+    Attributes:
+        mounts: list of (mount point, Windows root) tuples.
+        automount_root: Directory where the drives are mounted.
+    """
+
+    def __init__(self, mounts=(), automount_root=_WSL_AUTOMOUNT_ROOT,
+                 fallback=None, cache_size=_CACHE_SIZE, batch_fallback=None):
+        """
+        Create a translator for a mount table.
+
+        Args:
+            mounts: iterable of (mount point, Windows root) tuples.
+            automount_root: Directory where the drives are mounted.
+            fallback: Function for the pathnames that can't be translated.
+            cache_size: Number of translated pathnames to remember.
+            batch_fallback: Function for a list of pathnames that can't be
+                translated.
+        """
+
+        PathTranslator.__init__(self, fallback, cache_size, batch_fallback)
+
+        ## Mounts sorted so the longest pathnames are checked first
+        self.mounts = sorted(
+            ((mount_point.rstrip("/") or "/", windows_root)
+             for mount_point, windows_root in mounts),
+            key=lambda item: len(item[0]), reverse=True)
+
+        ## Mounts sorted by the length of the Windows root
+        self._windows_mounts = sorted(
+            self.mounts, key=lambda item: len(item[1]), reverse=True)
+
+        ## Directory where the drives are mounted
+        self.automount_root = automount_root
+
+    @classmethod
+    def from_system(cls, fallback=None):
+        """
+        Create a translator from the mount table of the running system.
+
+        Args:
+            fallback: Function for the pathnames that can't be translated.
+        Returns:
+            WslPathTranslator instance.
+        """
+
+        return cls(parse_proc_mounts(_read_text("/proc/self/mounts")),
+                   parse_wsl_conf_root(_read_text("/etc/wsl.conf")),
+                   fallback)
+
+    def _to_windows(self, path_name):
+        """
+        Translate a pathname on a mounted Windows drive.
+
+        Args:
+            path_name: Absolute Linux pathname.
+        Returns:
+            Windows pathname or None.
+        """
+
+        for mount_point, windows_root in self.mounts:
+            if path_name == mount_point:
+                return windows_root
+            prefix = mount_point.rstrip("/") + "/"
+            if path_name.startswith(prefix):
+                return windows_root + \
+                    path_name[len(prefix):].replace("/", "\\")
+        return None
+
+    def _from_windows(self, path_name):
+        """
+        Translate a pathname on a Windows drive.
+
+        Args:
+            path_name: Windows pathname using backslashes.
+        Returns:
+            Linux pathname or None.
+        """
+
+        folded_name = path_name.lower()
+        for mount_point, windows_root in self._windows_mounts:
+            if folded_name.startswith(windows_root.lower()):
+                return mount_point.rstrip("/") + "/" + \
+                    path_name[len(windows_root):].replace("\\", "/")
+
+        match = _DRIVE_PATH.match(path_name)
+        if match:
+            # Not in the mount table, use the automount location
+            return self.automount_root + match.group(1).lower() + \
+                "/" + path_name[3:].replace("\\", "/")
+        return None
+
+########################################
+
+
+class CygwinPathTranslator(PathTranslator):
+    """
+    Translate pathnames between Cygwin or MSYS2 and Windows without cygpath.
+
+    Pathnames are translated with the Cygwin mount table, drives that
+    aren't in the table are reached through the cygdrive prefix.
+
+    Attributes:
+        mounts: list of (mount point, Windows root) tuples.
+        cygdrive: Prefix for the drives, such as "/cygdrive/" or "/".
+    """
+
+    def __init__(self, mounts=(), cygdrive="/cygdrive/", fallback=None,
+                 cache_size=_CACHE_SIZE, batch_fallback=None):
+        """
+        Create a translator for a mount table.
+
+        Args:
+            mounts: iterable of (mount point, Windows root) tuples.
+            cygdrive: Prefix for the drives.
+            fallback: Function for the pathnames that can't be translated.
+            cache_size: Number of translated pathnames to remember.
+            batch_fallback: Function for a list of pathnames that can't be
+                translated.
+        """
+
+        PathTranslator.__init__(self, fallback, cache_size, batch_fallback)
+
+        if not cygdrive.endswith("/"):
+            cygdrive += "/"
+
+        ## Prefix for the drives
+        self.cygdrive = cygdrive
+
+        ## Mounts sorted so the longest pathnames are checked first
+        self.mounts = sorted(
+            ((mount_point.rstrip("/") or "/", _to_backslashes(windows_root))
+             for mount_point, windows_root in mounts),
+            key=lambda item: len(item[0]), reverse=True)
+
+        ## Mounts sorted by the length of the Windows root
+        self._windows_mounts = sorted(
+            self.mounts, key=lambda item: len(item[1]), reverse=True)
+
+    @classmethod
+    def from_system(cls, fallback=None, batch_fallback=None):
+        """
+        Create a translator from the mount table of the running system.
+
+        The output of mount is read once, the cygdrive prefix comes from
+        /etc/fstab or, if not set there, from the mounted drives.
+
+        Args:
+            fallback: Function for the pathnames that can't be translated.
+            batch_fallback: Function for a list of pathnames that can't be
+                translated.
+        Returns:
+            CygwinPathTranslator instance.
+        """
+
+        fstab_mounts, cygdrive = parse_fstab(_read_text("/etc/fstab"))
+        try:
+            tempfp = subprocess.Popen(("mount",), stdout=subprocess.PIPE,
+                                      stderr=None, universal_newlines=True)
+            stdoutstr, _ = tempfp.communicate()
+            mounts = parse_mount_output(stdoutstr)
+        except OSError:
+            mounts = []
+
+        if not mounts:
+            mounts = fstab_mounts
+        if cygdrive is None:
+            cygdrive = find_cygdrive_prefix(mounts) or "/cygdrive/"
+        return cls(mounts, cygdrive, fallback,
+                   batch_fallback=batch_fallback)
+
+    def _to_windows(self, path_name):
+        """
+        Translate a pathname with the mount table or the cygdrive prefix.
+
+        Args:
+            path_name: Absolute Cygwin pathname.
+        Returns:
+            Windows pathname or None.
+        """
+
+        best = None
+        for mount_point, windows_root in self.mounts:
+            prefix = mount_point.rstrip("/") + "/"
+            if path_name == mount_point or path_name.startswith(prefix):
+                best = (mount_point, windows_root)
+                break
+
+        # /cygdrive/c is used unless a longer mount point matches
+        if path_name.startswith(self.cygdrive):
+            drive = path_name[len(self.cygdrive):].split("/", 1)
+            if len(drive[0]) == 1 and drive[0].isalpha() and (
+                    best is None or
+                    len(best[0]) <= len(self.cygdrive) + 1):
+                best = (self.cygdrive + drive[0], drive[0].upper() + ":\\")
+
+        if best is None:
+            return None
+        mount_point, windows_root = best
+        remainder = path_name[len(mount_point):].lstrip("/")
+        if not remainder:
+            return windows_root
+        return windows_root.rstrip("\\") + "\\" + remainder.replace("/", "\\")
+
+    def _from_windows(self, path_name):
+        """
+        Translate a Windows pathname with the mount table or cygdrive prefix.
+
+        Args:
+            path_name: Windows pathname using backslashes.
+        Returns:
+            Cygwin pathname or None.
+        """
+
+        folded_name = path_name.lower()
+        for mount_point, windows_root in self._windows_mounts:
+            folded_root = windows_root.lower().rstrip("\\")
+            if folded_name == folded_root or \
+                    folded_name.startswith(folded_root + "\\"):
+                remainder = path_name[len(folded_root):]
+                break
+        else:
+            match = _DRIVE_PATH.match(path_name)
+            if not match:
+                return None
+            mount_point = self.cygdrive + match.group(1).lower()
+            remainder = path_name[2:]
+
+        return (mount_point.rstrip("/") + remainder.replace("\\", "/")) or "/"
@@ -0,0 +1,504 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Read the version resource of Windows executables without Windows.
+
+The PE file is memory mapped and the resource directory is walked to the
+VS_VERSIONINFO resource, which is parsed in place. No Windows API, bridge
+or pathname conversion is needed, so this works on any platform that can
+read the file.
+"""
+
+## \package wslwinreg.peinfo
+
+# pylint: disable=useless-object-inheritance
+# pylint: disable=consider-using-f-string
+
+import mmap
+from struct import unpack_from, error as StructError
+
+## Resource type of the version information
+RT_VERSION = 16
+
+## Signature of VS_FIXEDFILEINFO
+VS_FFI_SIGNATURE = 0xFEEF04BD
+
+## Magic number of a PE32 optional header
+_PE32_MAGIC = 0x10b
+
+## Magic number of a PE32+ optional header
+_PE32_PLUS_MAGIC = 0x20b
+
+## Index of the resource table in the data directories
+_RESOURCE_DIRECTORY = 2
+
+## Bit set in a resource directory entry pointing to a subdirectory
+_SUBDIRECTORY = 0x80000000
+
+## Names of the fields of VS_FIXEDFILEINFO after the signature
+_FIXED_FIELDS = (
+    "StrucVersion", "FileVersionMS", "FileVersionLS", "ProductVersionMS",
+    "ProductVersionLS", "FileFlagsMask", "FileFlags", "FileOS", "FileType",
+    "FileSubtype", "FileDateMS", "FileDateLS")
+
+########################################
+
+
+def _align4(offset):
+    """
+    Round an offset up to a multiple of 4.
+    """
+
+    return (offset + 3) & ~3
+
+########################################
+
+
+def _read_node(data, offset, end):
+    """
+    Parse the header of a node of the VS_VERSIONINFO tree.
+
+    Every node is a length, a value length, a type, a UTF-16 key, the
+    value and the child nodes, each one aligned to 32 bits.
+
+    Args:
+        data: Buffer holding the resource.
+        offset: Offset of the node.
+        end: Offset of the end of the parent node.
+    Returns:
+        tuple of key, value offset, value size in bytes, value type,
+        offset of the first child and offset of the end of the node.
+    """
+
+    length, value_length, value_type = unpack_from("<HHH", data, offset)
+    node_end = min(offset + length, end)
+
+    # Find the terminating zero of the key, on a character boundary
+    key_start = offset + 6
+    key_end = data.find(b"\0\0", key_start, node_end)
+    while key_end != -1 and (key_end - key_start) & 1:
+        key_end = data.find(b"\0\0", key_end + 1, node_end)
+    if key_end == -1:
+        key_end = node_end
+    key = data[key_start:key_end].decode("utf-16-le", "replace")
+
+    value_start = _align4(key_end + 2)
+    # Text values are measured in characters
+    value_size = value_length * 2 if value_type == 1 else value_length
+    children = _align4(value_start + value_size)
+    return key, value_start, value_size, value_type, children, node_end
+
+########################################
+
+
+def _iter_children(data, offset, end):
+    """
+    Iterate over the child nodes of a node.
+
+    Args:
+        data: Buffer holding the resource.
+        offset: Offset of the first child.
+        end: Offset of the end of the parent node.
+    Returns:
+        Iterator of the tuples returned by _read_node().
+    """
+
+    while offset + 6 <= end:
+        node = _read_node(data, offset, end)
+        if node[5] <= offset:
+            break
+        yield node
+        offset = _align4(node[5])
+
+########################################
+
+
+def _read_text(data, offset, end):
+    """
+    Return a UTF-16 string value up to its terminating zero.
+
+    The value lengths in some files are wrong, so the string is read up to
+    the zero or the end of the node instead.
+
+    Args:
+        data: Buffer holding the resource.
+        offset: Offset of the string.
+        end: Offset of the end of the node.
+    Returns:
+        Decoded string.
+    """
+
+    text = data[offset:end].decode("utf-16-le", "replace")
+    return text.split(u"\0", 1)[0]
+
+########################################
+
+
+class VersionInfo(object):
+    """
+    Contents of a VS_VERSIONINFO resource.
+
+    Attributes:
+        fixed: dict of the VS_FIXEDFILEINFO fields, or None if absent.
+        translations: list of (language, codepage) tuples from VarFileInfo.
+        string_tables: dict mapping the string table names, such as
+            "040904b0", to dicts of the strings.
+    """
+
+    def __init__(self, fixed=None, translations=None, string_tables=None):
+        """
+        Initialize the version information.
+
+        Args:
+            fixed: dict of the VS_FIXEDFILEINFO fields.
+            translations: list of (language, codepage) tuples.
+            string_tables: dict of string tables.
+        """
+
+        ## dict of the VS_FIXEDFILEINFO fields
+        self.fixed = fixed
+
+        ## list of (language, codepage) tuples
+        self.translations = translations or []
+
+        ## dict of string tables, each a dict of strings
+        self.string_tables = string_tables or {}
+
+    def query(self, string_name):
+        r"""
+        Return a string from the table of the default translation.
+
+        This matches how get_file_info() queries Windows, the first entry
+        of \VarFileInfo\Translation selects the string table, and names
+        are matched without regard to case like VerQueryValueW().
+
+        Args:
+            string_name: Name of the string, such as "FileVersion".
+        Returns:
+            String or None if not found.
+        """
+
+        table = self.default_table()
+        if table is None:
+            return None
+        if string_name in table:
+            return table[string_name]
+        string_name = string_name.lower()
+        for name, value in table.items():
+            if name.lower() == string_name:
+                return value
+        return None
+
+    def default_table(self):
+        """
+        Return the string table of the default translation.
+
+        Returns:
+            dict of the strings, or None if there is no such table.
+        """
+
+        if not self.translations:
+            return None
+        return self.string_tables.get(
+            "{0:04x}{1:04x}".format(*self.translations[0]))
+
+    def _version(self, prefix):
+        """
+        Return a four part version from the fixed file information.
+
+        Args:
+            prefix: "FileVersion" or "ProductVersion".
+        Returns:
+            tuple of four integers or None.
+        """
+
+        if self.fixed is None:
+            return None
+        high = self.fixed[prefix + "MS"]
+        low = self.fixed[prefix + "LS"]
+        return (high >> 16, high & 0xFFFF, low >> 16, low & 0xFFFF)
+
+    def as_dict(self):
+        """
+        Return everything in the resource as a dict.
+
+        The dict has these entries:
+            "strings": dict of string table names, such as "040904b0",
+                to dicts of every string in the table.
+            "translations": list of (language, codepage) tuples.
+            "file_version": tuple of four integers from VS_FIXEDFILEINFO.
+            "product_version": tuple of four integers from VS_FIXEDFILEINFO.
+            "fixed": dict of every VS_FIXEDFILEINFO field.
+        The versions and "fixed" are None if there is no VS_FIXEDFILEINFO.
+
+        Returns:
+            dict of the version information.
+        """
+
+        return {
+            "strings": self.string_tables,
+            "translations": self.translations,
+            "file_version": self._version("FileVersion"),
+            "product_version": self._version("ProductVersion"),
+            "fixed": self.fixed}
+
+########################################
+
+
+def parse_version_info(data, offset=0, end=None):
+    """
+    Parse a VS_VERSIONINFO resource.
+
+    Args:
+        data: Buffer holding the resource.
+        offset: Offset of the resource in the buffer.
+        end: Offset of the end of the resource, defaults to the buffer end.
+    Returns:
+        VersionInfo instance.
+    Exception:
+        ``ValueError`` if the resource is malformed.
+    """
+
+    if end is None:
+        end = len(data)
+    try:
+        key, value_start, value_size, _, children, node_end = _read_node(
+            data, offset, end)
+        if key != u"VS_VERSION_INFO":
+            raise ValueError("Not a VS_VERSIONINFO resource")
+
+        fixed = None
+        if value_size >= 52:
+            values = unpack_from("<13I", data, value_start)
+            if values[0] == VS_FFI_SIGNATURE:
+                fixed = dict(zip(_FIXED_FIELDS, values[1:]))
+
+        translations = []
+        string_tables = {}
+        for key, value_start, value_size, _, sub_children, sub_end in \
+                _iter_children(data, children, node_end):
+            if key == u"StringFileInfo":
+                for table in _iter_children(data, sub_children, sub_end):
+                    strings = {}
+                    for item in _iter_children(data, table[4], table[5]):
+                        strings[item[0]] = _read_text(data, item[1], item[5])
+                    string_tables[table[0].lower()] = strings
+            elif key == u"VarFileInfo":
+                for var in _iter_children(data, sub_children, sub_end):
+                    if var[0] == u"Translation":
+                        for index in range(var[1], var[1] + var[2] - 3, 4):
+                            translations.append(
+                                unpack_from("<HH", data, index))
+    except StructError:
+        raise ValueError("Truncated VS_VERSIONINFO resource")
+
+    return VersionInfo(fixed, translations, string_tables)
+
+########################################
+
+
+def _rva_to_offset(sections, rva):
+    """
+    Convert a relative virtual address to a file offset.
+
+    Args:
+        sections: list of (virtual address, virtual size, raw size,
+            raw offset) tuples.
+        rva: Relative virtual address.
+    Returns:
+        File offset or None if no section contains the address.
+    """
+
+    for virtual_address, virtual_size, raw_size, raw_offset in sections:
+        if virtual_address <= rva < virtual_address + \
+                max(virtual_size, raw_size):
+            return rva - virtual_address + raw_offset
+    return None
+
+########################################
+
+
+def _find_version_resource(data):
+    """
+    Locate the VS_VERSIONINFO resource in a PE file.
+
+    Args:
+        data: Buffer holding the PE file.
+    Returns:
+        tuple of the file offset and size of the resource or None.
+    """
+
+    if data[0:2] != b"MZ":
+        return None
+    pe_offset = unpack_from("<I", data, 0x3C)[0]
+    if data[pe_offset:pe_offset + 4] != b"PE\0\0":
+        return None
+
+    section_count, optional_size = unpack_from("<2xH12xH", data, pe_offset + 4)
+    optional = pe_offset + 24
+    magic = unpack_from("<H", data, optional)[0]
+    if magic == _PE32_MAGIC:
+        directories = optional + 96
+    elif magic == _PE32_PLUS_MAGIC:
+        directories = optional + 112
+    else:
+        return None
+
+    if unpack_from("<I", data, directories - 4)[0] <= _RESOURCE_DIRECTORY:
+        return None
+    resource_rva = unpack_from(
+        "<I", data, directories + _RESOURCE_DIRECTORY * 8)[0]
+    if not resource_rva:
+        return None
+
+    sections = []
+    table = optional + optional_size
+    for index in range(section_count):
+        sections.append(unpack_from(
+            "<8xIIII", data, table + index * 40)[:4])
+    # Reorder to virtual address, virtual size, raw size, raw offset
+    sections = [(item[1], item[0], item[2], item[3]) for item in sections]
+
+    resource_base = _rva_to_offset(sections, resource_rva)
+    if resource_base is None:
+        return None
+
+    # Type, then name, then language. Take RT_VERSION, then the first name
+    # and first language, as LoadResource() would for VS_VERSION_INFO.
+    directory = resource_base
+    wanted = RT_VERSION
+    for _ in range(3):
+        named, ids = unpack_from("<12xHH", data, directory)
+        entries = directory + 16
+        target = None
+        for index in range(named + ids):
+            name, child = unpack_from("<II", data, entries + index * 8)
+            if wanted is None or name == wanted:
+                target = child
+                break
+        if target is None:
+            return None
+        wanted = None
+        if not target & _SUBDIRECTORY:
+            break
+        directory = resource_base + (target & ~_SUBDIRECTORY)
+
+    if target & _SUBDIRECTORY:
+        return None
+    data_rva, data_size = unpack_from("<II", data, resource_base + target)
+    data_offset = _rva_to_offset(sections, data_rva)
+    if data_offset is None:
+        return None
+    return data_offset, data_size
+
+########################################
+
+
+def read_version_resource(path_name):
+    """
+    Read the raw VS_VERSIONINFO resource of a PE file.
+
+    The file is memory mapped, so only the pages holding the headers and
+    the resource are read.
+
+    Args:
+        path_name: Host pathname of the exe or dll.
+    Returns:
+        bytes of the resource or None if the file can't be read, isn't a PE
+        file or has no version resource.
+    """
+
+    try:
+        with open(path_name, "rb") as fileref:
+            data = mmap.mmap(fileref.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, IOError, ValueError):
+        return None
+
+    try:
+        location = _find_version_resource(data)
+        if location is None:
+            return None
+        offset, size = location
+        return data[offset:min(offset + size, len(data))]
+    except (StructError, ValueError):
+        return None
+    finally:
+        data.close()
+
+########################################
+
+
+def read_version_info(path_name):
+    """
+    Read the version resource of a PE file.
+
+    The file is memory mapped, so only the pages holding the headers and
+    the resource are read.
+
+    Args:
+        path_name: Host pathname of the exe or dll.
+    Returns:
+        VersionInfo instance or None if the file can't be read, isn't a PE
+        file or has no version resource.
+    """
+
+    try:
+        with open(path_name, "rb") as fileref:
+            data = mmap.mmap(fileref.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, IOError, ValueError):
+        return None
+
+    try:
+        location = _find_version_resource(data)
+        if location is None:
+            return None
+        offset, size = location
+        return parse_version_info(data, offset, min(offset + size, len(data)))
+    except (StructError, ValueError):
+        return None
+    finally:
+        data.close()
+
+########################################
+
+
+def get_file_info(path_name, string_name):
+    r"""
+    Extract information from a windows exe file version resource.
+
+    Given a windows exe file, extract the "StringFileInfo" resource and
+    parse out the data chunk named by string_name, without calling Windows.
+
+    Args:
+        path_name: Host pathname of the exe or dll.
+        string_name: Name of the data chunk to retrieve
+
+    Return:
+        None if no record found or an error, or a valid string
+    """
+
+    info = read_version_info(path_name)
+    if info is None:
+        return None
+    return info.query(string_name)
+
+########################################
+
+
+def get_file_info_all(path_name):
+    """
+    Extract everything from a windows exe file version resource.
+
+    Args:
+        path_name: Host pathname of the exe or dll.
+
+    Return:
+        None if the file has no version resource or an error, or the dict
+        described in VersionInfo.as_dict()
+    """
+
+    info = read_version_info(path_name)
+    if info is None:
+        return None
+    return info.as_dict()
@@ -19,16 +19,30 @@ Package that implements winreg for Windows Subsystem for Linux
 # pylint: disable=consider-using-with
 
 import os
+import sys
 import subprocess
 import socket
 import platform
 import struct
 import shutil
+import hashlib
+import threading
+import itertools
+import atexit
+import select
+import tempfile
+import time
+import weakref
+from collections import deque, OrderedDict
 from enum import IntEnum
 
 from .common import KEY_WRITE, KEY_WOW64_64KEY, KEY_READ, PY2, \
     winerror_to_errno, builtins, ERROR_FILE_NOT_FOUND, from_registry_bytes, \
-    REG_SZ, to_registry_bytes
+    REG_SZ, REG_EXPAND_SZ, REG_MULTI_SZ, REG_DWORD, REG_QWORD, \
+    to_registry_bytes, RegistryFuture, Batch as _ImmediateBatch, \
+    get_cache_dir, read_json_file, write_json_file
+from .pathconv import WslPathTranslator
+from .peinfo import read_version_info, parse_version_info
 
 
 ## Type long for Python 2 compatibility
@@ -61,6 +75,60 @@ _LOCALHOST = "127.0.0.1"
 ## Transmission buffer size
 _BUFFER_SIZE = 1024
 
+## Handshake sent by the bridge executable on every connection
+_HANDSHAKE = b"Bridge started 2.0"
+
+## Flag for Commands.ENUM_KEYS to include the last write times
+_ENUM_KEYS_WITH_TIMES = 1
+
+## Seconds to wait for a reply from the bridge
+_TIMEOUT = 5.0
+
+## Seconds to wait for ConnectRegistry(), which can take a while
+_CONNECT_TIMEOUT = 20.0
+
+## Set in the length of a reply frame if more frames of the reply follow
+_REPLY_MORE_FRAMES = 0x80000000
+
+## Header of every reply frame, the request ID and the length
+_FRAME_HEADER = struct.Struct("<II")
+
+## Size of the reusable buffer for reading frame headers
+_RECEIVE_SIZE = 65536
+
+## Size of the buffer a _FrameBuilder packs the fields of a command into
+_BUILDER_SIZE = 512
+
+## Payloads this size or larger are sent as their own segment
+_INLINE_MAX = 4096
+
+## Maximum number of segments passed to a single sendmsg() call
+_SENDMSG_MAX_SEGMENTS = 1024
+
+## Registry types that to_registry_bytes() converts, all others are binary
+_CONVERTED_TYPES = (REG_SZ, REG_EXPAND_SZ, REG_MULTI_SZ, REG_DWORD, REG_QWORD)
+
+## Maximum number of connections to the bridge executable
+_MAX_CONNECTIONS = 64
+
+## Seconds to wait for the bridge executable to connect
+_START_TIMEOUT = 10.0
+
+## Seconds between attempts to reach a broker that is starting
+_BROKER_POLL = 0.02
+
+## Maximum bytes of queued commands sent in a single batch write. The
+# reader thread takes replies while commands are written, so this doesn't
+# prevent a stall. It bounds the memory queued commands hold, and lets the
+# bridge start on a large batch while the rest is still being queued.
+_BATCH_MAX_BYTES = 32768
+
+## Number of posted commands that are sent without waiting for a request
+_MAX_POSTED = 256
+
+## Maximum number of queued commands sent in a single batch write
+_BATCH_MAX_COMMANDS = 256
+
 ## Directory for the windows executables
 _WIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin")
 
@@ -93,35 +161,24 @@ def test_string(input_string):
 ########################################
 
 
-def convert_to_windows_path(path_name):
+def _wslpath(flag, path_name):
     """
-    Convert a WSL path to windows if needed.
-
-    If the path is already Windows format, it will be returned unchanged.
+    Convert a pathname by running wslpath.
 
     Args:
-        path_name: Windows or Linux pathname
+        flag: "-w" to convert to Windows, "-u" to convert from Windows.
+        path_name: Pathname to convert.
     Return:
-        Pathname converted to Windows.
-    See Also:
-        convert_from_windows_path
+        Converted pathname or None on failure.
     """
 
-    # Network drive name?
-    if path_name.startswith("\\\\") or ":" in path_name:
-        return path_name
-
-    # The tool doesn't process ~ properly, help it by preprocessing here.
-    args = ("wslpath",
-            "-a",
-            "-w",
-            os.path.abspath(os.path.expanduser(path_name))
-            )
+    # Create command list
+    args = ("wslpath", "-a", flag, path_name)
 
     # Perform the conversion
     tempfp = subprocess.Popen(args, stdout=subprocess.PIPE,
                               stderr=None, universal_newlines=True)
-    # Get the string returned by cygpath
+    # Get the string returned by wslpath
     stdoutstr, _ = tempfp.communicate()
 
     # Error? Fail
@@ -132,12 +189,61 @@ def convert_to_windows_path(path_name):
 ########################################
 
 
+## Translator created on first use from the mount table
+_TRANSLATOR = None
+
+
+def _translator():
+    """
+    Return the path translator for this system.
+
+    Returns:
+        WslPathTranslator instance.
+    """
+
+    # pylint: disable=global-statement
+    global _TRANSLATOR
+
+    if _TRANSLATOR is None:
+        _TRANSLATOR = WslPathTranslator.from_system(_wslpath)
+    return _TRANSLATOR
+
+########################################
+
+
+def convert_to_windows_path(path_name):
+    """
+    Convert a WSL path to windows if needed.
+
+    If the path is already Windows format, it will be returned unchanged.
+
+    Paths on the mounted Windows drives are converted using the mount
+    table, wslpath is only run for other paths, such as the ones in the
+    Linux file system. Results are cached.
+
+    Args:
+        path_name: Windows or Linux pathname
+    Return:
+        Pathname converted to Windows.
+    See Also:
+        convert_from_windows_path
+    """
+
+    return _translator().to_windows(path_name)
+
+########################################
+
+
 def convert_from_windows_path(path_name):
     """
     Convert an absolute Windows path to WSL.
 
     If the path is already Linux format, it will be returned unchanged.
 
+    Paths on Windows drives are converted using the mount table, wslpath
+    is only run for other paths, such as ``\\\\wsl$`` names. Results are
+    cached.
+
     Args:
         path_name: Absolute Windows pathname
     Return:
@@ -146,23 +252,50 @@ def convert_from_windows_path(path_name):
         convert_to_windows_path
     """
 
-    # Network drive name?
-    if path_name[0] in ("~", "/"):
-        return path_name
+    return _translator().from_windows(path_name)
 
-    # Create command list
-    args = ("wslpath", "-a", "-u", path_name)
+########################################
 
-    # Perform the conversion
-    tempfp = subprocess.Popen(args, stdout=subprocess.PIPE,
-                              stderr=None, universal_newlines=True)
-    # Get the string returned by cygpath
-    stdoutstr, _ = tempfp.communicate()
 
-    # Error? Fail
-    if tempfp.returncode:
-        return None
-    return stdoutstr.strip()
+def convert_to_windows_paths(path_names):
+    """
+    Convert a list of WSL paths to windows.
+
+    The pathnames are converted in a single pass using the mount table,
+    wslpath only takes one pathname, so it's run for each pathname the
+    table doesn't cover.
+
+    Args:
+        path_names: iterable of Windows or Linux pathnames.
+    Return:
+        list of pathnames converted to Windows, in the same order, with
+        None for each pathname that couldn't be converted.
+    See Also:
+        convert_to_windows_path
+    """
+
+    return _translator().to_windows_many(path_names)
+
+########################################
+
+
+def convert_from_windows_paths(path_names):
+    """
+    Convert a list of absolute Windows paths to WSL.
+
+    The pathnames are converted in a single pass using the mount table,
+    wslpath is only run for the ones the table doesn't cover.
+
+    Args:
+        path_names: iterable of absolute Windows pathnames.
+    Return:
+        list of pathnames converted to Linux, in the same order, with None
+        for each pathname that couldn't be converted.
+    See Also:
+        convert_from_windows_path
+    """
+
+    return _translator().from_windows_many(path_names)
 
 ########################################
 
@@ -237,6 +370,41 @@ def get_windows_user():
 ########################################
 
 
+def get_cache_path():
+    """
+    Return the pathname of the file caching the location of the bridge exe.
+
+    The file resides in $XDG_CACHE_HOME/wslwinreg, which defaults to
+    ~/.cache/wslwinreg.
+
+    Returns:
+        Pathname of the cache file.
+    """
+
+    return os.path.join(get_cache_dir(), "bridge-" + _EXESUFFIX + ".json")
+
+########################################
+
+
+def _file_hash(path_name):
+    """
+    Return the SHA-256 of a file as a hex string.
+
+    Args:
+        path_name: Pathname of the file to hash.
+    Returns:
+        Hex digest of the file contents.
+    """
+
+    digest = hashlib.sha256()
+    with open(path_name, "rb") as fileref:
+        for chunk in iter(lambda: fileref.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+########################################
+
+
 def get_exe_path():
     """
     Determine where the bridge exe resides
@@ -246,10 +414,43 @@ def get_exe_path():
     This is done because launching an EXE file from the
     Linux file system is slow. This corrects the issue
 
+    Finding the Windows user is slow, so the result is stored in the file
+    returned by get_cache_path(). The cached record is used as long as
+    the package version and the size and time of the packaged exe match,
+    and the installed copy still has the size and time it had when it was
+    checked.
+
     Returns:
         Pathname of the bridge exe
     """
 
+    # pylint: disable=import-outside-toplevel
+    from . import __version__
+
+    # Select the correct binary
+    bridge_name = "backend-" + _EXESUFFIX + ".exe"
+    origin_path = os.path.join(_WIN_DIR, bridge_name)
+    origin_stat = os.stat(origin_path)
+
+    # Values that must match for the cache to be valid
+    cache_key = {
+        "version": __version__,
+        "origin_size": origin_stat.st_size,
+        "origin_mtime": int(origin_stat.st_mtime)}
+
+    cache_path = get_cache_path()
+    record = read_json_file(cache_path)
+    if record and all(record.get(key) == value
+                      for key, value in cache_key.items()):
+        bridge_path = record.get("bridge_path")
+        try:
+            bridge_stat = os.stat(bridge_path)
+            if record.get("bridge_size") == bridge_stat.st_size and \
+                    record.get("bridge_mtime") == int(bridge_stat.st_mtime):
+                return bridge_path
+        except (OSError, TypeError):
+            pass
+
     # Since the registry is off limits here, use
     # clever techniques to determine the logged in
     # Windows user's home directory
@@ -263,24 +464,101 @@ def get_exe_path():
     if not os.path.isdir(user_path):
         os.mkdir(user_path)
 
-    # Select the correct binary
-    bridge_name = "backend-" + _EXESUFFIX + ".exe"
-
     # Where should it reside?
     bridge_path = os.path.join(user_path, bridge_name)
 
-    # If it's not there, copy it
-    if not os.path.isfile(bridge_path):
-
-        origin_path = os.path.join(
-            _WIN_DIR, bridge_name)
-        # Copy the exe to windows space
-        shutil.copy(origin_path, bridge_path)
+    # If it's not there or out of date, copy it
+    exe_hash = _file_hash(origin_path)
+    installed = os.path.isfile(bridge_path) and \
+        _file_hash(bridge_path) == exe_hash
+    if not installed:
+        try:
+            # Copy the exe to windows space
+            shutil.copy(origin_path, bridge_path)
+            installed = True
+        except (OSError, IOError):
+            # Windows won't replace an exe that's running, use it as is
+            if not os.path.isfile(bridge_path):
+                raise
+
+    # Only cache a copy that matches, so an old one is replaced next time
+    if installed:
+        bridge_stat = os.stat(bridge_path)
+        record = dict(cache_key, bridge_path=bridge_path,
+                      bridge_size=bridge_stat.st_size,
+                      bridge_mtime=int(bridge_stat.st_mtime))
+        write_json_file(cache_path, record)
     return bridge_path
 
 ########################################
 
 
+def get_bridge_command():
+    """
+    Return the command that launches the bridge.
+
+    The environment variable WSLWINREG_BRIDGE replaces the installed
+    executable. If it's "python", wslwinreg.bridgeserver is run with this
+    interpreter, which serves the protocol from an in-memory registry and
+    works without Windows. Any other value is the pathname of a bridge
+    executable, such as a development build.
+
+    Returns:
+        tuple of the command line without -p and -c, and the working
+        directory to run it in.
+    """
+
+    bridge = os.environ.get("WSLWINREG_BRIDGE")
+    if not bridge:
+        return (get_exe_path(),), _WIN_DIR
+
+    if bridge.lower() == "python":
+        # Run from the directory holding the package so -m finds it
+        return (sys.executable, "-m", "wslwinreg.bridgeserver"), \
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return (bridge,), None
+
+########################################
+
+
+def get_deferred_close():
+    """
+    Return True if closing a key doesn't wait for the bridge.
+
+    Closes wait for the bridge, like winreg, unless the environment variable
+    WSLWINREG_DEFERRED_CLOSE is "1". A deferred close is sent with the next
+    command, or by flush_closes(), and errors closing the key are ignored.
+
+    Returns:
+        True if closes are deferred.
+    """
+
+    return os.environ.get("WSLWINREG_DEFERRED_CLOSE", "").lower() not in \
+        ("", "0", "false", "no", "off")
+
+########################################
+
+
+def get_pool_size():
+    """
+    Return the number of connections to open to the bridge executable.
+
+    The number is read from the environment variable WSLWINREG_CONNECTIONS
+    and defaults to 1. Values out of range are clamped.
+
+    Returns:
+        Integer from 1 to 64.
+    """
+
+    try:
+        pool_size = int(os.environ.get("WSLWINREG_CONNECTIONS", "1"))
+    except ValueError:
+        pool_size = 1
+    return max(1, min(pool_size, _MAX_CONNECTIONS))
+
+########################################
+
+
 class Commands(IntEnum):
     """
     Commands to send to the bridging executable.
@@ -364,202 +642,1832 @@ class Commands(IntEnum):
     ## Perform get_file_into()
     GET_FILE_INFO = 25
 
+    ## Perform DumpTree()
+    DUMP_TREE = 26
 
-## Patch to the executable to bridge
-_WIN_EXE = get_exe_path()
+    ## Perform EnumKeys()
+    ENUM_KEYS = 27
 
-# Prepare a socket to be waiting for the exe once it is launched
+    ## Perform EnumValues()
+    ENUM_VALUES = 28
 
-## Socket used for listening for the exe
-_LISTEN_SOCKET = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-_LISTEN_SOCKET.bind((_LOCALHOST, 0))
+    ## Perform get_file_info_all()
+    GET_FILE_INFO_ALL = 29
 
-## Semi-random port assigned to the socket by the operating system
-_LISTEN_PORT = _LISTEN_SOCKET.getsockname()[1]
 
-# Start listening
-_LISTEN_SOCKET.listen(1)
+class DumpRecords(IntEnum):
+    """
+    Record types in the reply to Commands.DUMP_TREE.
+    """
 
-try:
-    ## Popen object for the bridge executable
-    _EXEC_FP = subprocess.Popen(
-        (_WIN_EXE, "-p", str(_LISTEN_PORT)),
-        cwd=_WIN_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-        universal_newlines=True)
-except OSError:
-    raise ImportError("Windows executable {} for bridging not found.".format(
-        _WIN_EXE))
-
-# At this point, the exe had started, connect to it.
-_LISTEN_SOCKET.settimeout(10.0)
-try:
-    ## @var _CONNECTION_ADDR
-    # Connection address
+    ## No more records
+    END = 0
 
-    ## Connection socket
-    _CONNECTION_SOCKET, _CONNECTION_ADDR = _LISTEN_SOCKET.accept()
-except socket.timeout:
-    raise ImportError("Failure to connect with bridging executable")
+    ## Key path and last write time
+    KEY = 1
 
-# Set the timeout
-_CONNECTION_SOCKET.settimeout(5.0)
+    ## Value name, type and data of the most recent key
+    VALUE = 2
 
-if _CONNECTION_SOCKET.recv(_BUFFER_SIZE) != b"Bridge started 1.0":
-    raise ImportError("Windows Bridge version mismatch")
 
 ########################################
 
 
-class WindowsError(OSError):
+def _command_segments(buffer):
     """
-    This exception doesn't exist in Cygwin/MSYS, provide it.
+    Return the segments of an encoded command.
+
+    Args:
+        buffer: bytes of the command, or the list from _FrameBuilder.build().
+    Returns:
+        list of bytes-like segments.
     """
 
-    # pylint: disable=super-init-not-called
-    def __init__(self, winerror, strerror=None, filename=None):
+    if isinstance(buffer, list):
+        return buffer
+    return [buffer]
+
+########################################
+
+
+def _send_segments(connection, segments):
+    """
+    Send a list of buffers to a socket as one stream.
+
+    If the socket supports sendmsg(), the buffers are handed to the kernel
+    as is, so large payloads are never joined together.
+
+    Args:
+        connection: Socket to send to.
+        segments: list of bytes-like objects to send in order.
+    """
+
+    if PY2 or not hasattr(connection, "sendmsg"):
+        if PY2:
+            segments = [memoryview(segment).tobytes() for segment in segments]
+        connection.sendall(b"".join(segments))
+        return
+
+    views = [memoryview(segment) for segment in segments if len(segment)]
+    index = 0
+    while index < len(views):
+        sent = connection.sendmsg(
+            views[index:index + _SENDMSG_MAX_SEGMENTS])
+
+        # Skip over what was sent, and trim a partly sent segment
+        while sent:
+            size = views[index].nbytes
+            if sent < size:
+                views[index] = views[index][sent:]
+                break
+            sent -= size
+            index += 1
+
+########################################
+
+
+class _Reply(object):
+    """
+    Reply to a command sent to the bridge.
+
+    The bridge reader thread appends the frames of the reply as they arrive
+    and the thread that sent the command waits for the last one.
+    """
+
+    def __init__(self, bridge, request_id):
         """
-        Initialize a WindowsError exception
+        Initialize the _Reply class.
 
         Args:
-            winerror: The windows error code
-            strerror: The string describing the error
-            filename: Name of the file that caused this error, if applicable.
+            bridge: _Bridge the command was sent to.
+            request_id: Request ID of the command.
         """
 
-        ## Windows error code
-        self.winerror = winerror
+        ## _Bridge the command was sent to
+        self.bridge = bridge
 
-        ## Linux style error code
-        self.errno = winerror_to_errno(winerror)
+        ## Request ID of the command
+        self.request_id = request_id
 
-        ## Description string of the error
-        self.strerror = strerror
+        ## list of bytearray of the frames received so far
+        self.frames = []
 
-        ## Name of the responsible file for this error
-        self.filename = filename
+        ## Exception if the connection failed before the reply was complete
+        self.error = None
 
-    def __str__(self):
+        ## Event set once the reply is complete or failed
+        self.done = threading.Event()
+
+    def wait(self, timeout=_TIMEOUT):
         """
-        Convert the class into a string.
+        Wait for the reply to be complete.
 
+        The timeout restarts whenever a frame arrives, so long replies that
+        are streamed in many frames are not cut short. The bridge runs the
+        commands of a connection one at a time, so the timeout also doesn't
+        count while earlier commands on the connection are still running.
+
+        Args:
+            timeout: Seconds to wait for a frame.
         Returns:
-            String describing the error contained.
+            list of bytearray, the frames of the reply.
+        Exception:
+            ``socket.timeout`` if the bridge stopped responding.
         """
-        if self.filename is not None:
-            return "[Error %s] %s: %s" % (self.winerror, self.strerror,
-                                          repr(self.filename))
-        return "[Error %s] %s" % (self.winerror, self.strerror)
-
 
-# Ensure this exception is available globally.
-builtins.WindowsError = WindowsError
+        received = 0
+        queued = self.bridge.is_queued(self)
+        while not self.done.wait(timeout):
+            if not queued and len(self.frames) == received:
+                # Let the commands behind this one start their timeouts,
+                # unless the reply completed in the meantime
+                if self.bridge.abandon(self):
+                    raise socket.timeout("Timed out waiting for the bridge")
+                continue
+            received = len(self.frames)
+            queued = self.bridge.is_queued(self)
+
+        if self.error is not None:
+            raise self.error
+        return self.frames
 
 ########################################
 
 
-def handleLRESULT():
+class _FrameReader(object):
     """
-    Receive the LRESULT from the bridge.
+    Buffered reader of the reply frames from a socket.
+
+    Frame headers are unpacked in place from a reusable receive buffer that
+    is filled with recv_into(). Frame data is received straight into the
+    caller's buffer, so a large reply is only copied by the kernel.
     """
 
-    # Get the LRESULT
-    data = _CONNECTION_SOCKET.recv(4)
-    # Error code
-    return_code = struct.unpack("<I", data)[0]
-    if return_code:
+    def __init__(self, connection, size=_RECEIVE_SIZE):
+        """
+        Initialize the _FrameReader class.
 
-        # Parse out the utf-8 error string
-        error_str = recv_string()
-        # Special case, unit tests require a FileNotFoundError
-        if return_code == ERROR_FILE_NOT_FOUND:
-            raise FileNotFoundError(error_str)
+        Args:
+            connection: Socket to read from.
+            size: Size of the receive buffer.
+        """
 
-        # Throw a WindowsError exception
-        raise WindowsError(return_code, error_str)
+        ## Socket to read from
+        self.connection = connection
 
-########################################
+        ## Reusable receive buffer
+        self._buffer = bytearray(size)
 
+        ## memoryview of _buffer for recv_into() and slicing
+        self._view = memoryview(self._buffer)
 
-def create_string_buffer(temp_string, is_binary=False):
-    """
-    Convert a string into a utf-8 byte stream
+        ## Offset of the first unread byte in _buffer
+        self._start = 0
 
-    Args:
-        temp_string: String to convert
-        is_binary: True if the input in binary, not a string.
-    """
+        ## Offset past the last received byte in _buffer
+        self._end = 0
 
-    # Ensure it's a string
-    if temp_string:
-        if not is_binary:
-            temp_string = temp_string.encode("utf-8")
-    else:
-        temp_string = b""
+    def unpack(self, header):
+        """
+        Read and unpack a fixed size structure.
 
-    temp_string_length = len(temp_string)
+        Args:
+            header: struct.Struct to unpack.
+        Returns:
+            tuple of the unpacked values.
+        Exception:
+            ``socket.timeout`` if the connection was broken.
+        """
 
-    # Get the length
-    buffer = struct.pack(
-        "<I",
-        temp_string_length)
+        size = header.size
+        if self._end - self._start < size:
+            # Move the partial structure to the front and fill up the rest
+            remaining = self._end - self._start
+            self._buffer[:remaining] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = remaining
+            while self._end < size:
+                self._end += self._recv_into(self._view[self._end:])
+
+        result = header.unpack_from(self._buffer, self._start)
+        self._start += size
+        return result
+
+    def read_into(self, view):
+        """
+        Fill a buffer with the next bytes from the socket.
 
-    if not temp_string_length:
-        return buffer
+        Args:
+            view: Writable memoryview to fill completely.
+        Exception:
+            ``socket.timeout`` if the connection was broken.
+        """
+
+        length = len(view)
+
+        # Use up what is already buffered
+        position = min(length, self._end - self._start)
+        if position:
+            view[:position] = self._view[self._start:self._start + position]
+            self._start += position
+        if self._start == self._end:
+            self._start = self._end = 0
+
+        # Receive the rest without going through the buffer
+        while position < length:
+            position += self._recv_into(view[position:])
+
+    def _recv_into(self, view):
+        """
+        Receive bytes from the socket.
+
+        Args:
+            view: Writable memoryview to receive into.
+        Returns:
+            Number of bytes received.
+        Exception:
+            ``socket.timeout`` if the connection was broken.
+        """
+
+        count = self.connection.recv_into(view)
+        if not count:
+            raise socket.timeout("Connection broken")
+        return count
+
+########################################
+
+
+class _Bridge(object):
+    """
+    Connection to the bridge executable shared by all threads.
+
+    Every command is sent with a request ID and the bridge answers with
+    frames tagged with the same ID. A reader thread collects the frames and
+    hands each reply to the thread waiting for it, so any number of threads
+    can have commands in flight at once.
+    """
+
+    def __init__(self, connection):
+        """
+        Initialize the _Bridge class and start the reader thread.
+
+        Args:
+            connection: Socket connected to the bridge executable.
+        """
+
+        ## Socket connected to the bridge executable
+        self.connection = connection
+
+        ## Lock held while writing to the socket
+        self._send_lock = threading.Lock()
+
+        ## Lock protecting _pending, _next_id and _error
+        self._lock = threading.Lock()
+
+        ## OrderedDict of request IDs to the _Reply waiting for them, in
+        ## the order the commands were sent
+        self._pending = OrderedDict()
+
+        ## Next request ID to use, 0 is reserved for posted commands
+        self._next_id = 1
+
+        ## Exception that broke the connection
+        self._error = None
+
+        ## Commands posted while the socket was busy
+        self._posted = deque()
+
+        ## Thread reading the replies from the bridge
+        self._reader = threading.Thread(
+            target=self._read_replies, name="wslwinreg bridge reader")
+        self._reader.daemon = True
+        self._reader.start()
+
+    def send(self, buffers):
+        """
+        Send commands to the bridge with a single write.
+
+        Args:
+            buffers: list of encoded commands, bytes or segment lists.
+        Returns:
+            list of _Reply, one for each command.
+        Exception:
+            ``socket.timeout`` if the connection is broken.
+        """
+
+        replies = []
+        data = []
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            for buffer in buffers:
+                request_id = self._next_id
+                self._next_id = (request_id % 0xFFFFFFFF) + 1
+                reply = _Reply(self, request_id)
+                self._pending[request_id] = reply
+                replies.append(reply)
+                data.append(struct.pack("<I", request_id))
+                data.extend(_command_segments(buffer))
+
+        try:
+            self._write(data)
+        except Exception as error:
+            self._fail(error)
+            raise
+        return replies
+
+    def is_queued(self, reply):
+        """
+        Return True if a reply waits for earlier commands to finish.
+
+        Args:
+            reply: _Reply to check.
+        Returns:
+            True if an earlier command on this connection has no reply yet.
+        """
+
+        with self._lock:
+            for request_id in self._pending:
+                return request_id != reply.request_id
+        return False
+
+    def abandon(self, reply):
+        """
+        Stop waiting for a reply, the frames that still arrive are dropped.
+
+        Args:
+            reply: _Reply that timed out.
+        Returns:
+            False if the reply already completed.
+        """
+
+        with self._lock:
+            return self._pending.pop(reply.request_id, None) is reply
+
+    def post(self, buffer):
+        """
+        Queue a command that doesn't need the reply.
+
+        Posted commands, such as the CLOSE_KEY of a deferred close, are sent
+        in the same write as the next command, so they cost no round trip,
+        or by flush_posted().
+
+        Note:
+            This never touches the socket since it's called from
+            PyHKEY.__del__(), which can run on any thread. Callers that
+            aren't in a finalizer call flush_posted() once it returns True.
+
+        Args:
+            buffer: Bytes of the encoded command.
+        Returns:
+            True if _MAX_POSTED or more commands are queued.
+        """
+
+        self._posted.append(struct.pack("<I", 0) + buffer)
+        return len(self._posted) >= _MAX_POSTED
+
+    def flush_posted(self, blocking=True):
+        """
+        Send the posted commands now.
+
+        Args:
+            blocking: False to give up if another thread is writing, which
+                sends them anyway.
+        """
+
+        if threading.current_thread() is not self._reader and \
+                self._send_lock.acquire(blocking):
+            try:
+                posted = self._take_posted()
+                if posted:
+                    self.connection.sendall(posted)
+            except socket.error:
+                pass
+            finally:
+                self._send_lock.release()
+
+    def close(self):
+        """
+        Shut down the connection, commands still in flight fail.
+
+        The posted commands are sent first.
+        """
+
+        self.flush_posted()
+        self._fail(socket.timeout("Bridge connection closed"))
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def _take_posted(self):
+        """
+        Remove and return all of the posted commands.
+
+        Returns:
+            bytes of the posted commands.
+        """
+
+        posted = []
+        try:
+            while True:
+                posted.append(self._posted.popleft())
+        except IndexError:
+            pass
+        return b"".join(posted)
+
+    def _write(self, data):
+        """
+        Write commands, and any posted ones, to the socket.
+
+        Args:
+            data: list of bytes-like segments to send.
+        """
+
+        with self._send_lock:
+            _send_segments(self.connection, [self._take_posted()] + data)
+
+    def _read_replies(self):
+        """
+        Read reply frames and hand them to the waiting _Reply objects.
+
+        Runs on the reader thread until the connection is broken.
+        """
+
+        reader = _FrameReader(self.connection)
+        try:
+            while True:
+                request_id, length = reader.unpack(_FRAME_HEADER)
+                data = bytearray(length & ~_REPLY_MORE_FRAMES)
+                reader.read_into(memoryview(data))
+                more = length & _REPLY_MORE_FRAMES
+                with self._lock:
+                    if more:
+                        reply = self._pending.get(request_id)
+                    else:
+                        reply = self._pending.pop(request_id, None)
+
+                # Replies to posted commands are dropped
+                if reply is not None:
+                    reply.frames.append(data)
+                    if not more:
+                        reply.done.set()
+        except Exception as error:
+            self._fail(error)
+
+    def _fail(self, error):
+        """
+        Mark the connection as broken and fail every pending reply.
+
+        Args:
+            error: Exception to raise in the waiting threads.
+        """
+
+        with self._lock:
+            if self._error is None:
+                self._error = error
+            pending = self._pending
+            self._pending = OrderedDict()
+        for reply in pending.values():
+            reply.error = error
+            reply.done.set()
+
+########################################
+
+
+def get_transport():
+    """
+    Return the name of the transport used to talk to the bridge.
+
+    The environment variable WSLWINREG_TRANSPORT selects it. "tcp", the
+    default, connects over the loopback address. "unix" uses an AF_UNIX
+    socket, which needs WSL1 when the bridge is the Windows executable.
+    "stdio" uses the standard input and output of the bridge, which needs
+    no listening socket but only has one connection. Unknown names fall back
+    to "tcp".
+
+    Returns:
+        "tcp", "unix" or "stdio".
+    """
+
+    transport = os.environ.get("WSLWINREG_TRANSPORT", "tcp").lower()
+    if transport not in _TRANSPORTS:
+        transport = "tcp"
+    return transport
+
+########################################
+
+
+class _PipeConnection(object):
+    """
+    Socket stand in for the standard input and output of the bridge.
+
+    Only the methods that _Bridge and _start_bridges() call are provided.
+    """
+
+    def __init__(self, process):
+        """
+        Initialize the _PipeConnection class.
+
+        Args:
+            process: subprocess.Popen with binary, unbuffered pipes.
+        """
+
+        ## subprocess.Popen of the bridge
+        self.process = process
+
+        ## File descriptor of the input of the bridge
+        self._output = process.stdin.fileno()
+
+        ## File descriptor of the output of the bridge
+        self._input = process.stdout.fileno()
+
+        ## Seconds to wait for data, None to wait forever
+        self._timeout = None
+
+    def settimeout(self, timeout):
+        """
+        Set the time to wait for data to arrive.
+
+        Args:
+            timeout: Seconds to wait, None to wait forever.
+        """
+        self._timeout = timeout
+
+    def recv(self, size):
+        """
+        Receive up to size bytes.
+
+        Args:
+            size: Maximum number of bytes to receive.
+        Returns:
+            bytes received, empty at the end of the stream.
+        """
+
+        self._wait()
+        return os.read(self._input, size)
+
+    def recv_into(self, view):
+        """
+        Receive bytes into a buffer.
+
+        Args:
+            view: Writable memoryview to receive into.
+        Returns:
+            Number of bytes received, 0 at the end of the stream.
+        """
+
+        self._wait()
+        return self.process.stdout.readinto(view)
+
+    def sendall(self, data):
+        """
+        Send all of the data.
+
+        Args:
+            data: bytes-like object to send.
+        """
+
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._output, view):]
+
+    def sendmsg(self, buffers):
+        """
+        Send a list of buffers with a single call.
+
+        Args:
+            buffers: list of bytes-like objects.
+        Returns:
+            Number of bytes sent.
+        """
+        return os.writev(self._output, buffers)
+
+    def shutdown(self, how):
+        """
+        Close the input of the bridge, which ends it.
+
+        Args:
+            how: Ignored, both directions are shut down.
+        """
+
+        # pylint: disable=unused-argument
+        self.process.stdin.close()
+
+    def _wait(self):
+        """
+        Wait for data to arrive, if there is a timeout.
+
+        Exception:
+            ``socket.timeout`` if no data arrived in time.
+        """
+
+        if self._timeout is not None:
+            readable = select.select([self._input], [], [], self._timeout)[0]
+            if not readable:
+                raise socket.timeout("timed out")
+
+########################################
+
+
+def _launch(command, cwd, args, **kwargs):
+    """
+    Launch the bridge.
+
+    Args:
+        command: Command line from get_bridge_command().
+        cwd: Working directory to run it in.
+        args: tuple of the transport arguments to add.
+        kwargs: Extra arguments for subprocess.Popen.
+    Returns:
+        subprocess.Popen of the bridge.
+    Exception:
+        ``OSError`` if the bridge can't be started.
+    """
+
+    try:
+        return subprocess.Popen(command + args, cwd=cwd,
+                                stderr=subprocess.PIPE, **kwargs)
+    except OSError:
+        raise OSError(
+            "Windows executable {} for bridging not found.".format(
+                command[0]))
+
+########################################
+
+
+def _check_handshake(process, connection):
+    """
+    Check the handshake sent by the bridge on a new connection.
+
+    Args:
+        process: subprocess.Popen of the bridge, killed on failure, or None
+            if the bridge belongs to a broker.
+        connection: Socket, or _PipeConnection, to check.
+    Exception:
+        ``OSError`` if the handshake is wrong or doesn't arrive.
+    """
+
+    # Set the timeout
+    connection.settimeout(5.0)
+
+    try:
+        handshake = connection.recv(_BUFFER_SIZE)
+    except socket.timeout:
+        handshake = None
+    if handshake != _HANDSHAKE:
+        if process is not None:
+            process.kill()
+        if handshake is None:
+            raise OSError("Failure to connect with bridging executable")
+        raise OSError("Windows Bridge version mismatch")
+
+    # The reader thread waits for replies for as long as it takes
+    connection.settimeout(None)
+
+########################################
+
+
+def _accept_connections(listen_socket, command, cwd, args, pool_size):
+    """
+    Launch the bridge and accept its connections to a listening socket.
+
+    Args:
+        listen_socket: Socket that is bound, the bridge connects to it.
+        command: Command line from get_bridge_command().
+        cwd: Working directory to run it in.
+        args: tuple of the arguments that tell the bridge where to connect.
+        pool_size: Number of connections to accept.
+    Returns:
+        list of connected sockets.
+    """
+
+    # Start listening
+    listen_socket.listen(pool_size)
+
+    process = _launch(command, cwd, args + ("-c", str(pool_size)),
+                      stdout=subprocess.PIPE, universal_newlines=True)
+
+    connections = []
+
+    # At this point, the exe had started, connect to it.
+    listen_socket.settimeout(_START_TIMEOUT)
+    while len(connections) < pool_size:
+        try:
+            connection_socket, _ = listen_socket.accept()
+        except socket.timeout:
+            process.kill()
+            raise OSError("Failure to connect with bridging executable")
+        _check_handshake(process, connection_socket)
+        connections.append(connection_socket)
+    return connections
+
+########################################
+
+
+def _start_tcp(command, cwd, pool_size):
+    """
+    Start the bridge with connections over the loopback address.
+
+    Args:
+        command: Command line from get_bridge_command().
+        cwd: Working directory to run it in.
+        pool_size: Number of connections to open.
+    Returns:
+        list of connected sockets.
+    """
+
+    # Prepare a socket to be waiting for the exe once it is launched
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listen_socket.bind((_LOCALHOST, 0))
+
+        # Semi-random port assigned to the socket by the operating system
+        listen_port = listen_socket.getsockname()[1]
+        return _accept_connections(listen_socket, command, cwd,
+                                   ("-p", str(listen_port)), pool_size)
+    finally:
+        listen_socket.close()
+
+########################################
+
+
+def _start_unix(command, cwd, pool_size):
+    """
+    Start the bridge with connections over an AF_UNIX socket.
+
+    The Windows executable needs the socket on a drive that Windows can
+    see, so it's created next to the executable, and named with a Windows
+    pathname on its command line.
+
+    Args:
+        command: Command line from get_bridge_command().
+        cwd: Working directory to run it in.
+        pool_size: Number of connections to open.
+    Returns:
+        list of connected sockets.
+    """
+
+    is_python = command[0] == sys.executable
+    if is_python:
+        directory = tempfile.mkdtemp(prefix="wslwinreg-")
+    else:
+        directory = os.path.dirname(os.path.abspath(command[0]))
+    path_name = os.path.join(directory, "bridge-%d.sock" % os.getpid())
+
+    listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if os.path.exists(path_name):
+            os.remove(path_name)
+        listen_socket.bind(path_name)
+        return _accept_connections(
+            listen_socket, command, cwd,
+            ("-u", path_name if is_python else
+             convert_to_windows_path(path_name)), pool_size)
+    finally:
+        listen_socket.close()
+
+        # Once connected, the socket file isn't needed
+        try:
+            os.remove(path_name)
+            if is_python:
+                os.rmdir(directory)
+        except OSError:
+            pass
+
+########################################
+
+
+def _start_stdio(command, cwd, pool_size):
+    """
+    Start the bridge with a connection over its standard input and output.
+
+    Args:
+        command: Command line from get_bridge_command().
+        cwd: Working directory to run it in.
+        pool_size: Ignored, there is only one connection.
+    Returns:
+        list of the _PipeConnection.
+    """
+
+    # pylint: disable=unused-argument
+    process = _launch(command, cwd, ("-s",), stdin=subprocess.PIPE,
+                      stdout=subprocess.PIPE, bufsize=0)
+    connection = _PipeConnection(process)
+    _check_handshake(process, connection)
+    return [connection]
+
+########################################
+
+
+## Functions to start the bridge, by the names from get_transport()
+_TRANSPORTS = {
+    "tcp": _start_tcp,
+    "unix": _start_unix,
+    "stdio": _start_stdio
+}
+
+########################################
+
+
+def get_broker_path():
+    """
+    Return the pathname of the socket of the bridge broker.
+
+    The broker is per user and per bridge, so it's in the cache folder
+    with a name made from the bridge selected with WSLWINREG_BRIDGE, the
+    protocol version and the location of this package.
+
+    Returns:
+        Pathname of the AF_UNIX socket.
+    """
+
+    key = repr((os.environ.get("WSLWINREG_BRIDGE", ""), _EXESUFFIX,
+                _HANDSHAKE, os.path.abspath(__file__)))
+    return os.path.join(
+        get_cache_dir(),
+        "broker-" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:12] +
+        ".sock")
+
+########################################
+
+
+def _broker_enabled():
+    """
+    Return True if WSLWINREG_BROKER asks for the bridge broker.
+
+    Returns:
+        True if the broker is to be used.
+    """
+
+    return os.environ.get("WSLWINREG_BROKER", "").lower() not in \
+        ("", "0", "false", "no", "off")
+
+########################################
+
+
+def _connect_broker(path_name):
+    """
+    Connect to the bridge broker.
+
+    Args:
+        path_name: Pathname of the broker socket.
+    Returns:
+        Connected socket, or None if no broker is listening.
+    """
+
+    # pylint: disable=no-member
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path_name)
+    except socket.error:
+        connection.close()
+        return None
+    return connection
+
+########################################
+
+
+def _launch_broker():
+    """
+    Start the bridge broker in the background.
+
+    The broker is a new session, so it outlives this process.
+    """
+
+    kwargs = {}
+    if PY2:
+        kwargs["preexec_fn"] = os.setsid
+    else:
+        kwargs["start_new_session"] = True
+
+    with open(os.devnull, "r+b") as devnull:
+        subprocess.Popen(
+            (sys.executable, "-m", "wslwinreg.broker"),
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True,
+            **kwargs)
+
+########################################
+
+
+def _attach_broker(pool_size):
+    """
+    Get connections to the bridge owned by the broker.
+
+    The broker is started if it's not running. The connections come
+    straight from the bridge, which the broker asks to connect to a port
+    opened here, so commands don't pass through the broker. The socket to
+    the broker stays open until exit, so the broker knows the bridge is
+    still in use.
+
+    Args:
+        pool_size: Number of connections to open.
+    Returns:
+        list of connected sockets.
+    Exception:
+        ``OSError`` if the broker can't be reached or fails.
+    """
+
+    # pylint: disable=global-statement
+    global _LIVE_KEYS
+
+    path_name = get_broker_path()
+    broker = _connect_broker(path_name)
+    if broker is None:
+        _launch_broker()
+        deadline = time.time() + _START_TIMEOUT
+        while broker is None:
+            if time.time() > deadline:
+                raise OSError("Failure to start the bridge broker")
+            time.sleep(_BROKER_POLL)
+            broker = _connect_broker(path_name)
+
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        broker.settimeout(_CONNECT_TIMEOUT)
+        listen_socket.bind((_LOCALHOST, 0))
+        listen_socket.listen(pool_size)
+        listen_socket.settimeout(_START_TIMEOUT)
+        port = listen_socket.getsockname()[1]
+
+        connections = []
+        while len(connections) < pool_size:
+            # Ask the broker to have the bridge connect to the port
+            broker.sendall(struct.pack("<I", port))
+            reply = b""
+            while len(reply) < 4:
+                data = broker.recv(4 - len(reply))
+                if not data:
+                    raise OSError("Bridge broker closed the connection")
+                reply += data
+            return_code = struct.unpack("<I", reply)[0]
+            if return_code:
+                raise WindowsError(return_code, "Bridge broker failed")
+
+            try:
+                connection_socket, _ = listen_socket.accept()
+            except socket.timeout:
+                raise OSError("Failure to connect with bridging executable")
+            _check_handshake(None, connection_socket)
+            connections.append(connection_socket)
+    except BaseException:
+        broker.close()
+        raise
+    finally:
+        listen_socket.close()
+
+    # Stay attached, closing the socket tells the broker this process is
+    # done with the bridge
+    broker.settimeout(None)
+    _BROKER_CONNECTIONS.append(broker)
+    atexit.register(broker.close)
+
+    # The bridge outlives this process, so close the handles left open
+    _LIVE_KEYS = weakref.WeakSet()
+    return connections
+
+########################################
+
+
+def _track_key(key):
+    """
+    Record a new key to be closed at exit when sharing a broker's bridge.
+
+    Args:
+        key: PyHKEY returned by the bridge.
+    Returns:
+        key.
+    """
+
+    live_keys = _LIVE_KEYS
+    if live_keys is not None:
+        live_keys.add(key)
+    return key
+
+########################################
+
+
+def _close_live_keys():
+    """
+    Close the keys still open, before the connections are closed at exit.
+    """
+
+    for key in list(_LIVE_KEYS or ()):
+        hkey = key.Detach()
+        if hkey and key._owned:
+            # Ignore errors.
+            try:
+                _bridge().post(struct.pack(
+                    "<BQ", Commands.CLOSE_KEY.value, hkey))
+            except BaseException:
+                pass
+
+########################################
+
+
+## weakref.WeakSet of the open keys if the bridge belongs to a broker
+_LIVE_KEYS = None
+
+## list of sockets to the broker, kept open while its bridge is in use
+_BROKER_CONNECTIONS = []
+
+########################################
+
+
+def _start_bridges():
+    """
+    Launch the bridge executable and connect to it.
+
+    The executable connects back once per connection of the pool, using the
+    transport from get_transport(), and sends the handshake on each one.
+    If WSLWINREG_BROKER is set, the connections come from the executable
+    owned by the bridge broker instead, and only fall back to launching one
+    if the broker fails.
+
+    Returns:
+        list of _Bridge connections to the executable.
+    Exception:
+        ``OSError`` if the executable can't be started or doesn't connect.
+    """
+
+    # Number of connections to the bridge, each one is served by its own
+    # thread in the executable. Set with WSLWINREG_CONNECTIONS.
+    pool_size = get_pool_size()
+
+    connections = None
+    if _broker_enabled():
+        try:
+            connections = _attach_broker(pool_size)
+        except OSError:
+            # Fall back to a bridge of our own
+            connections = None
+
+    if connections is None:
+        command, cwd = get_bridge_command()
+        connections = _TRANSPORTS[get_transport()](command, cwd, pool_size)
+
+    bridges = []
+    for connection in connections:
+        bridges.append(_Bridge(connection))
+        atexit.register(bridges[-1].close)
+
+    # Registered last so it runs before the connections are closed
+    if _LIVE_KEYS is not None:
+        atexit.register(_close_live_keys)
+    return bridges
+
+########################################
+
+
+## list of _Bridge connections to the executable, None until first use
+_BRIDGES = None
+
+## Exception raised if the executable failed to start
+_BRIDGES_ERROR = None
+
+## Lock so only one thread launches the executable
+_BRIDGES_LOCK = threading.Lock()
+
+## Per thread record of the assigned connection
+_POOL_STATE = threading.local()
+
+## Counter to assign connections to threads round robin
+_POOL_COUNTER = itertools.count()
+
+########################################
+
+
+def _bridge():
+    """
+    Return the connection to the bridge used by this thread.
+
+    The bridge executable is launched on the first call from any thread,
+    so importing the package doesn't pay for starting it. Each thread is
+    assigned a connection on its first call, round robin, so threads run
+    their commands in parallel in the executable. All connections are
+    served by the same process, so handles opened with one connection can
+    be used with any of them.
+
+    Returns:
+        _Bridge for this thread.
+    Exception:
+        ``OSError`` if the executable can't be started.
+    """
+
+    # pylint: disable=global-statement
+    global _BRIDGES, _BRIDGES_ERROR
+
+    try:
+        return _POOL_STATE.bridge
+    except AttributeError:
+        pass
+
+    bridges = _BRIDGES
+    if bridges is None:
+        with _BRIDGES_LOCK:
+            if _BRIDGES is None:
+                # Don't wait for the timeouts again if it already failed
+                if _BRIDGES_ERROR is not None:
+                    raise _BRIDGES_ERROR
+                try:
+                    _BRIDGES = _start_bridges()
+                except OSError as error:
+                    _BRIDGES_ERROR = error
+                    raise
+            bridges = _BRIDGES
+
+    bridge = bridges[next(_POOL_COUNTER) % len(bridges)]
+    _POOL_STATE.bridge = bridge
+    return bridge
+
+########################################
+
+
+class WindowsError(OSError):
+    """
+    This exception doesn't exist in Cygwin/MSYS, provide it.
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, winerror, strerror=None, filename=None):
+        """
+        Initialize a WindowsError exception
+
+        Args:
+            winerror: The windows error code
+            strerror: The string describing the error
+            filename: Name of the file that caused this error, if applicable.
+        """
+
+        ## Windows error code
+        self.winerror = winerror
+
+        ## Linux style error code
+        self.errno = winerror_to_errno(winerror)
+
+        ## Description string of the error
+        self.strerror = strerror
+
+        ## Name of the responsible file for this error
+        self.filename = filename
+
+    def __str__(self):
+        """
+        Convert the class into a string.
+
+        Returns:
+            String describing the error contained.
+        """
+        if self.filename is not None:
+            return "[Error %s] %s: %s" % (self.winerror, self.strerror,
+                                          repr(self.filename))
+        return "[Error %s] %s" % (self.winerror, self.strerror)
+
+
+# Ensure this exception is available globally.
+builtins.WindowsError = WindowsError
+
+########################################
+
+
+def handleLRESULT():
+    """
+    Receive the LRESULT from the bridge.
+    """
+
+    # Get the LRESULT
+    data = recv_exact(4)
+    # Error code
+    return_code = struct.unpack("<I", data)[0]
+    if return_code:
+
+        # Parse out the utf-8 error string
+        error_str = recv_string()
+        # Special case, unit tests require a FileNotFoundError
+        if return_code == ERROR_FILE_NOT_FOUND:
+            raise FileNotFoundError(error_str)
+
+        # Throw a WindowsError exception
+        raise WindowsError(return_code, error_str)
+
+########################################
+
+
+def create_string_buffer(temp_string, is_binary=False):
+    """
+    Convert a string into a utf-8 byte stream
+
+    Args:
+        temp_string: String to convert
+        is_binary: True if the input in binary, not a string.
+    """
+
+    # Ensure it's a string
+    if temp_string:
+        if not is_binary:
+            temp_string = temp_string.encode("utf-8")
+    else:
+        temp_string = b""
+
+    temp_string_length = len(temp_string)
+
+    # Get the length
+    buffer = struct.pack(
+        "<I",
+        temp_string_length)
+
+    if not temp_string_length:
+        return buffer
+
+    # Append the string to the buffer and send the length and string
+    return buffer + temp_string
+
+########################################
+
+
+class _FrameBuilder(object):
+    """
+    Builder of an encoded command.
+
+    Opcodes, handles and length prefixes are packed in place into a
+    preallocated buffer. Large payloads are kept as separate segments, so
+    they are passed to sendmsg() without ever being copied.
+    """
+
+    def __init__(self, fmt, *values):
+        """
+        Initialize the _FrameBuilder class.
+
+        Args:
+            fmt: struct format of the opcode and the fixed arguments.
+            values: Values to pack with fmt.
+        """
+
+        ## list of finished segments
+        self.segments = []
+
+        ## Buffer the small fields are packed into
+        self._buffer = bytearray(_BUILDER_SIZE)
+
+        ## Offset of the first byte of _buffer not yet in segments
+        self._start = 0
+
+        ## Offset past the last packed byte in _buffer
+        self._offset = 0
+
+        self.pack(fmt, *values)
+
+    def pack(self, fmt, *values):
+        """
+        Pack fixed size values.
+
+        Args:
+            fmt: struct format of the values.
+            values: Values to pack.
+        Returns:
+            self, for chaining.
+        """
+
+        size = struct.calcsize(fmt)
+        self._reserve(size)
+        struct.pack_into(fmt, self._buffer, self._offset, *values)
+        self._offset += size
+        return self
+
+    def string(self, temp_string, is_binary=False):
+        """
+        Add a length prefixed string, like create_string_buffer().
+
+        Args:
+            temp_string: String to add, or a bytes-like object.
+            is_binary: True if the input in binary, not a string.
+        Returns:
+            self, for chaining.
+        """
+
+        if temp_string:
+            if not is_binary:
+                temp_string = temp_string.encode("utf-8")
+        else:
+            temp_string = b""
+
+        length = len(temp_string)
+        self.pack("<I", length)
+        if length >= _INLINE_MAX:
+            self._finish()
+            self.segments.append(temp_string)
+        elif length:
+            self._reserve(length)
+            self._buffer[self._offset:self._offset + length] = temp_string
+            self._offset += length
+        return self
+
+    def build(self):
+        """
+        Finish the command.
+
+        Returns:
+            list of bytes-like segments of the command.
+        """
+
+        self._finish()
+        return self.segments
+
+    def _reserve(self, size):
+        """
+        Make room in the buffer for more fields.
+
+        The buffer can't be resized once a segment refers to it, so a new
+        one is started when it runs out.
+
+        Args:
+            size: Number of bytes needed.
+        """
+
+        if self._offset + size > len(self._buffer):
+            self._finish()
+            self._buffer = bytearray(max(_BUILDER_SIZE, size))
+            self._start = self._offset = 0
+
+    def _finish(self):
+        """
+        Move the fields packed so far into a segment.
+        """
+
+        if self._offset > self._start:
+            self.segments.append(
+                memoryview(self._buffer)[self._start:self._offset])
+            self._start = self._offset
+
+########################################
+
+
+def recv_exact(length):
+    """
+    Receive an exact number of bytes from the reply being read.
+
+    The bytes are copied once, straight out of the reply frames, even if
+    they span several frames.
+
+    Args:
+        length: Number of bytes to receive.
+    Returns:
+        bytes of the requested length.
+    Exception:
+        ``socket.timeout`` if the reply was cut short.
+    """
+
+    frames = _REPLY_STATE.frames
+    index = _REPLY_STATE.index
+    offset = _REPLY_STATE.offset
+
+    # Fast path, the bytes are all in the current frame
+    if index < len(frames) and offset + length <= len(frames[index]):
+        _REPLY_STATE.offset = offset + length
+        return frames[index][offset:offset + length].tobytes()
+
+    pieces = []
+    while length:
+        if index >= len(frames):
+            raise socket.timeout("Connection broken")
+        frame = frames[index]
+        chunk = min(length, len(frame) - offset)
+        pieces.append(frame[offset:offset + chunk])
+        length -= chunk
+        offset += chunk
+        if offset == len(frame):
+            index += 1
+            offset = 0
+    _REPLY_STATE.index = index
+    _REPLY_STATE.offset = offset
+
+    # Python 2 can't join memoryviews
+    if PY2:
+        pieces = [piece.tobytes() for piece in pieces]
+    return b"".join(pieces)
+
+########################################
+
+
+def recv_string(convert_to_string=True):
+    """
+    Recieve a string from the socket
+
+    Returns:
+        UTF-8 string.
+    """
+
+    # Get the result string length
+    data = recv_exact(4)
+    new_string_length = struct.unpack("<I", data)[0]
+
+    # Get the result string
+    if new_string_length:
+        data = recv_exact(new_string_length)
+    else:
+        data = b""
+
+    if convert_to_string:
+        data = data.decode("utf-8")
+    return data
+
+########################################
+
+
+def _read_result():
+    """
+    Read a reply that only contains the LRESULT.
+    """
+    handleLRESULT()
+
+########################################
+
+
+def _read_unused_hkey():
+    """
+    Read a reply that contains an unused QWORD and the LRESULT.
+
+    LOAD_KEY and SAVE_KEY send a QWORD before the LRESULT, like the
+    commands that open a key.
+    """
+    recv_exact(8)
+    handleLRESULT()
+
+########################################
+
+
+def _read_hkey():
+    """
+    Read a reply that contains a QWORD HKEY and the LRESULT.
+
+    Returns:
+        PyHKEY of the new key.
+    """
+    data = recv_exact(8)
+    handleLRESULT()
+    return _track_key(PyHKEY(struct.unpack("<Q", data)[0]))
+
+########################################
+
+
+def _read_string():
+    """
+    Read a reply that contains a UTF-8 string and the LRESULT.
+
+    Returns:
+        The string.
+    """
+    new_string = recv_string()
+    handleLRESULT()
+    return new_string
+
+########################################
+
+
+def _read_typed_data():
+    """
+    Read a reply that contains raw data, a DWORD type and the LRESULT.
+
+    Returns:
+        tuple of the converted data and the registry type.
+    """
+    new_data = recv_string(convert_to_string=False)
+    data = recv_exact(4)
+    handleLRESULT()
+    typ = struct.unpack("<I", data)[0]
+    return (from_registry_bytes(new_data, len(new_data), typ), typ)
+
+########################################
+
+
+def _read_enum_value():
+    """
+    Read a reply from ENUM_VALUE.
+
+    Returns:
+        tuple of the value name, the converted data and the registry type.
+    """
+    new_string = recv_string()
+    value, typ = _read_typed_data()
+    return (new_string, value, typ)
+
+########################################
+
+
+def _decode(data, reader):
+    """
+    Call a reply reader with recv_exact() reading from a reply.
+
+    Args:
+        data: list of the frames of the reply, or bytes of the entire reply.
+        reader: Function that reads the reply and returns the result.
+    Returns:
+        Value returned by reader.
+    """
+
+    if not isinstance(data, list):
+        data = [data]
+    previous = (getattr(_REPLY_STATE, "frames", None),
+                getattr(_REPLY_STATE, "index", 0),
+                getattr(_REPLY_STATE, "offset", 0))
+    _REPLY_STATE.frames = [memoryview(frame) for frame in data]
+    _REPLY_STATE.index = 0
+    _REPLY_STATE.offset = 0
+    try:
+        return reader()
+    finally:
+        (_REPLY_STATE.frames, _REPLY_STATE.index,
+         _REPLY_STATE.offset) = previous
+
+########################################
+
+
+def _submit(buffer, reader, timeout=_TIMEOUT):
+    """
+    Send a command to the bridge and read the reply.
+
+    If a Batch is being filled on this thread, the command is queued instead
+    and a RegistryFuture is returned.
+
+    Args:
+        buffer: Encoded command, bytes or a list of segments.
+        reader: Function that reads the reply and returns the result.
+        timeout: Seconds to wait for the reply.
+    Returns:
+        Value returned by reader, or a RegistryFuture.
+    """
+
+    batch = getattr(_BATCH_STATE, "batch", None)
+    if batch is not None:
+        return batch.queue(buffer, reader, timeout)
+
+    return _decode(_bridge().send([buffer])[0].wait(timeout), reader)
+
+########################################
+
+
+## Per thread record of the reply being decoded
+_REPLY_STATE = threading.local()
+
+########################################
+
+
+## Per thread record of the Batch currently being filled
+_BATCH_STATE = threading.local()
+
+
+class Batch(_ImmediateBatch):
+    """
+    Queue of bridge commands sent with a single write.
+
+    Every registry function normally sends its command and waits for the
+    reply before returning, costing a full round trip to Windows per call.
+    Calls made with Batch.call() are queued instead, sent together when the
+    batch is flushed, and then all of the replies are waited for.
+
+    @code
+        with wslwinreg.batch() as b:
+            futures = [b.call(QueryValueEx, key, name) for name in names]
+        values = [future.result() for future in futures]
+    @endcode
+    """
+
+    def __init__(self, max_bytes=_BATCH_MAX_BYTES,
+                 max_commands=_BATCH_MAX_COMMANDS):
+        """
+        Initialize the Batch class.
+
+        Args:
+            max_bytes: Queued byte count that forces a write to the bridge.
+            max_commands: Queued command count that forces a write.
+        """
+
+        _ImmediateBatch.__init__(self)
+
+        ## Maximum bytes queued before the commands are sent
+        self.max_bytes = max_bytes
+
+        ## Maximum commands queued before the commands are sent
+        self.max_commands = max_commands
+
+        ## list of (buffer, reader, future) waiting to be sent
+        self._queue = []
+
+        ## Number of bytes in _queue
+        self._queue_size = 0
+
+    def call(self, func, *args, **kwargs):
+        """
+        Queue a registry function call.
+
+        Note:
+            Calls in a batch can't use the result of another call in the
+            same batch, such as a handle returned by OpenKey().
+
+        Args:
+            func: Registry function to call, such as QueryValueEx.
+            args: Arguments to pass to the function.
+            kwargs: Keyword arguments to pass to the function.
+        Returns:
+            RegistryFuture for the result of the call.
+        """
+
+        previous = getattr(_BATCH_STATE, "batch", None)
+        _BATCH_STATE.batch = self
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            result = RegistryFuture()
+            result.set_exception(error)
+        finally:
+            _BATCH_STATE.batch = previous
+
+        # Functions that don't talk to the bridge complete immediately
+        if not isinstance(result, RegistryFuture):
+            future = RegistryFuture()
+            future.set_result(result)
+            result = future
+        self.futures.append(result)
+        return result
+
+    def queue(self, buffer, reader, timeout=_TIMEOUT):
+        """
+        Add an encoded command to the queue.
+
+        Args:
+            buffer: Encoded command, bytes or a list of segments.
+            reader: Function that reads the reply and returns the result.
+            timeout: Seconds to wait for the reply.
+        Returns:
+            RegistryFuture for the result.
+        """
+
+        size = sum(len(segment) for segment in _command_segments(buffer))
+
+        # Send what's pending first if this command would overflow the limits
+        if self._queue and (
+                self._queue_size + size > self.max_bytes or
+                len(self._queue) >= self.max_commands):
+            self.flush()
+
+        future = RegistryFuture(self)
+        self._queue.append((buffer, reader, timeout, future))
+        self._queue_size += size
+        return future
+
+    def flush(self):
+        """
+        Send all queued commands and resolve their futures.
+        """
+
+        while self._queue:
+            pending = self._queue
+            self._queue = []
+            self._queue_size = 0
+
+            try:
+                replies = _bridge().send([item[0] for item in pending])
+            except Exception as error:
+                # The connection is broken, fail the rest of the batch
+                for item in pending + self._queue:
+                    item[3].set_exception(error)
+                self._queue = []
+                raise
+
+            broken = None
+            for reply, (_, reader, timeout, future) in zip(replies, pending):
+                try:
+                    future.set_result(_decode(reply.wait(timeout), reader))
+                except (WindowsError, FileNotFoundError) as error:
+                    future.set_exception(error)
+                except Exception as error:
+                    # The connection is broken, but every reply is separate
+                    future.set_exception(error)
+                    if broken is None:
+                        broken = error
+
+            if broken is not None:
+                for item in self._queue:
+                    item[3].set_exception(broken)
+                self._queue = []
+                raise broken
+
+########################################
+
+
+class _Capture(object):
+    """
+    Stand in for a Batch that records a command instead of sending it.
+    """
+
+    def __init__(self):
+        """
+        Initialize the _Capture class.
+        """
+
+        ## tuple of (buffer, reader, timeout) of the command, or None
+        self.command = None
+
+    def queue(self, buffer, reader, timeout=_TIMEOUT):
+        """
+        Record an encoded command.
+
+        Args:
+            buffer: Encoded command, bytes or a list of segments.
+            reader: Function that reads the reply and returns the result.
+            timeout: Seconds to wait for the reply.
+        Returns:
+            None, the command is not sent.
+        """
 
-    # Append the string to the buffer and send the length and string
-    return buffer + temp_string
+        self.command = (buffer, reader, timeout)
 
 ########################################
 
 
-def recv_string(convert_to_string=True):
+def _encode_call(func, *args, **kwargs):
     """
-    Recieve a string from the socket
+    Encode a registry function call without sending it.
+
+    Used by wslwinreg.aio to send the commands of the registry functions
+    in this module over its own connection.
 
+    Args:
+        func: Registry function to call, such as QueryValueEx.
+        args: Arguments to pass to the function.
+        kwargs: Keyword arguments to pass to the function.
     Returns:
-        UTF-8 string.
+        tuple of (buffer, reader, timeout) and the result of the function.
+        The command is None if the function didn't need the bridge.
     """
 
-    # Get the result string length
-    data = _CONNECTION_SOCKET.recv(4)
-    new_string_length = struct.unpack("<I", data)[0]
+    capture = _Capture()
+    previous = getattr(_BATCH_STATE, "batch", None)
+    _BATCH_STATE.batch = capture
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        _BATCH_STATE.batch = previous
+    return capture.command, result
 
-    # Get the result string
-    if new_string_length:
+########################################
 
-        # Create the result buffer
-        data = bytearray()
-        # All data received?
-        while len(data) < new_string_length:
-            # Get a chunk
-            packet = _CONNECTION_SOCKET.recv(new_string_length - len(data))
-            if not packet:
-                raise socket.timeout("Connection broken")
-            data.extend(packet)
-            del packet
-        data = bytes(data)
-    else:
-        data = b""
 
-    if convert_to_string:
-        data = data.decode("utf-8")
-    return data
+def _open_connection(port):
+    """
+    Ask the bridge executable to open another connection.
+
+    The executable connects to the port on the loopback address and
+    serves the new connection with its own thread.
+
+    Args:
+        port: Port number on the loopback address that is listening.
+    Exception:
+        ``WindowsError`` if the connection couldn't be made.
+    """
+
+    buffer = struct.pack("<BI", Commands.CONNECT.value, port)
+    return _submit(buffer, _read_result)
 
 ########################################
 
 
-def _RegCloseKey(hkey):
+def _RegCloseKey(hkey, wait=True):
     """
     Low level function to call RegCloseKey
+
+    Args:
+        hkey: Integer handle to close.
+        wait: False to queue the close instead of waiting for it, unless a
+            Batch is being filled on this thread.
     """
 
     # Send the command and a QWORD of the pointer
     buffer = struct.pack(
         "<BQ", Commands.CLOSE_KEY.value,
         hkey)
-    _CONNECTION_SOCKET.sendall(buffer)
+    if not wait and getattr(_BATCH_STATE, "batch", None) is None:
+        bridge = _bridge()
+        if bridge.post(buffer):
+            # Don't let the queue grow without bound between commands
+            bridge.flush_posted(False)
+        return None
+    return _submit(buffer, _read_result)
 
-    handleLRESULT()
+########################################
+
+
+def flush_closes():
+    """
+    Send the deferred closes of every connection to the bridge now.
+
+    Closes are otherwise sent with the next command on the same
+    connection.
+    """
+
+    for bridge in _BRIDGES or ():
+        bridge.flush_posted()
 
 ########################################
 
@@ -596,13 +2504,14 @@ class PyHKEY(object):
     and also disconnect the Windows handle from the handle object.
     """
 
-    def __init__(self, hkey, null_ok=False):
+    def __init__(self, hkey, null_ok=False, owned=True):
         """
         Initialize the PyHKEY class.
 
         Args:
             hkey: Integer value representing the pointer to the HKEY
             null_ok: True if None is acceptable.
+            owned: False if the caller keeps ownership of the handle.
         """
         if not isinstance(hkey, (int, long)):
             if not null_ok or not isinstance(hkey, type(None)):
@@ -611,27 +2520,47 @@ class PyHKEY(object):
         ## Integer that represents the HANDLE pointer
         self.hkey = hkey
 
+        ## False if the caller owns the handle and it's not closed when this
+        # object is garbage collected
+        self._owned = owned
+
     def __del__(self):
         """
         Called when this object is garbage collected.
+
+        Note:
+            The handle is closed without waiting for the reply since this
+            can be called from any thread.
         """
-        if self.hkey:
+        if self.hkey and self._owned:
             # Ignore errors.
             try:
-                self.Close()
+                _bridge().post(struct.pack(
+                    "<BQ", Commands.CLOSE_KEY.value, self.hkey))
             except BaseException:
                 pass
 
-    def Close(self):
+    def Close(self, wait=None):
         """
         Closes the underlying Windows handle.
 
         Note:
-            If the handle is already closed, no error is raised.
+            If the handle is already closed, no error is raised. If wait is
+            False, or get_deferred_close() is True, the close is sent with
+            the next command and errors are ignored.
+
+        Args:
+            wait: False to send the close with the next command instead of
+                waiting for it, None for the default from
+                get_deferred_close().
         """
+        if wait is None:
+            wait = not get_deferred_close()
+        result = None
         if self.hkey:
-            _RegCloseKey(self.hkey)
+            result = _RegCloseKey(self.hkey, wait)
         self.hkey = 0
+        return result
 
     def Detach(self):
         """
@@ -737,9 +2666,10 @@ class PyHKEY(object):
         if isinstance(hkey, PyHKEY):
             return hkey
 
-        # Is it a valid integer?
+        # Is it a valid integer? The caller keeps ownership of the handle,
+        # so it's not closed when the wrapper is garbage collected.
         if isinstance(hkey, (int, long)):
-            return PyHKEY(hkey)
+            return PyHKEY(hkey, owned=False)
 
         # None, if None is allowed.
         if null_ok and isinstance(hkey, type(None)):
@@ -763,10 +2693,11 @@ def CloseKey(hkey):
 
     Note:
         If hkey is not closed using this method (or via hkey.Close()),
-        it is closed when the hkey object is destroyed by Python.
+        it is closed when the hkey object is destroyed by Python. The close
+        waits for the bridge unless get_deferred_close() is True.
 
     """
-    PyHKEY.make(hkey).Close()
+    return PyHKEY.make(hkey).Close()
 
 ########################################
 
@@ -794,16 +2725,24 @@ def ConnectRegistry(computer_name, key):
         Commands.CONNECT_REGISTRY.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(computer_name))
-
     # This function CAN take a while, so allow it to take the time
-    _CONNECTION_SOCKET.settimeout(20.0)
-    data = _CONNECTION_SOCKET.recv(8)
+    return _submit(buffer + create_string_buffer(computer_name),
+                   _read_connect_registry, _CONNECT_TIMEOUT)
+
+########################################
+
+
+def _read_connect_registry():
+    """
+    Read the reply from CONNECT_REGISTRY.
 
-    # Restore the proper timeout
-    _CONNECTION_SOCKET.settimeout(3.0)
+    Returns:
+        PyHKEY of the connected registry.
+    """
+
+    data = recv_exact(8)
     handleLRESULT()
-    return PyHKEY.make(struct.unpack("<Q", data)[0])
+    return _track_key(PyHKEY(struct.unpack("<Q", data)[0]))
 
 ########################################
 
@@ -833,11 +2772,7 @@ def CreateKey(key, sub_key):
         Commands.CREATE_KEY.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(sub_key))
-
-    data = _CONNECTION_SOCKET.recv(8)
-    handleLRESULT()
-    return PyHKEY.make(struct.unpack("<Q", data)[0])
+    return _submit(buffer + create_string_buffer(sub_key), _read_hkey)
 
 ########################################
 
@@ -871,11 +2806,7 @@ def CreateKeyEx(key, sub_key, reserved=0, access=KEY_WRITE):
         Commands.CREATE_KEY_EX.value,
         PyHKEY.make(key).hkey, reserved, access)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(sub_key))
-
-    data = _CONNECTION_SOCKET.recv(8)
-    handleLRESULT()
-    return PyHKEY.make(struct.unpack("<Q", data)[0])
+    return _submit(buffer + create_string_buffer(sub_key), _read_hkey)
 
 ########################################
 
@@ -895,8 +2826,7 @@ def DeleteKey(key, sub_key):
         Commands.DELETE_KEY.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(sub_key))
-    handleLRESULT()
+    return _submit(buffer + create_string_buffer(sub_key), _read_result)
 
 ########################################
 
@@ -935,8 +2865,7 @@ def DeleteKeyEx(key, sub_key, access=KEY_WOW64_64KEY, reserved=0):
         Commands.DELETE_KEY_EX.value,
         PyHKEY.make(key).hkey, reserved, access)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(sub_key))
-    handleLRESULT()
+    return _submit(buffer + create_string_buffer(sub_key), _read_result)
 
 ########################################
 
@@ -960,8 +2889,7 @@ def DeleteValue(key, value):
         Commands.DELETE_VALUE.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(value))
-    handleLRESULT()
+    return _submit(buffer + create_string_buffer(value), _read_result)
 
 ########################################
 
@@ -988,12 +2916,78 @@ def EnumKey(key, index):
         Commands.ENUM_KEY.value,
         PyHKEY.make(key).hkey, index)
 
-    _CONNECTION_SOCKET.sendall(buffer)
+    return _submit(buffer, _read_string)
+
+########################################
+
+
+def EnumKeys(key, start=0, count=None, with_times=False):
+    """
+    Enumerates many subkeys of an open registry key in a single call.
+
+    Instead of calling EnumKey() once per index until an ``OSError`` is
+    raised, all of the names are returned in one reply from the bridge.
 
-    new_data = recv_string()
-    # Handle the error
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        start: Index of the first subkey to retrieve.
+        count: Maximum number of subkeys to retrieve, None for all.
+        with_times: If True, return (name, last_write_time) tuples with
+            the time as 100’s of nanoseconds since Jan 1, 1601.
+    Returns:
+        list of subkey names, or list of tuples if with_times is True.
+    Exception:
+        ``WindowsError`` or ``FileNotFileError``
+    """
+
+    if count is None:
+        count = 0xFFFFFFFF
+
+    buffer = struct.pack(
+        "<BQIII",
+        Commands.ENUM_KEYS.value,
+        PyHKEY.make(key).hkey, start, count,
+        _ENUM_KEYS_WITH_TIMES if with_times else 0)
+
+    if with_times:
+        return _submit(buffer, _read_enum_keys_with_times)
+    return _submit(buffer, _read_enum_keys)
+
+########################################
+
+
+def _read_enum_keys():
+    """
+    Read the reply from ENUM_KEYS without times.
+
+    Returns:
+        list of subkey names.
+    """
+
+    result = []
+    while recv_exact(1) != b"\x00":
+        result.append(recv_string())
+    handleLRESULT()
+    return result
+
+########################################
+
+
+def _read_enum_keys_with_times():
+    """
+    Read the reply from ENUM_KEYS with times.
+
+    Returns:
+        list of (name, last_write_time) tuples.
+    """
+
+    result = []
+    while recv_exact(1) != b"\x00":
+        name = recv_string()
+        result.append((name, struct.unpack("<Q", recv_exact(8))[0]))
     handleLRESULT()
-    return new_data
+    return result
 
 ########################################
 
@@ -1030,19 +3024,50 @@ def EnumValue(key, index):
         Commands.ENUM_VALUE.value,
         PyHKEY.make(key).hkey, index)
 
-    _CONNECTION_SOCKET.sendall(buffer)
-
     # Get the id string, data and the type
-    new_string = recv_string()
-    new_data = recv_string(convert_to_string=False)
-    data = _CONNECTION_SOCKET.recv(4)
+    return _submit(buffer, _read_enum_value)
+
+########################################
+
+
+def EnumValues(key):
+    """
+    Enumerates all of the values of an open registry key in a single call.
+
+    Instead of calling EnumValue() once per index until an ``OSError`` is
+    raised, every value is returned in one reply from the bridge.
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+    Returns:
+        list of (name, data, type) tuples as returned by EnumValue()
+    Exception:
+        ``WindowsError`` or ``FileNotFileError``
+    """
+
+    buffer = struct.pack(
+        "<BQ",
+        Commands.ENUM_VALUES.value,
+        PyHKEY.make(key).hkey)
+    return _submit(buffer, _read_enum_values)
+
+########################################
+
+
+def _read_enum_values():
+    """
+    Read the reply from ENUM_VALUES.
 
-    # Handle the error
+    Returns:
+        list of (name, data, type) tuples.
+    """
+
+    result = []
+    while struct.unpack("<B", recv_exact(1))[0] == DumpRecords.VALUE:
+        result.append(_read_value_record())
     handleLRESULT()
-    typ = struct.unpack("<I", data)[0]
-    return (new_string,
-            from_registry_bytes(new_data, len(new_data), typ),
-            typ)
+    return result
 
 ########################################
 
@@ -1069,15 +3094,8 @@ def ExpandEnvironmentStrings(str):
         "<B",
         Commands.EXPAND_ENVIRONMENTSTRINGS.value)
 
-    # Append the string to the buffer
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(str))
-
-    # Get the answer
-    new_string = recv_string()
-
-    # Get the error
-    handleLRESULT()
-    return new_string
+    # Append the string to the buffer and get the answer
+    return _submit(buffer + create_string_buffer(str), _read_string)
 
 ########################################
 
@@ -1109,9 +3127,7 @@ def FlushKey(key):
         "<BQ",
         Commands.FLUSH_KEY.value,
         PyHKEY.make(key).hkey)
-    _CONNECTION_SOCKET.sendall(buffer)
-
-    handleLRESULT()
+    return _submit(buffer, _read_result)
 
 ########################################
 
@@ -1152,11 +3168,10 @@ def LoadKey(key, sub_key, file_name):
         Commands.LOAD_KEY.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(
+    return _submit(
         buffer +
         create_string_buffer(sub_key) +
-        create_string_buffer(file_name))
-    handleLRESULT()
+        create_string_buffer(file_name), _read_unused_hkey)
 
 ########################################
 
@@ -1190,11 +3205,7 @@ def OpenKey(key, sub_key, reserved=0, access=KEY_READ):
         reserved,
         access)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(sub_key))
-
-    data = _CONNECTION_SOCKET.recv(8)
-    handleLRESULT()
-    return PyHKEY.make(struct.unpack("<Q", data)[0])
+    return _submit(buffer + create_string_buffer(sub_key), _read_hkey)
 
 ########################################
 
@@ -1251,9 +3262,19 @@ def QueryInfoKey(key):
         "<BQ",
         Commands.QUERY_INFO_KEY.value,
         PyHKEY.make(key).hkey)
-    _CONNECTION_SOCKET.sendall(buffer)
+    return _submit(buffer, _read_query_info_key)
+
+########################################
 
-    data = _CONNECTION_SOCKET.recv(4 + 4 + 8)
+
+def _read_query_info_key():
+    """
+    Read the reply from QUERY_INFO_KEY.
+
+    Returns:
+        A tuple of 3 items.
+    """
+    data = recv_exact(4 + 4 + 8)
     handleLRESULT()
     return struct.unpack("<IIQ", data)
 
@@ -1286,11 +3307,7 @@ def QueryValue(key, sub_key):
         Commands.QUERY_VALUE.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(sub_key))
-
-    new_data = recv_string()
-    handleLRESULT()
-    return new_data
+    return _submit(buffer + create_string_buffer(sub_key), _read_string)
 
 ########################################
 
@@ -1323,16 +3340,8 @@ def QueryValueEx(key, value_name):
         Commands.QUERY_VALUE_EX.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(value_name))
-
-    new_data = recv_string(convert_to_string=False)
-    data = _CONNECTION_SOCKET.recv(4)
-
-    # Restore the proper timeout
-    handleLRESULT()
-    typ = struct.unpack("<I", data)[0]
-    return (from_registry_bytes(new_data, len(new_data), typ),
-            typ)
+    return _submit(buffer + create_string_buffer(value_name),
+                   _read_typed_data)
 
 ########################################
 
@@ -1367,9 +3376,8 @@ def SaveKey(key, file_name):
         Commands.SAVE_KEY.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(buffer + create_string_buffer(file_name))
-
-    handleLRESULT()
+    return _submit(buffer + create_string_buffer(file_name),
+                   _read_unused_hkey)
 
 ########################################
 
@@ -1408,18 +3416,14 @@ def SetValue(key, sub_key, type, value):
     if type != REG_SZ:
         raise TypeError("Type must be wslwinreg.REG_SZ")
 
-    buffer = struct.pack(
+    builder = _FrameBuilder(
         "<BQ",
         Commands.SET_VALUE.value,
         PyHKEY.make(key).hkey)
 
-    _CONNECTION_SOCKET.sendall(
-        buffer +
-        create_string_buffer(sub_key) +
-        create_string_buffer(value))
-
     # Error code
-    handleLRESULT()
+    return _submit(
+        builder.string(sub_key).string(value).build(), _read_result)
 
 ########################################
 
@@ -1451,19 +3455,24 @@ def SetValueEx(key, value_name, reserved, type, value):
     """
 
     test_string(value_name)
-    temp_buf = to_registry_bytes(value, type)
-    buffer = struct.pack(
+
+    # Binary data is sent as is, without making a copy
+    if type not in _CONVERTED_TYPES and \
+            isinstance(value, (bytes, bytearray)):
+        temp_buf = value
+    else:
+        temp_buf = memoryview(to_registry_bytes(value, type))
+
+    builder = _FrameBuilder(
         "<BQI",
         Commands.SET_VALUE_EX.value,
         PyHKEY.make(key).hkey,
         type)
 
-    _CONNECTION_SOCKET.sendall(
-        buffer + create_string_buffer(value_name) +
-        create_string_buffer(temp_buf.raw, True))
-
     # Error code
-    handleLRESULT()
+    return _submit(
+        builder.string(value_name).string(temp_buf, True).build(),
+        _read_result)
 
 ########################################
 
@@ -1491,9 +3500,7 @@ def DisableReflectionKey(key):
         "<BQ",
         Commands.DISABLE_REFLECTION_KEY.value,
         PyHKEY.make(key).hkey)
-    _CONNECTION_SOCKET.sendall(buffer)
-
-    handleLRESULT()
+    return _submit(buffer, _read_result)
 
 ########################################
 
@@ -1516,9 +3523,7 @@ def EnableReflectionKey(key):
         "<BQ",
         Commands.ENABLE_REFLECTION_KEY.value,
         PyHKEY.make(key).hkey)
-    _CONNECTION_SOCKET.sendall(buffer)
-
-    handleLRESULT()
+    return _submit(buffer, _read_result)
 
 ########################################
 
@@ -1539,10 +3544,21 @@ def QueryReflectionKey(key):
         "<BQ",
         Commands.QUERY_REFLECTION_KEY.value,
         PyHKEY.make(key).hkey)
-    _CONNECTION_SOCKET.sendall(buffer)
+    return _submit(buffer, _read_query_reflection_key)
+
+########################################
+
+
+def _read_query_reflection_key():
+    """
+    Read the reply from QUERY_REFLECTION_KEY.
+
+    Returns:
+        ``True`` if reflection is disabled.
+    """
 
     # Get the LRESULT
-    data = _CONNECTION_SOCKET.recv(1)
+    data = recv_exact(1)
     handleLRESULT()
     # Error code
     return_code = struct.unpack("<B", data)[0]
@@ -1578,7 +3594,14 @@ def get_file_info(path_name, string_name):
     test_string(path_name)
     test_string(string_name)
 
-    # Handle import for Cygwin
+    # Read the resource directly if the file is reachable from Linux
+    linux_name = convert_from_windows_path(path_name)
+    if linux_name is not None:
+        info = read_version_info(linux_name)
+        if info is not None:
+            return info.query(string_name)
+
+    # Let Windows find the resource
     path_name = convert_to_windows_path(path_name)
 
     # Send the command and the strings
@@ -1586,10 +3609,160 @@ def get_file_info(path_name, string_name):
         "<B",
         Commands.GET_FILE_INFO.value)
 
-    _CONNECTION_SOCKET.sendall(
+    return _submit(
         buffer + create_string_buffer(path_name) +
-        create_string_buffer(string_name))
+        create_string_buffer(string_name), _read_string)
+
+########################################
+
+
+def _read_file_info_all():
+    """
+    Read the reply from GET_FILE_INFO_ALL.
+
+    Returns:
+        dict of the version information or None.
+    """
+
+    data = recv_string(convert_to_string=False)
+    handleLRESULT()
+    if not data:
+        return None
+    try:
+        return parse_version_info(data).as_dict()
+    except ValueError:
+        return None
+
+########################################
+
+
+def get_file_info_all(path_name):
+    """
+    Extract everything from a windows exe file version resource.
+
+    The resource is read once, and every string of every translation is
+    returned along with the numeric versions from VS_FIXEDFILEINFO.
+
+    Examples:
+        info = get_file_info_all("devenv.exe")
+        file_version = info["file_version"]
+
+    Args:
+        path_name: Name of the windows file.
+
+    Return:
+        None if the file has no version resource or an error, or the dict
+        described in wslwinreg.peinfo.VersionInfo.as_dict()
+    """
+
+    # Sanity check
+    test_string(path_name)
+
+    # Read the resource directly if the file is reachable from Linux
+    linux_name = convert_from_windows_path(path_name)
+    if linux_name is not None:
+        info = read_version_info(linux_name)
+        if info is not None:
+            return info.as_dict()
+
+    # Let Windows find the resource
+    path_name = convert_to_windows_path(path_name)
+
+    # Send the command and the string
+    buffer = struct.pack(
+        "<B",
+        Commands.GET_FILE_INFO_ALL.value)
+
+    return _submit(buffer + create_string_buffer(path_name),
+                   _read_file_info_all)
+
+########################################
+
+
+def DumpTree(key, sub_key=None, max_depth=None, access=KEY_READ):
+    # pylint: disable=line-too-long
+    """
+    Read an entire registry tree in a single call.
+
+    The key, every sub key and every value are walked on the Windows side and
+    sent back in one reply. Keys that can't be opened are skipped.
+
+    Each entry in the returned list is a tuple of 3 items.
+
+    <table>
+    <tr><th>Index<th>Meaning
+    <tr><td>0<td>Path of the key relative to sub_key, "" for sub_key itself.
+    <tr><td>1<td>An integer giving when the key was last modified
+        as 100’s of nanoseconds since Jan 1, 1601.
+    <tr><td>2<td>list of (name, data, type) tuples as returned by EnumValue()
+    </table>
+
+    Args:
+        key: Is an already open key, or any one of the predefined
+            HKEY_* constants.
+        sub_key: Is a string that identifies the sub_key to dump, or None.
+        max_depth: Number of levels of sub keys to descend, None for all.
+        access: Is an integer that specifies an access mask used to open
+            every key in the tree. Default is KEY_READ.
+    Returns:
+        list of tuples, parents are listed before their sub keys.
+    Exception:
+        ``WindowsError`` or ``FileNotFileError``
+    """
+
+    test_string(sub_key)
+    if max_depth is None:
+        max_depth = 0xFFFFFFFF
+
+    buffer = struct.pack(
+        "<BQII",
+        Commands.DUMP_TREE.value,
+        PyHKEY.make(key).hkey,
+        access,
+        max_depth)
+
+    return _submit(buffer + create_string_buffer(sub_key), _read_dump_tree)
+
+########################################
+
+
+def _read_dump_tree():
+    """
+    Read the reply from DUMP_TREE.
+
+    Returns:
+        list of (path, last_write_time, values) tuples.
+    """
+
+    result = []
+    values = None
+    while True:
+        record = struct.unpack("<B", recv_exact(1))[0]
+        if record == DumpRecords.KEY:
+            path = recv_string()
+            last_write_time = struct.unpack("<Q", recv_exact(8))[0]
+            values = []
+            result.append((path, last_write_time, values))
+        elif record == DumpRecords.VALUE:
+            values.append(_read_value_record())
+        else:
+            break
 
-    new_data = recv_string()
     handleLRESULT()
-    return new_data
+    return result
+
+########################################
+
+
+def _read_value_record():
+    """
+    Read the body of a DumpRecords.VALUE record.
+
+    Returns:
+        tuple of the value name, the converted data and the registry type.
+    """
+
+    name = recv_string()
+    typ = struct.unpack("<I", recv_exact(4))[0]
+    new_data = recv_string(convert_to_string=False)
+    return (name, from_registry_bytes(new_data, len(new_data), typ), typ)